@@ -2,12 +2,25 @@
 #include <Arduino.h>
 
 
+static uint8_t sequence = 0;  // Lets the receiver count lost frames
+
+
 void Serial_to_python::send_data(float acceleration, float deceleration, int32_t steering_angle, bool handbreak, char gear , char turn_signal) {
-    Serial.write(HEADER);                      // Send header byte
-    Serial.write((uint8_t*)&acceleration, 4);  // Send acceleration (4 bytes)
-    Serial.write((uint8_t*)&deceleration, 4);  // Send deceleration (4 bytes)
-    Serial.write((uint8_t*)&steering_angle, 4);                         // Send RPM (4 byte)
-    Serial.write(handbreak);
-    Serial.write(gear);
-    Serial.write(turn_signal);
-}
\ No newline at end of file
+    // Assemble the frame first so it goes out in one write
+    uint8_t frame[FRAME_SIZE];
+    frame[0] = HEADER;                         // Header byte
+    frame[1] = sequence++;                     // Sequence number (wraps at 256)
+    memcpy(frame + 2, &acceleration, 4);       // Acceleration (4 bytes)
+    memcpy(frame + 6, &deceleration, 4);       // Deceleration (4 bytes)
+    memcpy(frame + 10, &steering_angle, 4);    // Steering angle (4 bytes)
+    frame[14] = handbreak;
+    frame[15] = gear;
+    frame[16] = turn_signal;
+
+    uint8_t checksum = 0;                      // Sum of bytes 1..16, mod 256
+    for (uint8_t i = 1; i < FRAME_SIZE - 1; i++) {
+        checksum += frame[i];
+    }
+    frame[FRAME_SIZE - 1] = checksum;
+    Serial.write(frame, FRAME_SIZE);
+}
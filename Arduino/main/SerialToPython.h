@@ -4,6 +4,7 @@
 #include <Arduino.h>
 
 const uint8_t HEADER = 0xAA; // Header byte
+const uint8_t FRAME_SIZE = 18; // Header, sequence, payload (15 bytes), checksum
 
 namespace Serial_to_python{
     void send_data(float acceleration, float deceleration, int32_t steering_angle, bool handbreak, char gear , char turn_signal);
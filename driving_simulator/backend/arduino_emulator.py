@@ -0,0 +1,421 @@
+"""
+Arduino rig emulator over a pseudo-terminal.
+Opens a pty pair and streams controller frames into it, so ArduinoReader,
+AsyncSerialTransport, ArduinoHandler and software/data_acquisition.py can
+run against the printed device path without a board:
+
+    binary  frames of the current firmware (see pyserial.FrameParser)
+    csv     "acc,dec,steering,gear\\n" lines read by ArduinoHandler
+
+Inputs are a random walk over the pedal/steering ranges or a script (JSON
+lines of input values plus "hold_ms"; missing keys keep their value; the
+script loops). Faults can be injected: noise bytes between frames,
+truncated frames and stalls where the link goes silent.
+
+CLI
+---
+    python arduino_emulator.py --rate 1000
+    python arduino_emulator.py --protocol csv --rate 100 --script drive.jsonl
+    python arduino_emulator.py --noise 0.01 --truncate 0.01 --stall-every 5
+    python arduino_emulator.py --bench            # parser/transport/end-to-end
+"""
+import argparse
+import asyncio
+import fcntl
+import json
+import os
+import random
+import threading
+import time
+import tty
+from array import array
+
+from pyserial import FrameParser
+
+HDR = bytes([FrameParser.HDR])
+
+
+def encode_binary(seq, v):
+    """One firmware frame for the input values `v` (see FrameParser)."""
+    body = FrameParser.STRUCT.pack(
+        0, seq & 0xFF, v["acc"], v["dec"], int(v["steeringAngle"]),
+        int(v["handbreak"]), v["gear"].encode(), v["turnSignal"].encode(), 0)[1:-1]
+    return HDR + body + bytes([sum(body) & 0xFF])
+
+
+def encode_csv(seq, v):
+    """One line of the legacy CSV protocol (ArduinoHandler)."""
+    return f"{v['acc']:g},{v['dec']:g},{v['steeringAngle']:g},{v['gear']}\n".encode()
+
+
+ENCODERS = {"binary": encode_binary, "csv": encode_csv}
+
+IDLE = {"acc": 700.0, "dec": 400.0, "steeringAngle": 0, "handbreak": False,
+        "gear": "D", "turnSignal": "N"}  # Pedals released (raw sensor values)
+
+
+def random_inputs(seed=None, rate=1000):
+    """Endless random walk over the rig's raw input ranges."""
+    rng = random.Random(seed)
+    v = dict(IDLE)
+    scale = 100 / rate  # Same motion per second at any frame rate
+    while True:
+        v["acc"] = min(700.0, max(0.0, v["acc"] + rng.gauss(0, 40) * scale))
+        v["dec"] = min(400.0, max(0.0, v["dec"] + rng.gauss(0, 25) * scale))
+        steering = v["steeringAngle"] + rng.gauss(0, 1.5) * scale
+        v["steeringAngle"] = min(15.0, max(-15.0, steering))
+        if rng.random() < 0.002 * scale:
+            v["turnSignal"] = rng.choice("NLR")
+        yield v
+
+
+def scripted_inputs(path, rate=1000):
+    """Inputs from a JSON-lines script, each line held for its "hold_ms"."""
+    with open(path, encoding="utf-8") as f:
+        steps = [json.loads(line) for line in f if line.strip()]
+    if not steps:
+        raise ValueError(f"{path} has no input lines")
+    v = dict(IDLE)
+    while True:
+        for step in steps:
+            v.update({k: x for k, x in step.items() if k != "hold_ms"})
+            for _ in range(max(1, round(step.get("hold_ms", 0) * rate / 1000))):
+                yield v
+
+
+class Faults:
+    """Randomized link faults applied to each encoded frame."""
+
+    def __init__(self, noise=0.0, truncate=0.0, stall_every=0.0, stall_ms=0.0,
+                 seed=None):
+        """
+        Args:
+            noise (float): Probability of 1-8 junk bytes before a frame
+                (header bytes included, to exercise resync)
+            truncate (float): Probability that a frame is cut short
+            stall_every (float): Seconds between stalls (0: none)
+            stall_ms (float): Length of each stall
+        """
+        self.noise = noise
+        self.truncate = truncate
+        self.stall_every = stall_every
+        self.stall = stall_ms / 1000
+        self.rng = random.Random(seed)
+        self.injected = {"noise": 0, "truncated": 0, "stalls": 0}
+
+    def apply(self, frame):
+        rng = self.rng
+        if self.truncate and rng.random() < self.truncate:
+            frame = frame[:rng.randrange(1, len(frame))]
+            self.injected["truncated"] += 1
+        if self.noise and rng.random() < self.noise:
+            junk = bytes(rng.choice((0xAA, rng.randrange(256)))
+                         for _ in range(rng.randint(1, 8)))
+            frame = junk + frame
+            self.injected["noise"] += 1
+        return frame
+
+
+class ArduinoEmulator:
+    """Streams frames into a pty at a fixed rate from a background thread."""
+
+    def __init__(self, protocol="binary", rate=1000, inputs=None, faults=None,
+                 on_send=None):
+        """Open the pty pair; frames start flowing with start() or run().
+
+        Args:
+            protocol (str): "binary" or "csv"
+            rate (float): Frames per second
+            inputs (iterator): Input value dicts (default: random walk)
+            faults (Faults): Fault injection (default: none)
+            on_send (callable): Called with (frame index, perf_counter time)
+                for every frame written, for latency benchmarks
+        """
+        self.encode = ENCODERS[protocol]
+        self.rate = rate
+        self.inputs = inputs if inputs is not None else random_inputs(rate=rate)
+        self.faults = faults
+        self.on_send = on_send
+        self.master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        # A full pty buffer drops bytes (like a USB serial link) instead of
+        # blocking the emulator
+        flags = fcntl.fcntl(self.master, fcntl.F_GETFL)
+        fcntl.fcntl(self.master, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.path = os.ttyname(self._slave)
+        self.sent = 0            # Frames generated
+        self.overflow_bytes = 0  # Bytes the reader did not take in time
+        self.late_frames = 0     # Frames skipped because the emulator lagged
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self.run, name="arduino-emulator",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+
+    def close(self):
+        self.stop()
+        os.close(self.master)
+        os.close(self._slave)
+
+    def run(self, duration=None):
+        """Stream frames until stop() or for `duration` seconds."""
+        self._running = True
+        period = 1 / self.rate
+        start = next_t = time.perf_counter()
+        next_stall = (start + self.faults.stall_every
+                      if self.faults and self.faults.stall_every else None)
+        while self._running:
+            now = time.perf_counter()
+            if duration is not None and now - start >= duration:
+                break
+            if next_stall is not None and now >= next_stall:
+                time.sleep(self.faults.stall)
+                self.faults.injected["stalls"] += 1
+                next_t = time.perf_counter()
+                next_stall = next_t + self.faults.stall_every
+                continue
+            if now < next_t:
+                time.sleep(next_t - now)
+                continue
+            # Everything due goes out in one write; a long lag is skipped
+            due = int((now - next_t) / period) + 1
+            if due > 64:
+                self.late_frames += due - 64
+                due = 64
+                next_t = now
+            else:
+                next_t += due * period
+            chunk = []
+            for _ in range(due):
+                frame = self.encode(self.sent, next(self.inputs))
+                if self.faults is not None:
+                    frame = self.faults.apply(frame)
+                chunk.append(frame)
+                if self.on_send is not None:
+                    self.on_send(self.sent, now)
+                self.sent += 1
+            self._write(b"".join(chunk))
+
+    def _write(self, data):
+        try:
+            written = os.write(self.master, data)
+        except BlockingIOError:
+            written = 0
+        self.overflow_bytes += len(data) - written
+
+
+# -------------- benchmarks --------------
+def _percentiles(values):
+    if not values:
+        return "no samples"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000  # noqa: E731
+    return f"p50 {pick(0.5):.3f} ms, p99 {pick(0.99):.3f} ms, max {values[-1] * 1000:.3f} ms"
+
+
+def bench_parser(frames=200000, faults=None):
+    """FrameParser throughput on an in-memory stream, 4 KiB per feed()."""
+    inputs = random_inputs(0)
+    stream = b"".join((faults.apply if faults else bytes)(encode_binary(i, next(inputs)))
+                      for i in range(frames))
+    parser = FrameParser()
+    t0 = time.perf_counter()
+    for i in range(0, len(stream), 4096):
+        parser.feed(stream[i:i + 4096])
+    elapsed = time.perf_counter() - t0
+    print(f"parser: {parser.frames / elapsed:,.0f} frames/s, "
+          f"{len(stream) / elapsed / 1e6:.1f} MB/s, {parser.stats()}")
+
+
+class _IndexedInputs:
+    """Inputs whose steering value is the frame index, to match send times."""
+
+    def __init__(self):
+        self.v = dict(IDLE)
+        self.i = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.v["steeringAngle"] = self.i
+        self.i += 1
+        return self.v
+
+
+def bench_transports(rate, seconds):
+    """Frame write to delivery latency for ArduinoReader and the async transport."""
+    from pyserial import ArduinoReader
+    from input_buffer import InputBuffer
+    from serial_transport import AsyncSerialTransport
+
+    sent = array("d")
+    emu = ArduinoEmulator(rate=rate, inputs=_IndexedInputs(),
+                          on_send=lambda i, t: sent.append(t))
+
+    # Threaded reader, woken per frame
+    ard = ArduinoReader(emu.path, reset_delay=0)
+    emu.start()
+    latencies, seq, frame = [], 0, {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        seq = ard.wait_frame(seq, 0.1)
+        ard.read_into(frame)
+        now = time.perf_counter()
+        latencies.append(now - sent[frame["steeringAngle"]])
+    emu.stop()
+    ard.close()
+    print(f"ArduinoReader  @ {rate} Hz: {_percentiles(latencies)}, {ard.stats()}")
+
+    # Event-loop transport
+    emu.sent = 0
+    del sent[:]
+    emu.inputs = _IndexedInputs()
+    latencies = []
+
+    class Buffer(InputBuffer):
+        def post(self, frame):
+            latencies.append(time.perf_counter() - sent[frame["steeringAngle"]])
+            super().post(frame)
+            self.take_until(frame["t"])  # Nothing drains it here
+
+    async def run():
+        transport = AsyncSerialTransport(emu.path, Buffer())
+        transport.start(asyncio.get_running_loop())
+        emu.start()
+        await asyncio.sleep(seconds)
+        emu.stop()
+        transport.close()
+        return transport.stats()
+
+    stats = asyncio.run(run())
+    print(f"AsyncTransport @ {rate} Hz: {_percentiles(latencies)}, {stats}")
+    emu.close()
+
+
+def bench_end_to_end(rate, samples=30, port=8799):
+    """Steering change written to the pty → first state_update showing it."""
+    try:
+        import websockets
+        from main import DrivingSimulatorServer
+    except ImportError as e:
+        print(f"end-to-end: skipped ({e})")
+        return None
+
+    class Toggle:
+        """Holds a steering value; the bench flips it and notes when it went out."""
+        def __init__(self):
+            self.v = dict(IDLE)
+            self.changed_at = None
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            return self.v
+
+    inputs = Toggle()
+
+    def on_send(i, t):
+        if inputs.changed_at is None:
+            inputs.changed_at = t
+
+    emu = ArduinoEmulator(rate=rate, inputs=inputs, on_send=on_send)
+    server = DrivingSimulatorServer(use_arduino=True, arduino_port=emu.path,
+                                    port=port, metrics_port=0, watchdog_ms=0)
+    latencies = []
+
+    async def run():
+        server_task = asyncio.create_task(server.start_server())
+        await asyncio.sleep(0.3)
+        emu.start()
+        async with websockets.connect(f"ws://localhost:{port}") as ws:
+            for n in range(samples):
+                target = 5 if n % 2 == 0 else -5
+                inputs.changed_at = None
+                inputs.v = dict(inputs.v, steeringAngle=target)
+                while True:
+                    msg = json.loads(await ws.recv())
+                    if msg.get("type") != "state_update":
+                        continue
+                    if (inputs.changed_at is not None
+                            and msg["car"]["steering_angle"] == target * 3):
+                        latencies.append(time.perf_counter() - inputs.changed_at)
+                        break
+                # Random gap, so changes are not phase-locked to broadcasts
+                await asyncio.sleep(random.uniform(0.03, 0.07))
+        emu.stop()
+        server_task.cancel()
+        try:
+            await server_task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    emu.close()
+    print(f"end-to-end (input → state_update) @ {rate} Hz: {_percentiles(latencies)}")
+    return max(latencies) if latencies else None
+
+
+def main():
+    p = argparse.ArgumentParser(description="Emulate the Arduino rig over a pty")
+    p.add_argument("--protocol", choices=sorted(ENCODERS), default="binary")
+    p.add_argument("--rate", type=float, default=1000, help="Frames per second")
+    p.add_argument("--script", help="JSON-lines input script (default: random walk)")
+    p.add_argument("--seed", type=int, help="Random seed for inputs and faults")
+    p.add_argument("--duration", type=float, help="Stop after this many seconds")
+    p.add_argument("--noise", type=float, default=0.0,
+                   help="Probability of junk bytes before a frame")
+    p.add_argument("--truncate", type=float, default=0.0,
+                   help="Probability of a truncated frame")
+    p.add_argument("--stall-every", type=float, default=0.0,
+                   help="Seconds between link stalls (0: none)")
+    p.add_argument("--stall-ms", type=float, default=250.0, help="Stall length")
+    p.add_argument("--bench", action="store_true",
+                   help="Benchmark the parser, both transports and end-to-end latency")
+    p.add_argument("--max-latency-ms", type=float,
+                   help="With --bench: exit 1 if the worst end-to-end latency is higher")
+    args = p.parse_args()
+
+    faults = None
+    if args.noise or args.truncate or args.stall_every:
+        faults = Faults(args.noise, args.truncate, args.stall_every,
+                        args.stall_ms, args.seed)
+
+    if args.bench:
+        bench_parser()
+        bench_parser(faults=faults or Faults(noise=0.01, truncate=0.01, seed=0))
+        bench_transports(args.rate, 2.0)
+        worst = bench_end_to_end(args.rate)
+        if args.max_latency_ms and worst is not None and worst * 1000 > args.max_latency_ms:
+            raise SystemExit(f"end-to-end latency {worst * 1000:.1f} ms exceeds "
+                             f"{args.max_latency_ms} ms")
+        return
+
+    inputs = (scripted_inputs(args.script, args.rate) if args.script
+              else random_inputs(args.seed, args.rate))
+    emu = ArduinoEmulator(args.protocol, args.rate, inputs, faults)
+    print(f"Emulating Arduino ({args.protocol}, {args.rate:g} Hz) on {emu.path}",
+          flush=True)
+    try:
+        emu.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emu.close()
+        print(f"Sent {emu.sent} frames; {emu.overflow_bytes} bytes overflowed, "
+              f"{emu.late_frames} frames skipped"
+              + (f", faults {faults.injected}" if faults else ""))
+
+
+if __name__ == "__main__":
+    main()
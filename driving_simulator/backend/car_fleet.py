@@ -0,0 +1,186 @@
+"""
+Vectorized fleet physics for the driving simulator.
+CarFleet keeps the state of N cars in NumPy arrays (struct of arrays) and
+steps all of them in one call, with the same semantics as
+CarPhysics.update(dt). Useful for running many sessions or offline
+simulations on one core.
+
+Run `python fleet_bench.py` to check parity against CarPhysics.
+"""
+import logging
+
+import numpy as np
+
+from car_physics import CarPhysics
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Gear codes used in CarFleet.gear
+GEAR_P = 0
+GEAR_D = 1
+GEAR_R = 2
+GEAR_CODES = {"P": GEAR_P, "D": GEAR_D, "R": GEAR_R}
+GEAR_NAMES = {code: name for name, code in GEAR_CODES.items()}
+TURN_SIGNALS = ("N", "L", "R")
+
+
+class CarFleet:
+    """Struct-of-arrays physics state for `n` cars."""
+
+    def __init__(self, n):
+        """Initialize `n` parked cars with the CarPhysics defaults.
+
+        Args:
+            n (int): Number of cars
+        """
+        defaults = CarPhysics()
+        self.n = n
+
+        # Car state
+        self.x = np.zeros(n)
+        self.y = np.zeros(n)
+        self.speed = np.zeros(n)
+        self.direction = np.zeros(n)
+        self.gear = np.full(n, GEAR_P, dtype=np.int8)
+        self.turn_signal = np.full(n, defaults.turn_signal, dtype="<U1")
+
+        # Controls
+        self.acceleration_rate = np.zeros(n)
+        self.deceleration_rate = np.zeros(n)
+        self.steering_angle = np.zeros(n)
+
+        # Car properties (shared by the whole fleet)
+        self.max_speed = float(defaults.max_speed)
+        self.friction = defaults.friction
+        self.friction_reference_hz = defaults.friction_reference_hz
+        self.turning_factor = defaults.turning_factor
+        self.car_length = defaults.car_length
+        self.car_width = defaults.car_width
+
+    # ---------- controls ----------
+    def set_acceleration(self, acceleration, index=slice(None)):
+        """Set the acceleration rate of one car, a selection, or all cars."""
+        self.acceleration_rate[index] = acceleration
+
+    def set_deceleration(self, deceleration, index=slice(None)):
+        """Set the deceleration rate of one car, a selection, or all cars."""
+        self.deceleration_rate[index] = deceleration
+
+    def set_steering(self, angle, index=slice(None)):
+        """Set the steering angle, limited to -45..45 degrees."""
+        self.steering_angle[index] = np.clip(angle, -45, 45)
+
+    def set_turn_signal(self, signal, index=slice(None)):
+        """Set the turn signal ('L', 'R', 'N', or an array of them)."""
+        if not np.isin(signal, TURN_SIGNALS).all():
+            logger.warning("Invalid turn signal. Must be 'L', 'R', or 'N'.")
+            return
+        self.turn_signal[index] = signal
+
+    def set_gear(self, gear, index=slice(None)):
+        """Change gear with the same side effects as CarPhysics.set_gear.
+
+        Args:
+            gear (str or array): 'P', 'D', 'R' or an array of gear codes
+            index: Cars to change (default: all)
+        """
+        new = GEAR_CODES[gear] if isinstance(gear, str) else np.asarray(gear)
+        old = self.gear[index]
+        new = np.broadcast_to(new, np.shape(old))
+        speed = self.speed[index]
+
+        # Park stops the car, switching between D and R halves the speed
+        flip = ((old == GEAR_D) & (new == GEAR_R)) | ((old == GEAR_R) & (new == GEAR_D))
+        speed = np.where(new == GEAR_P, 0.0, speed)
+        speed = np.where(flip, speed * 0.5, speed)
+
+        self.speed[index] = speed
+        self.gear[index] = new
+
+    # ---------- physics ----------
+    def step(self, dt):
+        """Advance every car by `dt` seconds."""
+        speed = self.speed
+        acc = self.acceleration_rate
+        dec = self.deceleration_rate
+        drive = self.gear == GEAR_D
+        reverse = self.gear == GEAR_R
+        accelerating = acc > 0
+        braking = ~accelerating & (dec > 0)
+        coasting = acc == 0
+
+        # Park holds the car
+        speed = np.where(self.gear == GEAR_P, 0.0, speed)
+
+        # Drive: forward only; acceleration wins over deceleration
+        wrong_way = drive & (speed < 0)
+        drive_delta = np.where(accelerating, acc * dt,
+                               np.where(braking, -dec * dt, 0.0))
+        speed = np.where(wrong_way, 0.0,
+                         np.where(drive, speed + drive_delta, speed))
+        speed = np.where(drive & coasting & (speed > 0) & (speed < 1.0), 0.0, speed)
+
+        # Reverse: backward only, mirrored
+        wrong_way = reverse & (speed > 0)
+        reverse_delta = np.where(accelerating, -acc * dt,
+                                 np.where(braking, dec * dt, 0.0))
+        speed = np.where(wrong_way, 0.0,
+                         np.where(reverse, speed + reverse_delta, speed))
+        speed = np.where(reverse & coasting & (speed < 0) & (speed > -1.0), 0.0, speed)
+
+        # Friction (dt scaled as in CarPhysics) and speed limit
+        speed = speed * self.friction ** (dt * self.friction_reference_hz)
+        np.clip(speed, -self.max_speed, self.max_speed, out=speed)
+
+        # Steering only turns a moving car, inverted in reverse
+        turn = (self.steering_angle * self.turning_factor
+                * (np.abs(speed) / self.max_speed) * dt)
+        turn = np.where(reverse, -turn, turn)
+        moving = np.abs(speed) > 0.1
+        direction = np.where(moving,
+                             np.mod(self.direction + turn + 180, 360) - 180,
+                             self.direction)
+
+        rad = np.radians(direction)
+        self.x += np.sin(rad) * speed * dt
+        self.y -= np.cos(rad) * speed * dt
+        self.speed = speed
+        self.direction = direction
+
+    # ---------- conversion ----------
+    def load_car(self, index, car):
+        """Copy the state of a CarPhysics instance into slot `index`."""
+        self.x[index] = car.position["x"]
+        self.y[index] = car.position["y"]
+        self.speed[index] = car.speed
+        self.direction[index] = car.direction
+        self.gear[index] = GEAR_CODES.get(car.gear, GEAR_P)
+        self.turn_signal[index] = car.turn_signal
+        self.acceleration_rate[index] = car.acceleration_rate
+        self.deceleration_rate[index] = car.deceleration_rate
+        self.steering_angle[index] = car.steering_angle
+
+    def store_car(self, index, car):
+        """Copy slot `index` back into a CarPhysics instance."""
+        car.position = {"x": float(self.x[index]), "y": float(self.y[index])}
+        car.speed = float(self.speed[index])
+        car.direction = float(self.direction[index])
+        car.gear = GEAR_NAMES[int(self.gear[index])]
+        car.turn_signal = str(self.turn_signal[index])
+
+    def get_state(self, index):
+        """State of one car, in the shape of CarPhysics.get_state()."""
+        return {
+            "position": {"x": float(self.x[index]), "y": float(self.y[index])},
+            "speed": float(self.speed[index]),
+            "direction": float(self.direction[index]),
+            "gear": GEAR_NAMES[int(self.gear[index])],
+            "steering_angle": float(self.steering_angle[index]),
+            "acceleration_rate": float(self.acceleration_rate[index]),
+            "deceleration_rate": float(self.deceleration_rate[index]),
+            "car_length": self.car_length,
+            "car_width": self.car_width,
+            "turn_signal": str(self.turn_signal[index]),
+        }
+
@@ -12,7 +12,16 @@ logger = logging.getLogger(__name__)
 
 
 class CarPhysics:
-    def __init__(self):
+    def __init__(self, clock=time.time):
+        """Initialize the car.
+
+        Args:
+            clock (callable): Time source in seconds, used when update() is
+                called without a dt. Inject a simulated clock to run
+                without wall-clock pacing.
+        """
+        self.clock = clock
+
         # Car state
         self.position = {"x": 0, "y": 0}  # Position in the world
         self.speed = 0  # Current speed in pixels/second
@@ -32,8 +41,11 @@ class CarPhysics:
         # Physics properties
         # Friction coefficient (increased for smoother deceleration)
         self.friction = 0.99
+        # Update rate the friction coefficient was tuned for; friction is
+        # scaled by dt so the car behaves the same at any step rate
+        self.friction_reference_hz = 60
         self.turning_factor = 3.0  # Increased turning sensitivity for sharper turns
-        self.last_update_time = time.time()
+        self.last_update_time = clock()
 
         # Debug flag
         self.debug = True
@@ -96,13 +108,20 @@ class CarPhysics:
             if self.debug:
                 logger.debug("Handbrake engaged")
         else:
+            self.handbrake = False
             if self.debug:
                 logger.debug("Handbrake released")
 
-    def update(self):
-        """Update the car's position and state based on physics."""
-        current_time = time.time()
-        dt = current_time - self.last_update_time
+    def update(self, dt=None):
+        """Update the car's position and state based on physics.
+
+        Args:
+            dt (float): Fixed timestep in seconds. If omitted, the wall-clock
+                time since the previous update is used.
+        """
+        current_time = self.clock()
+        if dt is None:
+            dt = current_time - self.last_update_time
         self.last_update_time = current_time
 
         # Apply acceleration based on gear
@@ -147,7 +166,7 @@ class CarPhysics:
                     self.speed = 0
 
         # Apply standard friction
-        self.speed *= self.friction
+        self.speed *= self.friction ** (dt * self.friction_reference_hz)
 
         # Limit speed to max_speed
         self.speed = max(-self.max_speed, min(self.max_speed, self.speed))
@@ -0,0 +1,212 @@
+"""
+Per-client outbound channel for the driving simulator server.
+Each connected WebSocket gets its own bounded queue and writer task, so a
+slow client only ever delays itself and never the simulation tick.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from websockets.exceptions import ConnectionClosed
+
+from messages import LogSampler
+from tracing import tracer
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class ClientChannel:
+    """Bounded outbound queue plus writer task for one WebSocket client.
+
+    Two kinds of messages are handled:
+      • events (scene changes, replies) go through a FIFO queue that drops
+        the oldest entry once it is full;
+      • state frames use a single latest-state-wins slot, so a client that
+        cannot keep up just skips intermediate frames.
+
+    The writer adapts its own send interval. send() returns as soon as the
+    frame is in the transport's buffer, which only pushes back past the
+    websockets high-water mark, so after each state frame the writer checks
+    for pressure itself: a newer frame already waiting (the send spanned a
+    tick) or more than `max_buffered` bytes the kernel has not taken yet.
+    Under pressure the interval backs off; it recovers gradually while the
+    client keeps up.
+
+    The channel also carries the client's inbound rate limiter.
+    """
+
+    def __init__(self, websocket, max_queue=32, min_interval=0.0,
+                 max_interval=0.5, backoff=2.0, recovery=0.9,
+                 max_buffered=4096, on_send=None, latency=None, limiter=None):
+        """Initialize the channel.
+
+        Args:
+            websocket: The WebSocket connection to write to
+            max_queue (int): Maximum number of queued event messages
+            min_interval (float): Smallest delay between state frames (seconds)
+            max_interval (float): Largest delay between state frames (seconds)
+            backoff (float): Factor applied to the interval under pressure
+            recovery (float): Factor applied to the interval while keeping up
+            max_buffered (int): Bytes still buffered in the transport after
+                a state frame above which the interval backs off
+            on_send (callable): Called with the duration in seconds of every
+                socket send, for latency metrics
+            latency (ClientLatency): Told about every state frame sent
+            limiter (TokenBucket): Budget for messages from the client
+        """
+        self.websocket = websocket
+        self.client_id = id(websocket)
+        self.max_queue = max_queue
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.recovery = recovery
+        self.max_buffered = max_buffered
+        self.on_send = on_send
+        self.latency = latency
+        self.limiter = limiter
+        self.deferred = {}  # Type -> newest message held back by the limiter
+        self.deferred_task = None  # Task handling them once allowed
+        self.log_sampler = LogSampler()  # Hot-path logging for this client
+
+        self.interval = min_interval  # Current adaptive state-frame interval
+        self.encoding = "json"  # Negotiated state frame encoding
+        self.acked_seq = None  # Last frame acknowledged by a delta client
+        self.keyframe_seq = None  # Last keyframe sent to a delta client
+        self.session = None  # SimSession the client currently watches
+        self.closed = False
+
+        self._events = deque()
+        self._latest_state = None
+        self._latest_frame = None  # StateFrame of _latest_state
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        # Counters for diagnostics
+        self.sent = 0
+        self.dropped_events = 0
+        self.skipped_states = 0
+
+    def start(self):
+        """Start the writer task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer())
+        return self._task
+
+    async def close(self):
+        """Stop the writer task and discard pending messages."""
+        self.closed = True
+        self._wakeup.set()
+        if self.deferred_task is not None and not self.deferred_task.done():
+            self.deferred_task.cancel()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._events.clear()
+        self._latest_state = None
+        self._latest_frame = None
+
+    def send_event(self, payload):
+        """Queue an event message, dropping the oldest one if the queue is full."""
+        if self.closed:
+            return
+        if len(self._events) >= self.max_queue:
+            self._events.popleft()
+            self.dropped_events += 1
+        self._events.append(payload)
+        self._wakeup.set()
+
+    def send_state(self, payload, frame=None):
+        """Offer a state frame; it replaces any frame not yet sent.
+
+        Args:
+            payload (str | bytes): Encoded frame
+            frame (StateFrame): The frame it encodes, for latency tracking
+        """
+        if self.closed:
+            return
+        if self._latest_state is not None:
+            self.skipped_states += 1
+        self._latest_state = payload
+        self._latest_frame = frame
+        self._wakeup.set()
+
+    @property
+    def queue_depth(self):
+        """Number of messages waiting to be written."""
+        return len(self._events) + (self._latest_state is not None)
+
+    def _buffered(self):
+        """Bytes written to the socket that the kernel has not taken yet."""
+        transport = getattr(self.websocket, "transport", None)
+        return transport.get_write_buffer_size() if transport is not None else 0
+
+    def _back_off(self):
+        """Increase the state-frame interval after the client fell behind."""
+        base = self.interval if self.interval > 0 else 1 / 60
+        self.interval = min(self.max_interval, base * self.backoff)
+
+    def _recover(self):
+        """Decrease the state-frame interval while the client keeps up."""
+        if self.interval <= self.min_interval:
+            return
+        self.interval *= self.recovery
+        if self.interval < 1 / 240:
+            self.interval = self.min_interval
+
+    async def _send(self, payload):
+        """Write one message and record how long the socket took."""
+        start = time.perf_counter()
+        await self.websocket.send(payload)
+        self.sent += 1
+        duration = time.perf_counter() - start
+        if self.on_send is not None:
+            self.on_send(duration)
+        # One trace track per client
+        tracer.record("send", start, duration, self.client_id)
+
+    async def _writer(self):
+        """Write queued messages to the socket until closed or failed."""
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+
+                # Events are sent first and in order
+                while self._events and not self.closed:
+                    await self._send(self._events.popleft())
+
+                payload = self._latest_state
+                if payload is None or self.closed:
+                    continue
+                frame = self._latest_frame
+                self._latest_state = None
+                self._latest_frame = None
+                await self._send(payload)
+                if self.latency is not None and frame is not None:
+                    self.latency.on_sent(frame, time.monotonic())
+
+                # A frame queued mid-send, or bytes piling up in the transport,
+                # mean the socket is slower than the tick; frames replaced
+                # during the interval sleep are expected
+                if (self._latest_state is not None
+                        or self._buffered() > self.max_buffered):
+                    self._back_off()
+                else:
+                    self._recover()
+
+                if self.interval > 0:
+                    await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            raise
+        except ConnectionClosed:
+            # Normal disconnect; the connection handler logs it
+            self.closed = True
+        except Exception as e:
+            logger.error(f"Failed to send to client {self.client_id}: {e}")
+            self.closed = True
@@ -0,0 +1,106 @@
+"""
+Input mapping for the driving simulator.
+Shared by the WebSocket server and the headless runner so that Arduino
+readings and manual controls drive CarPhysics the same way everywhere.
+"""
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+# Raw readings of a rig with both pedals released and the wheel centred;
+# the gear is left as is (CarPhysics has no neutral), so the car coasts
+# down. Applied while the rig is disconnected.
+SAFE_ARDUINO_DATA = {"acc": 700, "dec": 400, "steeringAngle": 0,
+                     "handbreak": False, "turnSignal": "N"}
+
+
+def apply_arduino_data(car_physics, arduino_data):
+    """Apply raw Arduino readings (ArduinoReader.get_data) to a car."""
+    if not arduino_data:  # Check if we received valid data
+        return
+
+    if "acc" in arduino_data:
+        car_physics.set_acceleration(
+            int(max(700 - arduino_data["acc"], 0)/4))
+
+    if "dec" in arduino_data:
+        car_physics.set_deceleration(
+            int(max(400 - arduino_data["dec"], 0)/15))
+
+    if "steeringAngle" in arduino_data:
+        car_physics.set_steering(
+            arduino_data["steeringAngle"]*3)
+
+    if "gear" in arduino_data:
+        car_physics.set_gear(arduino_data["gear"])
+
+    if "turnSignal" in arduino_data:
+        car_physics.set_turn_signal(
+            arduino_data["turnSignal"])
+
+    if "handbreak" in arduino_data:
+        car_physics.set_handbrake(
+            arduino_data["handbreak"])
+
+    # Log the applied Arduino data at debug level
+    logger.debug(f"Applied Arduino data: {arduino_data}")
+
+
+class ControlMailbox:
+    """Latest-wins manual controls of one session, applied once per tick.
+
+    Controls posted between two physics steps are merged (a newer value of
+    a field replaces the older one), so a client sending hundreds of
+    messages per second costs one application per step.
+    """
+
+    def __init__(self):
+        self.controls = {}
+        self.pending = False
+        self.seq = 0          # Sequence number of the newest posted controls
+        self.received = None  # time.monotonic() it was posted
+
+    def post(self, controls, seq, received):
+        """Merge `controls` into the pending ones.
+
+        Args:
+            controls (dict): Manual controls, as for apply_manual_controls
+            seq (int): Client sequence number, or None to number them here
+            received (float): time.monotonic() the message arrived
+        """
+        self.controls.update(controls)
+        self.pending = True
+        self.seq = seq if seq is not None else self.seq + 1
+        self.received = received
+
+    def take(self):
+        """Return and clear the pending controls, or None if there are none."""
+        if not self.pending:
+            return None
+        controls, self.controls = self.controls, {}
+        self.pending = False
+        return controls
+
+
+def apply_manual_controls(car_physics, controls):
+    """Apply manual controls (physics units, as sent by the web UI) to a car."""
+    if "acceleration" in controls:
+        car_physics.set_acceleration(controls["acceleration"])
+
+    if "deceleration" in controls:
+        car_physics.set_deceleration(controls["deceleration"])
+
+    if "steering_angle" in controls:
+        car_physics.set_steering(controls["steering_angle"])
+
+    if "gear" in controls:
+        # Set gear (P, D, R)
+        car_physics.set_gear(controls["gear"])
+
+    if "turn_signal" in controls:
+        car_physics.set_turn_signal(controls["turn_signal"])
+
+    if "handbrake" in controls:
+        car_physics.set_handbrake(controls["handbrake"])
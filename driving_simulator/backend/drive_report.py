@@ -25,7 +25,6 @@ import argparse
 from collections import Counter, deque
 from datetime import datetime
 
-from API_Test.gemini_to_speech import gemini_to_speech
 
 
 # ─────────────────────────────────────────────
@@ -70,6 +69,9 @@ def _speak(text: str, audio_dir: str) -> None:
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     mp3 = os.path.join(audio_dir, f"feedback_{ts}.mp3")
 
+    # Imported here: the Google client libraries are slow to load and
+    # reports without speech should not need them
+    from API_Test.gemini_to_speech import gemini_to_speech
     _, out_file = gemini_to_speech(
         text,
         instruction="你是一位駕駛教練，請用繁體中文簡潔說明下列駕駛表現與改進建議，請用一百五十字內完成回答",
@@ -0,0 +1,159 @@
+"""
+Event pipeline for the driving simulator.
+The update loop only pushes state snapshots onto a bounded queue; a worker
+task does violation detection, CSV persistence and post-drive report
+triggering, so the physics/broadcast loop never blocks on disk, a child
+process or the network. One pipeline serves every session; detector state
+is kept per StateManager.
+"""
+import asyncio
+import logging
+import sys
+import time
+
+from state_manager import detect_violations
+from tracing import tracer
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class _DetectorState:
+    """Per-session debouncing state for report triggering."""
+
+    __slots__ = ("handbrake", "last_report", "report_task")
+
+    def __init__(self):
+        self.handbrake = False  # Handbrake state of the previous snapshot
+        self.last_report = None
+        self.report_task = None
+
+
+class EventPipeline:
+    """Bounded snapshot queue plus a detection/persistence worker task."""
+
+    def __init__(self, max_queue=1024, report_cooldown=30.0, report_last=50,
+                 on_detect=None):
+        """Initialize the pipeline.
+
+        Args:
+            max_queue (int): Snapshots kept while the worker is busy; the
+                oldest is dropped when full
+            report_cooldown (float): Minimum seconds between two post-drive
+                reports of the same session
+            report_last (int): Rows passed to `drive_report --last`
+            on_detect (callable): Called with the duration in seconds of
+                each violation detection, for metrics
+        """
+        self.report_cooldown = report_cooldown
+        self.report_last = report_last
+        self.on_detect = on_detect
+
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self._detectors = {}  # StateManager -> _DetectorState
+
+        # Counters for diagnostics
+        self.processed = 0
+        self.dropped = 0
+        self.reports = 0
+
+    def start(self):
+        """Start the worker task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._worker())
+        return self._task
+
+    async def stop(self):
+        """Stop the worker task; a running report is left to finish."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def submit(self, state_manager, state):
+        """Queue a snapshot without blocking, dropping the oldest if full.
+
+        Args:
+            state_manager (StateManager): Session the snapshot belongs to;
+                used to persist its errors
+            state (dict): Snapshot from StateManager.snapshot()
+        """
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait((state_manager, state))
+
+    def forget(self, state_manager):
+        """Drop the detector state of a session that was closed."""
+        self._detectors.pop(state_manager, None)
+
+    @property
+    def queue_depth(self):
+        """Number of snapshots waiting for the worker."""
+        return self._queue.qsize()
+
+    async def _worker(self):
+        """Detect, persist and trigger reports for queued snapshots."""
+        while True:
+            state_manager, state = await self._queue.get()
+            try:
+                start = time.perf_counter()
+                errors = detect_violations(state)
+                duration = time.perf_counter() - start
+                if self.on_detect is not None:
+                    self.on_detect(duration)
+                tracer.record("detect", start, duration)
+                if errors:
+                    await asyncio.to_thread(
+                        state_manager.record_errors, state, errors)
+                self._maybe_report(state_manager, state)
+            except Exception as e:
+                logger.error(f"Error processing state snapshot: {e}")
+            finally:
+                self.processed += 1
+
+    def _maybe_report(self, state_manager, state):
+        """Trigger a post-drive report when the handbrake gets engaged.
+
+        Debounced per session: only the rising edge counts, reports are at
+        least `report_cooldown` seconds apart and never overlap.
+        """
+        detector = self._detectors.get(state_manager)
+        if detector is None:
+            detector = self._detectors[state_manager] = _DetectorState()
+
+        engaged = state["handbrake"] and not detector.handbrake
+        detector.handbrake = state["handbrake"]
+        if not engaged:
+            return
+
+        now = asyncio.get_running_loop().time()
+        if detector.report_task is not None and not detector.report_task.done():
+            logger.info("Post-drive report already running, skipping")
+            return
+        if (detector.last_report is not None
+                and now - detector.last_report < self.report_cooldown):
+            logger.info("Post-drive report on cooldown, skipping")
+            return
+
+        detector.last_report = now
+        detector.report_task = asyncio.create_task(
+            self._run_report(state_manager.csv_path))
+
+    async def _run_report(self, csv_path):
+        """Run drive_report in a child process without blocking the loop."""
+        logger.info(f"Handbrake engaged, generating post-drive report for {csv_path}")
+        self.reports += 1
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "drive_report",
+                "--csv", csv_path, "--last", str(self.report_last))
+            returncode = await proc.wait()
+            if returncode != 0:
+                logger.error(f"drive_report exited with code {returncode}")
+        except Exception as e:
+            logger.error(f"Failed to run drive_report: {e}")
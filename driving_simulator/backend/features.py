@@ -0,0 +1,249 @@
+"""
+Streaming windowed features for violation detection.
+A FeatureState holds the per-session state of every configured feature
+and adds the current feature values to each sample, so detection rules
+(rules.py) can use them like recorded fields, e.g. a steering rate or the
+time headway to the car in front. Every update is O(1) (amortized for
+min/max) using preallocated ring buffers, which keeps up with 1 kHz input.
+
+Features are configured per ruleset in rules.json under "features":
+    {"name": "steering_rate",      field added to the sample
+     "kind": "rate",               mean, std, min, max, rate, delta or ratio
+     "field": "steering_angle",    input field (may be an earlier feature)
+     "window_ms": 200,             time window (not used by delta/ratio)
+     "over": "speed",              ratio only: field / over
+     "scale": 3.6}                 ratio only: optional factor (unit change)
+
+    mean/std/min/max  statistics over the last window_ms
+    rate              (newest - oldest) / elapsed time, per second
+    delta             change since the previous sample
+    ratio             field / over * scale (e.g. time headway in seconds =
+                      distance [m] / speed [km/h] * 3.6); inf when over is 0
+
+Run `python features.py` for a 1 kHz throughput check.
+"""
+import math
+import time
+from array import array
+from collections import deque
+
+
+class TimeWindow:
+    """Samples of one input over the last `window` seconds.
+
+    Keeps a running mean and sum of squared deviations (Welford, with
+    removal) and monotonic deques for min/max, so pushing a sample and
+    reading any statistic is O(1) amortized. The running sums are
+    recomputed from the buffer once per `capacity` samples so rounding
+    cannot accumulate on long streams.
+    """
+
+    def __init__(self, window, max_hz=2000):
+        """Initialize an empty window.
+
+        Args:
+            window (float): Window length in seconds
+            max_hz (float): Highest expected sample rate; sizes the ring
+                buffer (above it the window just gets shorter)
+        """
+        self.window = window
+        self.capacity = int(window * max_hz) + 2
+        self._t = array("d", bytes(8 * self.capacity))
+        self._v = array("d", bytes(8 * self.capacity))
+        self._head = 0  # Index of the oldest sample
+        self.count = 0
+        self.pushed = 0  # Samples pushed so far; numbers the deque entries
+        self._mean = 0.0
+        self._m2 = 0.0  # Sum of squared deviations from the mean
+        self._min = deque()  # (sample number, v), increasing v
+        self._max = deque()  # (sample number, v), decreasing v
+
+    def push(self, t, v):
+        """Add sample `v` taken at time `t` (seconds, non-decreasing)."""
+        cutoff = t - self.window
+        while self.count and (self._t[self._head] < cutoff
+                              or self.count == self.capacity):
+            self._evict()
+
+        i = (self._head + self.count) % self.capacity
+        self._t[i] = t
+        self._v[i] = v
+        self.count += 1
+        delta = v - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (v - self._mean)
+
+        n = self.pushed
+        self.pushed += 1
+        while self._min and self._min[-1][1] >= v:
+            self._min.pop()
+        self._min.append((n, v))
+        while self._max and self._max[-1][1] <= v:
+            self._max.pop()
+        self._max.append((n, v))
+
+        # Deque entries of evicted samples are stale; numbering the samples
+        # (not using their times) keeps this right for equal timestamps
+        oldest = self.pushed - self.count
+        while self._min[0][0] < oldest:
+            self._min.popleft()
+        while self._max[0][0] < oldest:
+            self._max.popleft()
+
+        if self.pushed % self.capacity == 0:
+            self._recompute()
+
+    def _evict(self):
+        v = self._v[self._head]
+        self._head = (self._head + 1) % self.capacity
+        self.count -= 1
+        if self.count:
+            delta = v - self._mean
+            self._mean -= delta / self.count
+            self._m2 -= delta * (v - self._mean)
+        else:
+            self._mean = self._m2 = 0.0
+
+    def _recompute(self):
+        """Exact mean and squared deviations of the samples in the window."""
+        values = [self._v[(self._head + k) % self.capacity]
+                  for k in range(self.count)]
+        self._mean = math.fsum(values) / self.count
+        self._m2 = math.fsum((v - self._mean) ** 2 for v in values)
+
+    @property
+    def mean(self):
+        return self._mean if self.count else 0.0
+
+    @property
+    def std(self):
+        if self.count < 2:
+            return 0.0
+        # Removal can leave the sum slightly negative through rounding
+        return math.sqrt(max(0.0, self._m2 / self.count))
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else 0.0
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else 0.0
+
+    @property
+    def rate(self):
+        """Average change per second across the window."""
+        if self.count < 2:
+            return 0.0
+        newest = (self._head + self.count - 1) % self.capacity
+        dt = self._t[newest] - self._t[self._head]
+        if dt <= 0:
+            return 0.0
+        return (self._v[newest] - self._v[self._head]) / dt
+
+
+_STATISTICS = ("mean", "std", "min", "max", "rate")
+KINDS = _STATISTICS + ("delta", "ratio")
+
+
+class FeatureState:
+    """Per-session feature state; add features to samples with update()."""
+
+    def __init__(self, specs, max_hz=2000):
+        """Initialize the state for a list of feature specs.
+
+        Args:
+            specs (list): Feature specs (see module docstring)
+            max_hz (float): Highest expected sample rate
+        """
+        self.specs = specs
+        self.max_hz = max_hz
+        self.rule_state = {}  # For sustained ("for_ms") rules in rules.py
+        self._windows = {}  # (field, window_ms) -> TimeWindow, shared
+        self._previous = {}  # feature name -> last input value, for delta
+        self._plan = []
+        for spec in specs:
+            kind = spec["kind"]
+            if kind not in KINDS:
+                raise ValueError(f"Unknown feature kind {kind!r}")
+            window = None
+            push = False  # Only the first spec using a window feeds it
+            if kind in _STATISTICS:
+                key = (spec["field"], spec["window_ms"])
+                window = self._windows.get(key)
+                if window is None:
+                    window = self._windows[key] = TimeWindow(
+                        spec["window_ms"] / 1000, max_hz)
+                    push = True
+            extra = (spec["over"], spec.get("scale", 1.0)) if kind == "ratio" else None
+            self._plan.append((spec["name"], kind, spec["field"], extra,
+                               window, push))
+
+    def update(self, sample, t=None):
+        """Feed one sample and add the feature values to it (in place).
+
+        Args:
+            sample (dict): Sample; inputs missing from it are skipped
+            t (float): Sample time in seconds (default: sample["t"], or
+                time.monotonic()); also stored as sample["t"]
+
+        Returns:
+            The same sample dict
+        """
+        if t is None:
+            t = sample.get("t")
+            if t is None:
+                t = time.monotonic()
+        sample["t"] = t
+
+        for name, kind, field, extra, window, push in self._plan:
+            value = sample.get(field)
+            if value is None:
+                continue
+            if kind == "delta":
+                previous = self._previous.get(name)
+                self._previous[name] = value
+                sample[name] = 0.0 if previous is None else value - previous
+            elif kind == "ratio":
+                over, scale = extra
+                divisor = sample.get(over)
+                if divisor:
+                    sample[name] = value / divisor * scale
+                else:
+                    sample[name] = math.inf
+            else:
+                if push:
+                    window.push(t, value)
+                sample[name] = getattr(window, kind)
+        return sample
+
+    def reset(self):
+        """Forget all history, e.g. when a session restarts."""
+        self.__init__(self.specs, self.max_hz)
+
+
+# -------------- throughput check --------------
+if __name__ == "__main__":
+    import random
+
+    specs = [
+        {"name": "steering_delta", "kind": "delta", "field": "steering_angle"},
+        {"name": "steering_rate", "kind": "rate", "field": "steering_angle", "window_ms": 100},
+        {"name": "steering_std", "kind": "std", "field": "steering_angle", "window_ms": 2000},
+        {"name": "accel", "kind": "rate", "field": "speed", "window_ms": 200},
+        {"name": "jerk", "kind": "rate", "field": "accel", "window_ms": 200},
+        {"name": "time_headway", "kind": "ratio", "field": "front_distance", "over": "speed",
+         "scale": 3.6},
+        {"name": "headway_max", "kind": "max", "field": "time_headway", "window_ms": 2000},
+    ]
+    state = FeatureState(specs)
+    rng = random.Random(0)
+    n = 100000
+    samples = [{"steering_angle": rng.uniform(-30, 30), "speed": rng.uniform(0, 30),
+                "front_distance": rng.uniform(5, 50)} for _ in range(n)]
+    t0 = time.perf_counter()
+    for i, sample in enumerate(samples):
+        state.update(sample, i / 1000)
+    elapsed = time.perf_counter() - t0
+    print(f"{len(specs)} features: {elapsed / n * 1e6:.1f} us/sample "
+          f"({n / elapsed:.0f} samples/s)")
@@ -0,0 +1,128 @@
+"""
+Parity check and benchmark for the vectorized fleet physics.
+Steps a CarFleet and the same number of CarPhysics instances with the same
+random controls and compares them:
+  • the largest absolute difference of position, speed and direction over
+    the whole run, and
+  • CarFleet.get_state() against CarPhysics.get_state() for every car at
+    the end (same keys, same values),
+then times CarFleet.step for a large fleet. Exits 1 if the fleet diverges,
+so CI catches a physics change made to only one of the two engines.
+
+    python fleet_bench.py
+    python fleet_bench.py --cars 256 --steps 2000 --bench-cars 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from car_fleet import CarFleet
+from car_physics import CarPhysics
+
+
+def check_parity(n=256, steps=2000, dt=1 / 240, seed=0):
+    """Step CarFleet and n CarPhysics instances with the same random
+    controls; returns (largest absolute difference seen, fleet, cars).
+    """
+    rng = np.random.default_rng(seed)
+    fleet = CarFleet(n)
+    cars = [CarPhysics() for _ in range(n)]
+    for car in cars:
+        car.debug = False
+    worst = 0.0
+
+    for step in range(steps):
+        # Change controls now and then, including zeros to hit every branch
+        if step % 60 == 0:
+            acc = rng.choice([0.0, 0.0, 20.0, 80.0], n)
+            dec = rng.choice([0.0, 10.0, 40.0], n)
+            steer = rng.uniform(-60, 60, n)
+            gears = rng.choice(["P", "D", "D", "R"], n)
+            signals = rng.choice(["N", "N", "L", "R"], n)
+            for i, car in enumerate(cars):
+                car.set_acceleration(acc[i])
+                car.set_deceleration(dec[i])
+                car.set_steering(steer[i])
+                car.set_gear(gears[i])
+                car.set_turn_signal(signals[i])
+                fleet.set_gear(gears[i], i)
+            fleet.set_acceleration(acc)
+            fleet.set_deceleration(dec)
+            fleet.set_steering(steer)
+            fleet.set_turn_signal(signals)
+
+        fleet.step(dt)
+        for car in cars:
+            car.update(dt)
+
+        for field, values in (("x", fleet.x), ("y", fleet.y),
+                              ("speed", fleet.speed),
+                              ("direction", fleet.direction)):
+            if field in ("x", "y"):
+                scalar = np.array([car.position[field] for car in cars])
+            else:
+                scalar = np.array([getattr(car, field) for car in cars])
+            worst = max(worst, float(np.max(np.abs(scalar - values))))
+    return worst, fleet, cars
+
+
+def state_mismatches(fleet, cars, tolerance):
+    """Differences between CarFleet.get_state and CarPhysics.get_state."""
+    mismatches = []
+    for i, car in enumerate(cars):
+        expected, actual = car.get_state(), fleet.get_state(i)
+        if expected.keys() != actual.keys():
+            mismatches.append(f"car {i}: keys differ "
+                              f"{sorted(expected.keys() ^ actual.keys())}")
+            continue
+        for key, value in expected.items():
+            if key == "position":
+                close = all(abs(value[k] - actual[key][k]) <= tolerance
+                            for k in ("x", "y"))
+            elif isinstance(value, str):
+                close = value == actual[key]
+            else:
+                close = abs(value - actual[key]) <= tolerance
+            if not close:
+                mismatches.append(f"car {i}: {key} {actual[key]!r} != {value!r}")
+    return mismatches
+
+
+def measure_throughput(n, steps, dt=1 / 240):
+    """Car-steps per second of CarFleet.step for `n` driving cars."""
+    fleet = CarFleet(n)
+    fleet.set_gear("D")
+    fleet.set_acceleration(50)
+    t0 = time.perf_counter()
+    for _ in range(steps):
+        fleet.step(dt)
+    return n * steps / (time.perf_counter() - t0)
+
+
+def main():
+    p = argparse.ArgumentParser(description="CarFleet parity check and benchmark")
+    p.add_argument("--cars", type=int, default=256)
+    p.add_argument("--steps", type=int, default=2000)
+    p.add_argument("--tolerance", type=float, default=1e-6)
+    p.add_argument("--bench-cars", type=int, default=1000)
+    p.add_argument("--bench-steps", type=int, default=2400)
+    args = p.parse_args()
+
+    worst, fleet, cars = check_parity(args.cars, args.steps)
+    mismatches = state_mismatches(fleet, cars, args.tolerance)
+    print(f"max abs difference vs CarPhysics: {worst:.3e} (tolerance {args.tolerance:g})")
+    print(f"get_state mismatches: {len(mismatches)}")
+    for line in mismatches[:8]:
+        print(f"    {line}")
+
+    rate = measure_throughput(args.bench_cars, args.bench_steps)
+    print(f"{args.bench_cars} cars x {args.bench_steps} steps: "
+          f"{rate / 1e6:.1f}M car-steps/s")
+
+    if worst > args.tolerance or mismatches:
+        raise SystemExit("CarFleet diverged from CarPhysics")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+State frame codec for the driving simulator.
+Encodes each tick's car state once, either as the legacy JSON
+`state_update` message, as a compact fixed-size binary frame, or as a
+JSON delta against the last frame a client acknowledged, so the same
+payload object can be handed to every client that asked for it. Every
+encoding echoes the sequence numbers of the newest applied inputs (see
+latency.py), so a client can tell which frame first reflects an input.
+"""
+import json
+import math
+import struct
+from collections import OrderedDict
+
+from latency import INPUTS
+
+# Encodings a client can negotiate with a `set_encoding` message
+ENCODING_JSON = "json"
+ENCODING_BINARY = "binary"
+ENCODING_DELTA = "delta"
+ENCODINGS = (ENCODING_JSON, ENCODING_BINARY, ENCODING_DELTA)
+
+# Binary layout (little endian, 53 bytes):
+#   B  message type (MSG_STATE_UPDATE)
+#   B  protocol version
+#   I  frame sequence number
+#   9f position x, position y, speed, direction, steering_angle,
+#      acceleration_rate, deceleration_rate, car_length, car_width
+#   B  gear, B turn signal, B scene (indices into the tables below)
+#   2I sequence number of the newest applied input per INPUTS entry
+#      (manual_control message, Arduino frame; 0 if none yet)
+STATE_STRUCT = struct.Struct("<BBI9fBBB2I")
+MSG_STATE_UPDATE = 1
+PROTOCOL_VERSION = 2
+
+GEARS = ("P", "D", "R", "N")
+TURN_SIGNALS = ("N", "L", "R")
+SCENES = ("highway", "parking_lot", "intersection")
+
+_GEAR_INDEX = {g: i for i, g in enumerate(GEARS)}
+_SIGNAL_INDEX = {s: i for i, s in enumerate(TURN_SIGNALS)}
+_SCENE_INDEX = {s: i for i, s in enumerate(SCENES)}
+
+# Compact separators: no whitespace on the wire
+_json_encoder = json.JSONEncoder(separators=(",", ":"))
+
+# Quantization step per flattened field for delta frames. A field only
+# counts as changed once it moves by at least one step, so float jitter in
+# position/speed does not defeat the deltas. None means compare exactly.
+DELTA_QUANTA = {
+    "x": 0.01,
+    "y": 0.01,
+    "speed": 0.01,
+    "direction": 0.1,
+    "steering_angle": 0.1,
+    "acceleration_rate": 0.1,
+    "deceleration_rate": 0.1,
+    "car_length": 1,
+    "car_width": 1,
+    "gear": None,
+    "turn_signal": None,
+    "scene": None,
+}
+
+# Decimal places used when rounding each quantized field for the wire
+_DELTA_DIGITS = {
+    field: (max(0, -math.floor(math.log10(step))) if step else None)
+    for field, step in DELTA_QUANTA.items()
+}
+
+
+class StateFrame:
+    """One tick's state, encoded lazily and at most once per encoding."""
+
+    __slots__ = ("seq", "car", "scene", "inputs", "_json", "_binary", "_flat")
+
+    def __init__(self, seq, car, scene, inputs=None):
+        """
+        Args:
+            seq (int): Frame sequence number
+            car (dict): Car state as from CarPhysics.get_state
+            scene (str): Scene name
+            inputs (dict): Input source -> InputMark of the newest input
+                this frame reflects
+        """
+        self.seq = seq
+        self.car = car
+        self.scene = scene
+        self.inputs = inputs
+        self._json = None
+        self._binary = None
+        self._flat = None
+
+    @property
+    def json(self):
+        """Legacy `state_update` message as a JSON string."""
+        if self._json is None:
+            message = {
+                "type": "state_update",
+                "seq": self.seq,
+                "car": self.car,
+                "scene": self.scene
+            }
+            if self.inputs:
+                message["input"] = self.input_seqs()
+            self._json = _json_encoder.encode(message)
+        return self._json
+
+    @property
+    def binary(self):
+        """Fixed-layout binary frame as a bytes object."""
+        if self._binary is None:
+            self._binary = encode_binary_state(self.seq, self.car, self.scene,
+                                               self.inputs)
+        return self._binary
+
+    @property
+    def flat(self):
+        """Quantized, flattened field dict used as a delta baseline."""
+        if self._flat is None:
+            self._flat = quantize_state(self.car, self.scene)
+        return self._flat
+
+    def input_seqs(self):
+        """Input source -> sequence number of the newest applied input."""
+        return {source: mark.seq for source, mark in self.inputs.items()}
+
+    def payload(self, encoding):
+        """Return the payload for a client's negotiated encoding.
+
+        Delta clients are handled by DeltaEncoder, since their payload
+        depends on the client's acknowledged baseline.
+        """
+        if encoding == ENCODING_BINARY:
+            return self.binary
+        return self.json
+
+
+def encode_binary_state(seq, car, scene, inputs=None):
+    """Pack a car state dict (as from CarPhysics.get_state) into bytes."""
+    position = car["position"]
+    inputs = inputs or {}
+    manual, arduino = (inputs[s].seq & 0xFFFFFFFF if s in inputs else 0
+                       for s in INPUTS)
+    return STATE_STRUCT.pack(
+        MSG_STATE_UPDATE,
+        PROTOCOL_VERSION,
+        seq & 0xFFFFFFFF,
+        position["x"],
+        position["y"],
+        car["speed"],
+        car["direction"],
+        car["steering_angle"],
+        car["acceleration_rate"],
+        car["deceleration_rate"],
+        car["car_length"],
+        car["car_width"],
+        _GEAR_INDEX.get(car["gear"], 0),
+        _SIGNAL_INDEX.get(car["turn_signal"], 0),
+        _SCENE_INDEX.get(scene, 0),
+        manual,
+        arduino
+    )
+
+
+def quantize_state(car, scene):
+    """Flatten a car state dict and snap each field to its quantum."""
+    position = car["position"]
+    values = {
+        "x": position["x"],
+        "y": position["y"],
+        "speed": car["speed"],
+        "direction": car["direction"],
+        "steering_angle": car["steering_angle"],
+        "acceleration_rate": car["acceleration_rate"],
+        "deceleration_rate": car["deceleration_rate"],
+        "car_length": car["car_length"],
+        "car_width": car["car_width"],
+        "gear": car["gear"],
+        "turn_signal": car["turn_signal"],
+        "scene": scene,
+    }
+    for field, step in DELTA_QUANTA.items():
+        if step:
+            values[field] = round(round(values[field] / step) * step,
+                                  _DELTA_DIGITS[field])
+    return values
+
+
+class DeltaEncoder:
+    """Encodes per-client delta frames against acknowledged baselines.
+
+    The encoder keeps the quantized fields of recent frames. A delta client
+    acknowledges frames with `{"type": "ack", "seq": n}`; its next frame
+    then only carries the fields that differ from frame n. Clients without
+    a usable baseline, or due for a periodic refresh, get a keyframe.
+
+    Payloads are cached per tick by baseline, so clients that acknowledged
+    the same frame share one encoded string.
+    """
+
+    def __init__(self, keyframe_interval=120, history=240):
+        """Initialize the encoder.
+
+        Args:
+            keyframe_interval (int): Frames between forced keyframes per client
+            history (int): Number of recent frames kept as possible baselines
+        """
+        self.keyframe_interval = keyframe_interval
+        self.history_size = history
+        self._history = OrderedDict()  # seq -> quantized fields
+        self._frame = None
+        self._cache = {}
+
+    def begin_frame(self, frame):
+        """Register this tick's frame; must be called once before payload_for."""
+        self._frame = frame
+        self._cache.clear()
+        self._history[frame.seq] = frame.flat
+        while len(self._history) > self.history_size:
+            self._history.popitem(last=False)
+
+    def payload_for(self, channel):
+        """Return the delta or keyframe payload for one client channel."""
+        frame = self._frame
+        base = channel.acked_seq
+        if (base is None or base not in self._history
+                or frame.seq - channel.keyframe_seq >= self.keyframe_interval):
+            base = None
+
+        payload = self._cache.get(base)
+        if payload is None:
+            payload = self._encode(frame, base)
+            self._cache[base] = payload
+
+        if base is None:
+            channel.keyframe_seq = frame.seq
+        return payload
+
+    def acknowledge(self, channel, seq):
+        """Record that a client holds frame `seq` and can use it as baseline.
+
+        Only frames from the client's latest keyframe on count: an ack sent
+        before a reset (e.g. for a frame of the session it just left) may
+        name a seq this encoder also has, but with other fields.
+        """
+        if (not isinstance(seq, int) or seq not in self._history
+                or channel.keyframe_seq is None or seq < channel.keyframe_seq):
+            return
+        if channel.acked_seq is None or seq > channel.acked_seq:
+            channel.acked_seq = seq
+
+    @staticmethod
+    def reset(channel):
+        """Drop a client's baseline so its next frame is a keyframe.
+
+        Acks are ignored until that keyframe is sent.
+        """
+        channel.acked_seq = None
+        channel.keyframe_seq = None
+
+    def _encode(self, frame, base):
+        current = frame.flat
+        if base is None:
+            message = {
+                "type": "state_keyframe",
+                "seq": frame.seq,
+                "fields": current
+            }
+            if frame.inputs:
+                message["input"] = frame.input_seqs()
+            return _json_encoder.encode(message)
+        baseline = self._history[base]
+        changed = {k: v for k, v in current.items() if baseline.get(k) != v}
+        message = {
+            "type": "state_delta",
+            "seq": frame.seq,
+            "base": base,
+            "fields": changed
+        }
+        if frame.inputs:
+            message["input"] = frame.input_seqs()
+        return _json_encoder.encode(message)
+
+
+def decode_binary_state(data):
+    """Unpack a binary frame back into (seq, car dict, scene, input seqs).
+
+    Mainly useful for tools and debugging; the browser decodes frames
+    itself in socketHandler.js.
+    """
+    (msg_type, version, seq, x, y, speed, direction, steering_angle,
+     acceleration_rate, deceleration_rate, car_length, car_width,
+     gear, turn_signal, scene, *input_seqs) = STATE_STRUCT.unpack(data)
+    if msg_type != MSG_STATE_UPDATE or version != PROTOCOL_VERSION:
+        raise ValueError(
+            f"Unsupported frame (type={msg_type}, version={version})")
+    car = {
+        "position": {"x": x, "y": y},
+        "speed": speed,
+        "direction": direction,
+        "gear": GEARS[gear],
+        "steering_angle": steering_angle,
+        "acceleration_rate": acceleration_rate,
+        "deceleration_rate": deceleration_rate,
+        "car_length": car_length,
+        "car_width": car_width,
+        "turn_signal": TURN_SIGNALS[turn_signal]
+    }
+    inputs = {source: n for source, n in zip(INPUTS, input_seqs) if n}
+    return seq, car, SCENES[scene], inputs
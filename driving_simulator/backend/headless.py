@@ -0,0 +1,269 @@
+"""
+Headless simulation for the driving simulator.
+Runs CarPhysics plus violation detection against a recorded or scripted
+input trace, with a simulated clock instead of wall-clock pacing, as fast
+as the CPU allows. Used to regression-test threshold changes against many
+recorded drives.
+
+Trace format (CSV with header, or JSON lines), one row per input change:
+    t            time in seconds since the start of the drive
+    acc, dec, steeringAngle, gear, turnSignal, handbreak
+                 raw Arduino readings (mapped like the live server), or
+    acceleration, deceleration, steering_angle, gear, turn_signal, handbrake
+                 physics units (like web manual_control messages)
+Inputs are held until the next row.
+
+CLI
+---
+    python headless.py drive.csv --trajectory out.csv --events out.json
+    python headless.py traces/*.csv --jobs 8        # summary per trace
+    python headless.py --check                      # step timing self-check
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from car_physics import CarPhysics
+from controls import apply_arduino_data, apply_manual_controls
+from state_manager import StateManager, detect_violations
+
+ARDUINO_KEYS = ("acc", "dec", "steeringAngle", "gear", "turnSignal", "handbreak")
+NUMERIC_KEYS = ("t", "acc", "dec", "steeringAngle", "acceleration",
+                "deceleration", "steering_angle")
+BOOLEAN_KEYS = ("handbreak", "handbrake")
+
+
+class SimClock:
+    """Simulated clock; advances only when told to."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, dt):
+        self.now += dt
+
+    def set_step(self, step, step_hz):
+        """Jump to the start of physics step `step`.
+
+        Computed from the step index rather than summed step by step, so
+        the clock does not drift: step_hz * k lands exactly on k seconds,
+        the same float a trace row's "t" parses to.
+        """
+        self.now = step / step_hz
+
+
+def _parse_row(row):
+    """Convert the string values of a CSV row to numbers/booleans."""
+    parsed = {}
+    for key, value in row.items():
+        if value is None or value == "":
+            continue
+        if key in NUMERIC_KEYS:
+            value = float(value)
+        elif key in BOOLEAN_KEYS and isinstance(value, str):
+            value = value.strip().lower() in ("1", "true", "yes")
+        parsed[key] = value
+    return parsed
+
+
+def load_trace(path):
+    """Load a trace file (CSV or JSON lines) as a list of input rows."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".json")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    rows = [_parse_row(row) for row in rows]
+    rows.sort(key=lambda row: row.get("t", 0.0))
+    return rows
+
+
+def apply_trace_row(car_physics, row):
+    """Apply one trace row, in Arduino or physics units, to a car."""
+    # "gear" is spelled the same in both formats
+    if any(key in row for key in ARDUINO_KEYS if key != "gear"):
+        apply_arduino_data(car_physics, row)
+    else:
+        apply_manual_controls(car_physics, row)
+
+
+def run_headless(trace, step_hz=240, detect_hz=1.0, sample_hz=30.0,
+                 tail=0.0):
+    """Simulate a drive from an input trace.
+
+    Args:
+        trace (list): Input rows as returned by load_trace
+        step_hz (int): Fixed physics step rate
+        detect_hz (float): Violation detection rate (the server uses 1 Hz)
+        sample_hz (float): Trajectory sample rate (0 disables the trajectory)
+        tail (float): Extra seconds simulated after the last input
+
+    Returns:
+        dict with "trajectory" (list of dicts), "events" (list of dicts),
+        "steps" and "duration" (simulated seconds)
+    """
+    clock = SimClock()
+    car = CarPhysics(clock=clock)
+    car.debug = False
+    state_manager = StateManager(car)
+
+    dt = 1 / step_hz
+    end = (trace[-1].get("t", 0.0) if trace else 0.0) + tail
+    total_steps = int(round(end * step_hz))
+    detect_every = max(1, int(round(step_hz / detect_hz)))
+    sample_every = int(round(step_hz / sample_hz)) if sample_hz else 0
+
+    trajectory = []
+    events = []
+    next_row = 0
+
+    for step in range(total_steps + 1):
+        clock.set_step(step, step_hz)
+
+        # Apply every input whose timestamp has been reached, before this
+        # step's detection snapshot
+        while next_row < len(trace) and trace[next_row].get("t", 0.0) <= clock.now:
+            apply_trace_row(car, trace[next_row])
+            next_row += 1
+
+        if step and step % detect_every == 0:
+            state = state_manager.snapshot()
+            errors = detect_violations(state)
+            if errors:
+                events.append({"t": round(clock.now, 6), "errors": errors,
+                               "state": state})
+
+        if sample_every and step % sample_every == 0:
+            trajectory.append({
+                "t": round(clock.now, 6),
+                "x": car.position["x"],
+                "y": car.position["y"],
+                "speed": car.speed,
+                "direction": car.direction,
+                "gear": car.gear,
+                "steering_angle": car.steering_angle,
+                "turn_signal": car.turn_signal,
+                "handbrake": car.handbrake,
+            })
+
+        if step < total_steps:
+            # Same per-step snap as the live server
+            if abs(car.speed) < 0.1:
+                car.speed = 0
+            car.update(dt)
+
+    return {"trajectory": trajectory, "events": events,
+            "steps": total_steps, "duration": end}
+
+
+def check_step_timing(step_hz=240, seconds=60):
+    """Check that a row at an exact step time is applied before that
+    step's detection, wherever in the drive it falls.
+
+    Steers hard for half a second starting at every whole second k; the
+    detection at t=k must see it every time. Returns the seconds at which
+    the result differed from the expected event (empty when fine).
+    """
+    expected = None
+    wrong = []
+    for k in range(1, seconds + 1):
+        result = run_headless([{"t": float(k), "steering_angle": 40.0},
+                               {"t": k + 0.5, "steering_angle": 0.0}],
+                              step_hz=step_hz, sample_hz=0)
+        got = [(event["t"] - k, event["errors"]) for event in result["events"]]
+        if expected is None:
+            expected = got
+        if not got or got != expected:
+            wrong.append(k)
+    return wrong
+
+
+def write_trajectory(trajectory, path):
+    """Write a trajectory as CSV."""
+    if not trajectory:
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(trajectory[0].keys()))
+        writer.writeheader()
+        writer.writerows(trajectory)
+
+
+def _summarize(path, step_hz, detect_hz):
+    """Run one trace without a trajectory and return a per-trace summary."""
+    result = run_headless(load_trace(path), step_hz=step_hz,
+                          detect_hz=detect_hz, sample_hz=0)
+    counts = {}
+    for event in result["events"]:
+        for err in event["errors"]:
+            counts[err] = counts.get(err, 0) + 1
+    return {"trace": path, "duration": result["duration"],
+            "steps": result["steps"], "counts": counts}
+
+
+def main():
+    p = argparse.ArgumentParser(description="Headless faster-than-real-time simulation")
+    p.add_argument("traces", nargs="*", help="Input trace files (CSV or JSON lines)")
+    p.add_argument("--physics-hz", type=int, default=240,
+                   help="Fixed physics step rate (default 240)")
+    p.add_argument("--detect-hz", type=float, default=1.0,
+                   help="Violation detection rate (default 1, like the server)")
+    p.add_argument("--sample-hz", type=float, default=30.0,
+                   help="Trajectory sample rate (default 30)")
+    p.add_argument("--tail", type=float, default=0.0,
+                   help="Seconds to keep simulating after the last input")
+    p.add_argument("--trajectory", help="Write the trajectory CSV here (single trace)")
+    p.add_argument("--events", help="Write detected events as JSON here (single trace)")
+    p.add_argument("--jobs", type=int, default=os.cpu_count(),
+                   help="Worker processes for multiple traces")
+    p.add_argument("--check", action="store_true",
+                   help="Check that trace rows at exact step times are applied "
+                        "before that step's detection, then exit")
+    args = p.parse_args()
+
+    if args.check:
+        wrong = check_step_timing(args.physics_hz)
+        if wrong:
+            raise SystemExit(f"Step timing check failed at t = {wrong} s")
+        print("Step timing check passed")
+        return
+    if not args.traces:
+        p.error("no trace files given")
+
+    t0 = time.perf_counter()
+    if len(args.traces) == 1:
+        result = run_headless(load_trace(args.traces[0]),
+                              step_hz=args.physics_hz,
+                              detect_hz=args.detect_hz,
+                              sample_hz=args.sample_hz if args.trajectory else 0,
+                              tail=args.tail)
+        if args.trajectory:
+            write_trajectory(result["trajectory"], args.trajectory)
+        if args.events:
+            with open(args.events, "w", encoding="utf-8") as f:
+                json.dump(result["events"], f, ensure_ascii=False, indent=2)
+        else:
+            for event in result["events"]:
+                print(f"{event['t']:9.3f}s  {';'.join(event['errors'])}")
+        simulated = result["duration"]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            summaries = list(pool.map(_summarize, args.traces,
+                                      [args.physics_hz] * len(args.traces),
+                                      [args.detect_hz] * len(args.traces)))
+        for summary in summaries:
+            print(json.dumps(summary, ensure_ascii=False))
+        simulated = sum(s["duration"] for s in summaries)
+
+    elapsed = time.perf_counter() - t0
+    print(f"Simulated {simulated:.1f}s of driving in {elapsed:.2f}s "
+          f"({simulated / max(elapsed, 1e-9):.0f}x real time)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Timestamped input jitter buffer for the Arduino rig.
+Every decoded frame is kept, with its sequence number and monotonic
+receive time, in a small ring buffer. Each physics step takes the frames
+that arrived up to the end of the time it simulates, in order, and the
+StepBlender turns them into that step's input: pedals and steering are
+averaged over the step weighted by how long each value was held, so a
+pedal burst between two steps still moves the car by the right amount
+while the physics keeps its fixed step. Steering and pedals can
+optionally be smoothed (EMA or a short median) before blending.
+
+Producer (the serial transport) and consumer (the physics step) both run
+on the event loop, so no lock is needed.
+"""
+from collections import deque
+
+# Inputs blended over a step; the rest (gear, handbrake, turn signal) take
+# the newest frame's value
+CONTINUOUS = ("acc", "dec", "steeringAngle")
+SMOOTHING = ("ema", "median")
+
+
+class InputBuffer:
+    """Ring buffer of received input frames, oldest first."""
+
+    def __init__(self, capacity=64):
+        """
+        Args:
+            capacity (int): Frames kept; when full the oldest is dropped
+                (about 64 ms at 1 kHz, far more than one physics step)
+        """
+        self._frames = deque(maxlen=capacity)
+        self.seq = 0         # Frames posted so far
+        self.overflowed = 0  # Frames dropped before any step took them
+
+    def post(self, frame):
+        """Add a frame (dict with a monotonic receive time under "t")."""
+        if len(self._frames) == self._frames.maxlen:
+            self.overflowed += 1
+        self._frames.append(frame)
+        self.seq += 1
+
+    def take_until(self, t):
+        """Remove and return the frames received at or before `t`, in order."""
+        frames = self._frames
+        if not frames or frames[0]["t"] > t:
+            return []
+        taken = []
+        while frames and frames[0]["t"] <= t:
+            taken.append(frames.popleft())
+        return taken
+
+    def __len__(self):
+        return len(self._frames)
+
+
+class InputSmoother:
+    """EMA or running median over the continuous inputs of each frame."""
+
+    def __init__(self, mode="ema", alpha=0.5, window=3):
+        """
+        Args:
+            mode (str): "ema" or "median"
+            alpha (float): EMA weight of the newest value (1 = no smoothing)
+            window (int): Frames in the median window
+        """
+        if mode not in SMOOTHING:
+            raise ValueError(f"Unknown smoothing {mode!r}")
+        self.mode = mode
+        self.alpha = alpha
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        """Forget the history, e.g. after a disconnect."""
+        self._ema = {}
+        self._recent = {k: deque(maxlen=self.window) for k in CONTINUOUS}
+
+    def __call__(self, frame):
+        """Smooth `frame` in place."""
+        for k in CONTINUOUS:
+            v = frame.get(k)
+            if v is None:
+                continue
+            if self.mode == "ema":
+                prev = self._ema.get(k)
+                v = v if prev is None else prev + self.alpha * (v - prev)
+                self._ema[k] = v
+            else:
+                recent = self._recent[k]
+                recent.append(v)
+                v = sorted(recent)[len(recent) // 2]
+            frame[k] = v
+        return frame
+
+
+class StepBlender:
+    """Turns the frames that arrived during one physics step into its input."""
+
+    def __init__(self, smoother=None):
+        self.smoother = smoother
+        self._held = None  # Newest (smoothed) frame; applied on frameless steps
+
+    def blend(self, frames, start, end):
+        """Input for the step simulating (start, end].
+
+        Continuous inputs are the time-weighted mean of the value held at
+        `start` and every frame, each counted from its receive time (clamped
+        to the step) until the next one. A step without frames gets the
+        newest frame as is, so the car settles on it after a blended step.
+        A frame flagged "safe" (link lost) is applied as is and resets the
+        smoothing. Returns None until the first frame.
+        """
+        if not frames:
+            return self._held
+        if frames[-1].get("safe"):
+            if self.smoother is not None:
+                self.smoother.reset()
+            self._held = frames[-1]
+            return self._held
+        if self.smoother is not None:
+            for frame in frames:
+                self.smoother(frame)
+
+        out = dict(frames[-1])
+        held = self._held
+        if held is not None and end > start:
+            for k in CONTINUOUS:
+                if k not in out:
+                    continue
+                total = 0.0
+                t_prev, value = start, held.get(k, out[k])
+                for frame in frames:
+                    t = min(max(frame["t"], start), end)
+                    total += value * (t - t_prev)
+                    t_prev, value = t, frame.get(k, value)
+                total += value * (end - t_prev)
+                out[k] = total / (end - start)
+        self._held = frames[-1]
+        return out
@@ -0,0 +1,132 @@
+"""
+Input-to-screen latency tracking for the driving simulator server.
+Every applied input (an Arduino frame or a manual_control message) leaves
+an input mark on its session: its sequence number, when it was received
+and when the physics applied it. State frames carry the marks of the
+inputs they reflect and echo their sequence numbers to the client. When a
+client's channel sends the first frame reflecting a new input, and when
+the client reports that it rendered a frame, the time spent in each stage
+is recorded:
+
+  serial_to_physics  Arduino frame received -> physics step applying it
+  physics_to_send    input applied -> first frame reflecting it sent
+  send_to_render     frame sent -> client rendered it
+
+The browser's clock is not synchronized with ours, so send_to_render is
+estimated from the render report's round trip: the client reports when it
+received and when it rendered the frame (its own clock) and sends the
+report right after rendering, so the network time is the round trip minus
+the client-side delay, split evenly between both directions.
+
+Server timestamps are time.monotonic().
+"""
+from collections import OrderedDict
+
+from metrics import Histogram
+
+# Input sources a state frame can reflect, in binary frame order
+INPUTS = ("manual", "arduino")
+
+# Stage -> help text
+STAGES = {
+    "serial_to_physics": "Arduino frame received to physics step applying it",
+    "physics_to_send": "Input applied to first state frame reflecting it sent",
+    "send_to_render": "State frame sent to rendered by the client",
+}
+
+# 0.5 ms .. 1 s; a 60 Hz frame is 16.7 ms
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.02,
+                 0.03, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0)
+
+
+class InputMark:
+    """Sequence number and timestamps of one applied input."""
+
+    __slots__ = ("seq", "received", "applied")
+
+    def __init__(self, seq, received, applied):
+        self.seq = seq
+        self.received = received
+        self.applied = applied
+
+
+class LatencyStages:
+    """One histogram per stage of the input-to-screen path."""
+
+    def __init__(self, histogram=Histogram, prefix=""):
+        """
+        Args:
+            histogram (callable): Called as histogram(name, help, buckets),
+                e.g. MetricsRegistry.histogram to export the stages
+            prefix (str): Prepended to each stage name
+        """
+        self.stages = {stage: histogram(f"{prefix}{stage}_seconds", help_text,
+                                        STAGE_BUCKETS)
+                       for stage, help_text in STAGES.items()}
+
+    def observe(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+
+    def snapshot(self):
+        return {stage: h.snapshot() for stage, h in self.stages.items()}
+
+
+class ClientLatency:
+    """Latency stages of one client, optionally also added to server totals."""
+
+    def __init__(self, totals=None, history=128):
+        """
+        Args:
+            totals (LatencyStages): Server-wide stages every sample also
+                goes to
+            history (int): Sent frames remembered for render reports
+        """
+        self.stages = LatencyStages()
+        self.totals = totals
+        self.history = history
+        self._sent = OrderedDict()  # Frame seq -> send time
+        self._seen = {}  # Input source -> newest input seq sent
+
+    def _observe(self, stage, seconds):
+        self.stages.observe(stage, seconds)
+        if self.totals is not None:
+            self.totals.observe(stage, seconds)
+
+    def on_sent(self, frame, now):
+        """Record that state `frame` (a StateFrame) was sent at `now`."""
+        self._sent[frame.seq] = now
+        if len(self._sent) > self.history:
+            self._sent.popitem(last=False)
+        if not frame.inputs:
+            return
+        for source, mark in frame.inputs.items():
+            if self._seen.get(source) == mark.seq:
+                continue  # Already reflected by an earlier frame
+            self._seen[source] = mark.seq
+            if source == "arduino":
+                self._observe("serial_to_physics", mark.applied - mark.received)
+            self._observe("physics_to_send", now - mark.applied)
+
+    def on_render(self, seq, received, rendered, now):
+        """Record a client's render report for frame `seq`.
+
+        Args:
+            seq (int): Frame sequence number
+            received (float): Client time the frame arrived (seconds)
+            rendered (float): Client time it was rendered (seconds)
+            now (float): Server time the report arrived
+
+        Returns False if the frame is unknown or the report is inconsistent.
+        """
+        sent = self._sent.pop(seq, None)
+        client_delay = rendered - received
+        if sent is None or client_delay < 0:
+            return False
+        network = (now - sent - client_delay) / 2
+        if network < 0:
+            return False
+        self._observe("send_to_render", network + client_delay)
+        return True
+
+    def snapshot(self):
+        return self.stages.snapshot()
@@ -4,13 +4,28 @@ This handles the WebSocket communication between the Python backend and React fr
 Fixed to ensure stable connection while moving in any gear.
 """
 import asyncio
+import datetime
 import json
+import os
 import websockets
 import argparse
 import logging
-from car_physics import CarPhysics
-from pyserial import ArduinoReader
-from state_manager import StateManager
+import time
+from client_channel import ClientChannel
+from controls import SAFE_ARDUINO_DATA, apply_arduino_data
+from event_pipeline import EventPipeline
+from frame_codec import ENCODING_DELTA, ENCODINGS
+from latency import ClientLatency, LatencyStages
+from messages import TokenBucket, parse_message
+from metrics import MetricsRegistry
+from scheduler import FixedStepScheduler
+from session import DEFAULT_SESSION, SessionRegistry, is_valid_session_id
+from state_manager import preload_tts, tts_queue_depth
+from telemetry_log import SOURCE_ARDUINO
+from tracing import tracer, write_chrome_trace
+from watchdog import LoopWatchdog
+from input_buffer import InputBuffer, InputSmoother, StepBlender
+from serial_transport import AsyncSerialTransport
 
 
 # Set up logging
@@ -20,39 +35,231 @@ logger = logging.getLogger(__name__)
 
 
 class DrivingSimulatorServer:
-    def __init__(self, use_arduino=False, arduino_port="/dev/ttyUSB0",
-                 host="localhost", port=8765):
+    def __init__(self, use_arduino=False, arduino_port="auto",
+                 host="localhost", port=8765, physics_hz=240, network_hz=60,
+                 record=False, telemetry_dir="telemetry", metrics_port=9108,
+                 trace=False, trace_dir="traces", trace_budget_ms=None,
+                 trace_seconds=5.0, watchdog_ms=100, input_smoothing=None,
+                 input_ema_alpha=0.5, client_rate=120, client_burst=60,
+                 max_sessions=64, max_sessions_per_client=4):
         """Initialize the driving simulator server.
 
         Args:
             use_arduino (bool): Whether to use real Arduino hardware
-            arduino_port (str): Serial port for the Arduino
+            arduino_port (str): Serial port for the Arduino, or "auto" to
+                find it by USB vendor/product id (also used when the port
+                disappears, e.g. after replugging)
             host (str): Host to bind the WebSocket server to
             port (int): Port to bind the WebSocket server to
+            physics_hz (int): Fixed physics step rate
+            network_hz (int): State broadcast rate
+            record (bool): Record every session to a telemetry log
+            telemetry_dir (str): Directory for telemetry logs and replays
+            metrics_port (int): Local HTTP port for Prometheus metrics
+                (0 disables the endpoint)
+            trace (bool): Record per-stage spans for Chrome trace export
+            trace_dir (str): Directory trace files are written to
+            trace_budget_ms (float): Tick duration that triggers an automatic
+                trace dump (default: one physics step)
+            trace_seconds (float): Seconds of spans included in a dump
+            watchdog_ms (float): Event-loop lag that the watchdog reports as
+                blocking, with the offending stack (0 disables it)
+            input_smoothing (str): "ema" or "median" smoothing of Arduino
+                steering and pedals (default: none)
+            input_ema_alpha (float): Weight of the newest value for "ema"
+            client_rate (float): Messages per second a client may send on
+                average; over budget, the newest message of each type is
+                handled late and older ones are dropped (manual controls
+                are always merged into the session's mailbox)
+            client_burst (int): Messages a client may send at once
+            max_sessions (int): Sessions that may exist at once (0: no limit)
+            max_sessions_per_client (int): Sessions one client connection
+                may create (0: no limit)
         """
         self.host = host
         self.port = port
-        self.car_physics = CarPhysics()
-        self.state_manager = StateManager(self.car_physics)
-
-        # Set up Arduino handler
-        self.arduino = ArduinoReader()
-
-        self.connected_clients = set()
-        self.current_scene = "highway"  # Default scene
+        self.metrics_port = metrics_port
+        self.watchdog_ms = watchdog_ms
+        self.watchdog = None
+        self.metrics = MetricsRegistry()
+        self._init_metrics()
+
+        # Per-stage tracing; dumps are rate limited to one per cooldown
+        tracer.enable(trace)
+        self.trace_dir = trace_dir
+        self.trace_budget = (trace_budget_ms / 1000 if trace_budget_ms
+                             else 1 / physics_hz)
+        self.trace_seconds = trace_seconds
+        self.trace_cooldown = 30.0
+        self._last_auto_dump = None
+        self._dump_task = None
+
+        self.scheduler = FixedStepScheduler(step_hz=physics_hz,
+                                            publish_hz=network_hz,
+                                            on_tick=self._on_tick)
+        self.step_count = 0  # Physics steps since start
+        self.event_pipeline = EventPipeline(
+            on_detect=self.detection_seconds.observe)
+
+        # Every client belongs to one session; each session has its own car,
+        # scene and log stream. The Arduino rig drives the default session.
+        self.sessions = SessionRegistry(
+            self.event_pipeline, physics_hz, telemetry_dir=telemetry_dir,
+            record=record, publish_hz=network_hz, max_sessions=max_sessions,
+            max_sessions_per_client=max_sessions_per_client)
+
+        # Arduino frames are read on the event loop into a timestamped
+        # buffer; each physics step blends the frames received during the
+        # time it simulates. The port is opened in start_server once the
+        # socket is listening and reopened in the background if it is lost;
+        # without --use-arduino there is none.
+        self.input_buffer = InputBuffer()
+        self.input_blender = StepBlender(
+            InputSmoother(input_smoothing, input_ema_alpha)
+            if input_smoothing else None)
+        self.arduino = (AsyncSerialTransport(arduino_port, self.input_buffer,
+                                             safe_frame=SAFE_ARDUINO_DATA)
+                        if use_arduino else None)
+
+        # Maps each WebSocket to its outbound ClientChannel
+        self.connected_clients = {}
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+
+        # Inbound message type -> handler(channel, data); every type here
+        # has a schema in messages.MESSAGE_SCHEMAS
+        self._handlers = {
+            "manual_control": self._on_manual_control,
+            "render_report": self._on_render_report,
+            "ack": self._on_ack,
+            "request_state": self._on_request_state,
+            "set_scene": self._on_set_scene,
+            "join_session": self._on_join_session,
+            "set_encoding": self._on_set_encoding,
+            "list_recordings": self._on_list_recordings,
+            "start_replay": self._on_start_replay,
+            "replay_control": self._on_replay_control,
+            "get_metrics": self._on_get_metrics,
+            "dump_trace": self._on_dump_trace,
+        }
         self.running = False
 
+    def _init_metrics(self):
+        """Create the server's histograms and gauges."""
+        m = self.metrics
+        self.tick_seconds = m.histogram(
+            "tick_seconds", "Work done per scheduler wakeup")
+        self.physics_seconds = m.histogram(
+            "physics_step_seconds", "Physics step of all sessions")
+        self.detection_seconds = m.histogram(
+            "detection_seconds", "Violation detection per snapshot")
+        self.fanout_seconds = m.histogram(
+            "fanout_seconds", "Encoding and queueing one broadcast")
+        self.send_seconds = m.histogram(
+            "client_send_seconds", "Socket send per message, all clients")
+        self.arduino_age_seconds = m.histogram(
+            "arduino_frame_age_seconds",
+            "Arduino frame receive to physics step applying it",
+            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                     0.5, 1.0, 2.5, 5.0))
+        self.arduino_frames_per_step = m.histogram(
+            "arduino_frames_per_step", "Arduino frames blended into one physics step",
+            buckets=(1, 2, 4, 8, 16, 32))
+        self.loop_lag_seconds = m.histogram(
+            "loop_lag_seconds", "Event-loop heartbeat lag (watchdog)")
+        self.tts_depth = m.histogram(
+            "tts_queue_depth", "Pending speech prompts, sampled every second",
+            buckets=(0, 1, 2, 4, 8, 16))
+        # Input-to-screen stages, all clients; per client in get_metrics
+        self.latency = LatencyStages(m.histogram, "input_")
+
+        m.gauge("clients", "Connected WebSocket clients",
+                lambda: len(self.connected_clients))
+        m.gauge("sessions", "Open simulation sessions",
+                lambda: len(self.sessions.sessions))
+        m.gauge("event_queue_depth", "Snapshots waiting for detection",
+                lambda: self.event_pipeline.queue_depth)
+        m.gauge("client_queue_depth_max", "Deepest client outbound queue",
+                lambda: max((c.queue_depth for c in self.connected_clients.values()),
+                            default=0))
+        m.counter("scheduler_missed_deadlines_total",
+                  "Wakeups later than one physics step",
+                  lambda: self.scheduler.missed_deadlines)
+        m.counter("scheduler_dropped_steps_total",
+                  "Physics steps dropped by the catch-up limit",
+                  lambda: self.scheduler.dropped_steps)
+        m.counter("loop_blocks_total",
+                  "Event-loop blocking episodes caught by the watchdog",
+                  lambda: self.watchdog.blocks if self.watchdog else 0)
+        self.messages_received = m.counter(
+            "client_messages_total", "Client messages handled")
+        self.messages_invalid = m.counter(
+            "client_messages_invalid_total",
+            "Client messages rejected by their schema")
+        self.messages_limited = m.counter(
+            "client_messages_limited_total",
+            "Client messages over the per-client rate limit")
+        self.sessions_rejected = m.counter(
+            "session_joins_rejected_total",
+            "Session joins refused by the session limits")
+        self.controls_coalesced = m.counter(
+            "controls_coalesced_total",
+            "Manual controls merged into ones not yet applied")
+        m.counter("event_snapshots_dropped_total",
+                  "Snapshots dropped because the event queue was full",
+                  lambda: self.event_pipeline.dropped)
+        for name, help_text in (
+                ("frames", "Valid Arduino frames received"),
+                ("corrupt", "Arduino frames failing the checksum or field checks"),
+                ("dropped", "Arduino frames missing from the sequence"),
+                ("resynced", "Serial resyncs to a frame header"),
+                ("overflowed", "Arduino frames dropped from a full input buffer"),
+                ("disconnects", "Arduino links lost"),
+                ("reconnects", "Arduino links reopened after the first")):
+            m.counter(f"serial_{name}_total", help_text,
+                      lambda name=name: self.arduino.stats()[name]
+                      if self.arduino else 0)
+        m.gauge("serial_connected", "1 while the Arduino link is open",
+                lambda: int(bool(self.arduino and self.arduino.connected)))
+        m.gauge("serial_frame_age_seconds",
+                "Time since the last Arduino frame (NaN while down)",
+                lambda: self.arduino.frame_age() if self.arduino else float("nan"))
+
+    @property
+    def car_physics(self):
+        """Car of the default session."""
+        return self.sessions.default.car_physics
+
+    @property
+    def state_manager(self):
+        """State manager of the default session."""
+        return self.sessions.default.state_manager
+
+    @property
+    def current_scene(self):
+        """Scene of the default session."""
+        return self.sessions.default.scene
+
+    def _now(self):
+        return asyncio.get_running_loop().time()
+
     async def handle_connection(self, websocket):
         """Handle a WebSocket connection."""
-        # Add the new client to our set
-        self.connected_clients.add(websocket)
+        # Give the new client its own outbound queue and writer task
+        channel = ClientChannel(websocket, on_send=self.send_seconds.observe,
+                                latency=ClientLatency(self.latency),
+                                limiter=TokenBucket(self.client_rate,
+                                                    self.client_burst))
+        self.connected_clients[websocket] = channel
+        self.sessions.join(channel, DEFAULT_SESSION, self._now())
+        channel.start()
         client_id = id(websocket)  # Generate a unique ID for logging
         logger.info(
             f"Client {client_id} connected. Total clients: {len(self.connected_clients)}")
 
         try:
             # Send initial state to the client
-            await self.send_state(websocket)
+            self.send_state(websocket)
 
             # Handle messages from the client
             async for message in websocket:
@@ -67,91 +274,237 @@ class DrivingSimulatorServer:
         except Exception as e:
             logger.error(f"Unexpected error with client {client_id}: {e}")
         finally:
-            # Remove the client from our set
-            self.connected_clients.remove(websocket)
+            # Remove the client and stop its writer task
+            self.connected_clients.pop(websocket, None)
+            self.sessions.leave(channel, self._now())
+            await channel.close()
             logger.info(
                 f"Client {client_id} disconnected. Total clients: {len(self.connected_clients)}")
 
     async def handle_message(self, websocket, message):
-        """Handle a message from a client."""
-        client_id = id(websocket)  # For consistent logging
+        """Handle a message from a client.
 
+        Messages are validated against their schema, rate limited per
+        client and routed by type through self._handlers. Logging on this
+        path is sampled: a client may send hundreds of controls a second.
+        """
+        channel = self.connected_clients.get(websocket)
+        if channel is None or channel.session is None:
+            return
+
+        msg_type, data, error = parse_message(message)
+        if error is not None:
+            self.messages_invalid.inc()
+            if channel.log_sampler():
+                logger.warning(f"Rejected message from client "
+                               f"{channel.client_id}: {error}")
+            channel.send_event(json.dumps({"type": "error", "message": error}))
+            return
+
+        now = time.monotonic()
+        if msg_type == "manual_control":
+            # Controls merge into the session's mailbox, which is as cheap
+            # as deferring them; they use up the budget but never wait
+            channel.limiter.allow(now)
+            await self._dispatch(channel, msg_type, data)
+            return
+        if channel.deferred or not channel.limiter.allow(now):
+            # Over budget: keep the newest message of each type and handle
+            # them once a token is available, so the last input is not lost
+            self.messages_limited.inc()
+            if not channel.deferred:
+                asyncio.get_running_loop().call_later(
+                    channel.limiter.delay(now), self._handle_deferred, channel)
+            channel.deferred.pop(msg_type, None)  # Keep arrival order
+            channel.deferred[msg_type] = data
+            return
+        await self._dispatch(channel, msg_type, data)
+
+    async def _dispatch(self, channel, msg_type, data):
+        """Run the handler of a validated message."""
+        self.messages_received.inc()
+        if logger.isEnabledFor(logging.DEBUG) and channel.log_sampler():
+            logger.debug(f"Message from client {channel.client_id}: {data}")
+        # Handlers return an awaitable only if they need to wait
+        result = self._handlers[msg_type](channel, data)
+        if result is not None:
+            await result
+
+    def _handle_deferred(self, channel):
+        channel.deferred_task = asyncio.create_task(
+            self._flush_deferred(channel))
+        channel.deferred_task.add_done_callback(self._deferred_done)
+
+    @staticmethod
+    def _deferred_done(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Handling deferred client messages failed: "
+                         f"{task.exception()!r}")
+
+    async def _flush_deferred(self, channel):
+        """Handle the messages held back by the rate limiter."""
+        # Taken only now, so messages arriving meanwhile still replace them
+        deferred, channel.deferred = channel.deferred, {}
+        channel.limiter.allow(time.monotonic())
+        for msg_type, data in deferred.items():
+            if channel.closed or channel.session is None:
+                return
+            await self._dispatch(channel, msg_type, data)
+
+    def _on_manual_control(self, channel, data):
+        # Merged into the session's mailbox; the next physics step applies it
+        if channel.session.controls.pending:
+            self.controls_coalesced.inc()
+        channel.session.controls.post(data["controls"], data.get("seq"),
+                                      time.monotonic())
+
+    def _on_render_report(self, channel, data):
+        # Client rendered a state frame (its clock, milliseconds)
+        channel.latency.on_render(data["seq"], data["received"] / 1000,
+                                  data["rendered"] / 1000, time.monotonic())
+
+    def _on_ack(self, channel, data):
+        # Delta client confirms it holds this frame as a baseline
+        if channel.encoding == ENCODING_DELTA:
+            channel.session.delta_encoder.acknowledge(channel, data["seq"])
+
+    def _on_request_state(self, channel, data):
+        # Client is requesting the current state (e.g. after a reconnect);
+        # delta clients resync from a fresh keyframe
+        self.send_state(channel.websocket)
+
+    def _on_set_scene(self, channel, data):
+        # Change the scene of the client's session
+        session = channel.session
+        scene = data["scene"]
+        if session.set_scene(scene):
+            logger.info(f"Scene of session {session.session_id} changed to "
+                        f"{scene} by client {channel.client_id}")
+
+            # Notify the session's clients about the scene change
+            session.broadcast({"type": "scene_changed", "scene": scene})
+
+    def _on_join_session(self, channel, data):
+        # Move the client to another (possibly new) session
+        session_id = data["session"]
+        if not is_valid_session_id(session_id):
+            channel.send_event(json.dumps(
+                {"type": "error", "message": "Invalid session id"}))
+            return
         try:
-            data = json.loads(message)
-            # Log the received message
-            logger.info(f"Received message from client {client_id}: {data}")
-
-            # Handle different message types
-            if data.get("type") == "set_scene":
-                # Change the scene
-                scene = data.get("scene")
-                if scene in ["highway", "parking_lot", "intersection"]:
-                    self.current_scene = scene
-                    logger.info(
-                        f"Scene changed to {scene} by client {client_id}")
-
-                    # Reset car position when changing scenes
-                    self.car_physics.position = {"x": 0, "y": 0}
-                    self.car_physics.speed = 0
-                    self.car_physics.direction = 0
-                    self.car_physics.gear = "P"
-
-                    # Notify all clients about the scene change
-                    await self.broadcast({"type": "scene_changed", "scene": scene})
-
-            elif data.get("type") == "manual_control":
-                # Apply manual control from the web interface
-                controls = data.get("controls", {})
-                # Log the control commands
-                logger.info(
-                    f"Manual control from client {client_id}: {controls}")
-
-                # Update car physics based on controls
-                if "acceleration" in controls:
-                    self.car_physics.set_acceleration(controls["acceleration"])
-
-                if "steering_angle" in controls:
-                    self.car_physics.set_steering(controls["steering_angle"])
-
-                if "gear" in controls:
-                    # Set gear (P, D, R)
-                    self.car_physics.set_gear(controls["gear"])
-
-                # Debug log current car state
-                logger.debug(f"Current car state: speed={self.car_physics.speed}, "
-                             f"dir={self.car_physics.direction}, "
-                             f"gear={self.car_physics.gear}, "
-                             f"pos={self.car_physics.position}")
-
-            elif data.get("type") == "request_state":
-                # Client is requesting the current state
-                await self.send_state(websocket)
-
-        except json.JSONDecodeError:
-            logger.error(
-                f"Invalid JSON received from client {client_id}: {message}")
-        except Exception as e:
-            logger.error(
-                f"Error handling message from client {client_id}: {e}")
-            # Re-raise to be caught by the outer try block
-            raise
-
-    async def send_state(self, websocket):
-        """Send the current state to a specific client."""
+            session = self.sessions.join(channel, session_id, self._now())
+        except ValueError as e:
+            self.sessions_rejected.inc()
+            channel.send_event(json.dumps(
+                {"type": "error", "message": f"Cannot join session: {e}"}))
+            return
+        logger.info(f"Client {channel.client_id} joined session {session_id}")
+        channel.send_event(json.dumps({
+            "type": "session_joined",
+            "session": session_id,
+            "scene": session.scene
+        }))
+        self.send_state(channel.websocket)
+
+    def _on_set_encoding(self, channel, data):
+        # Client negotiates how it wants state frames encoded
+        encoding = data["encoding"]
+        if encoding in ENCODINGS:
+            channel.encoding = encoding
+            logger.info(
+                f"Client {channel.client_id} switched to {encoding} state frames")
+            self.send_state(channel.websocket)
+
+    def _on_list_recordings(self, channel, data):
+        # Telemetry logs available for replay
+        channel.send_event(json.dumps({
+            "type": "recordings",
+            "files": self.sessions.recordings()
+        }))
+
+    async def _on_start_replay(self, channel, data):
+        # Play a recording back in a new session and join it
         try:
-            state = {
-                "type": "state_update",
-                "car": self.car_physics.get_state(),
-                "scene": self.current_scene
-            }
-            await websocket.send(json.dumps(state))
-            logger.debug(f"Sent state to client {id(websocket)}")
-        except Exception as e:
-            logger.error(f"Error sending state to client {id(websocket)}: {e}")
-            raise
+            replay = await self.sessions.start_replay(
+                data["file"], float(data.get("speed", 1.0)), owner=channel)
+        except (ValueError, OSError) as e:
+            channel.send_event(json.dumps(
+                {"type": "error", "message": f"Cannot replay: {e}"}))
+            return
+        if channel.closed:
+            # Gone while the log was opened; prune the unjoined session
+            replay.idle_since = self._now()
+            return
+        self.sessions.join(channel, replay.session_id, self._now())
+        channel.send_event(json.dumps({
+            "type": "session_joined",
+            "session": replay.session_id,
+            "scene": replay.scene,
+            "replay": {"duration": replay.replay.log.duration}
+        }))
+        self.send_state(channel.websocket)
+
+    def _on_replay_control(self, channel, data):
+        # Scrub, pause or change speed of the client's replay
+        session = channel.session
+        replay = session.replay
+        if replay is not None:
+            if "seek" in data:
+                replay.seek(float(data["seek"]))
+            if "speed" in data:
+                replay.speed = float(data["speed"])
+            if "paused" in data:
+                replay.paused = data["paused"]
+            replay.apply(session.car_physics)
+
+    def _on_get_metrics(self, channel, data):
+        # Admin/diagnostics: current metrics as JSON
+        channel.send_event(json.dumps({
+            "type": "metrics",
+            "metrics": self.metrics.snapshot(),
+            "client_latency": {
+                str(c.client_id): c.latency.snapshot()
+                for c in self.connected_clients.values()},
+            "blocking_sites": (self.watchdog.top_sites()
+                               if self.watchdog else [])
+        }))
+
+    async def _on_dump_trace(self, channel, data):
+        # Admin/diagnostics: export recent spans as a Chrome trace
+        if not tracer.enabled:
+            channel.send_event(json.dumps(
+                {"type": "error", "message": "Tracing is disabled"}))
+            return
+        path = await self.dump_trace(
+            "manual", float(data.get("seconds", self.trace_seconds)))
+        channel.send_event(json.dumps({"type": "trace_dumped", "file": path}))
+
+    def send_state(self, websocket):
+        """Queue the current state of its session for a specific client."""
+        channel = self.connected_clients.get(websocket)
+        if channel is None or channel.session is None:
+            return
+        channel.session.send_state(channel)
+        logger.debug(f"Queued state for client {id(websocket)}")
+
+    def broadcast_state(self):
+        """Queue this tick's state for the clients of every session.
+
+        This never awaits a socket: each client's ClientChannel writer task
+        does the actual sending, so a slow client cannot stall the tick.
+        """
+        start = time.perf_counter()
+        self.sessions.publish()
+        duration = time.perf_counter() - start
+        self.fanout_seconds.observe(duration)
+        tracer.record("publish", start, duration)
+        self._remove_failed_clients()
+
+    def broadcast(self, message):
+        """Queue a message for all connected clients, across sessions.
 
-    async def broadcast(self, message):
-        """Broadcast a message to all connected clients."""
+        Session-scoped messages go through SimSession.broadcast instead.
+        """
         if not self.connected_clients:
             return  # No clients to broadcast to
 
@@ -159,112 +512,121 @@ class DrivingSimulatorServer:
         logger.debug(
             f"Broadcasting message to {len(self.connected_clients)} clients: {message}")
 
-        # Create a list to track clients with failed sends
-        failed_clients = []
-
-        for client in self.connected_clients:
-            try:
-                await client.send(json.dumps(message))
-            except Exception as e:
-                client_id = id(client)
-                logger.error(f"Failed to send to client {client_id}: {e}")
-                failed_clients.append(client)
+        payload = json.dumps(message)
+        for channel in self.connected_clients.values():
+            if not channel.closed:
+                channel.send_event(payload)
+        self._remove_failed_clients()
 
-        # Remove any clients that failed to receive the broadcast
+    def _remove_failed_clients(self):
+        """Drop clients whose writer task failed."""
+        failed_clients = [client for client, channel in self.connected_clients.items()
+                          if channel.closed]
         for failed in failed_clients:
-            if failed in self.connected_clients:
-                self.connected_clients.remove(failed)
-                logger.info(f"Removed client {id(failed)} due to send failure")
+            channel = self.connected_clients.pop(failed)
+            self.sessions.leave(channel, self._now())
+            logger.info(f"Removed client {id(failed)} due to send failure")
 
-    async def update_loop(self):
-        logger.info("Starting update loop")
-        """Main update loop for the simulation."""
-        try:
-            last_time = asyncio.get_event_loop().time()
-            update_count = 0  # Counter for logging purposes
+    def apply_arduino_input(self, dt):
+        """Apply the Arduino frames received during this step's time span.
 
-            while self.running:
-                try:
-                    # Calculate time elapsed
-                    current_time = asyncio.get_event_loop().time()
-                    dt = current_time - last_time
-                    last_time = current_time
-
-                    # Apply friction more aggressively to avoid system instability
-                    if abs(self.car_physics.speed) < 0.1:
-                        self.car_physics.speed = 0
-
-                    # Get data from Arduino if connected
-                    if self.arduino.connected:
-                        arduino_data = self.arduino.get_data()
-                        # Apply Arduino data to car physics
-                        if arduino_data:  # Check if we received valid data
-                            if "acc" in arduino_data:
-                                self.car_physics.set_acceleration(
-                                    int(max(700 - arduino_data["acc"], 0)/4))
-
-                            if "dec" in arduino_data:
-                                self.car_physics.set_deceleration(
-                                    int(max(400 - arduino_data["dec"], 0)/15))
-
-                            if "steeringAngle" in arduino_data:
-                                self.car_physics.set_steering(
-                                    arduino_data["steeringAngle"]*3)
-
-                            if "gear" in arduino_data:
-                                self.car_physics.set_gear(arduino_data["gear"])
-
-                            if "turnSignal" in arduino_data:
-                                self.car_physics.set_turn_signal(
-                                    arduino_data["turnSignal"])
-
-                            if "handbreak" in arduino_data:
-                                self.car_physics.set_handbrake(
-                                    arduino_data["handbreak"])
-
-                            if "turnSignal" in arduino_data:
-                                self.car_physics.set_turn_signal(
-                                    arduino_data["turnSignal"])
-
-                            # Log the applied Arduino data at debug level
-                            logger.debug(
-                                f"Applied Arduino data: {arduino_data}")
-
-                    # Update car physics
-                    old_pos = dict(self.car_physics.position)
-                    self.car_physics.update()
-
-                    # Log if position changes significantly
-                    new_pos = self.car_physics.position
-                    if abs(new_pos["x"] - old_pos["x"]) > 1 or abs(new_pos["y"] - old_pos["y"]) > 1:
-                        logger.debug(f"Car position changed: {old_pos} -> {new_pos}, "
-                                     f"speed={self.car_physics.speed}, dir={self.car_physics.direction}")
-
-                    # Periodically log update count to verify loop is running
-                    update_count += 1
-                    if update_count % 600 == 0:  # Log roughly every 10 seconds
-                        logger.info(
-                            f"Update loop running. Count: {update_count}")
-                    if update_count % 60 == 0:  # Log every second
-                        self.state_manager.get_complete_state()
-
-                    # Broadcast state to all clients
-                    if self.connected_clients:
-                        await self.broadcast({
-                            "type": "state_update",
-                            "car": self.car_physics.get_state(),
-                            "scene": self.current_scene
-                        })
-
-                    # Sleep for a short time to maintain a stable frame rate
-                    # Aiming for approximately 60 FPS
-                    await asyncio.sleep(1/60)
+        Steps without new frames apply the newest one, replacing the
+        blended value of the step before.
+        """
+        end = self.scheduler.step_end or time.monotonic()
+        t = tracer.begin()
+        frames = self.input_buffer.take_until(end)
+        tracer.end("arduino_read", t)
+
+        t = tracer.begin()
+        data = self.input_blender.blend(frames, end - dt, end)
+        if data is None:
+            return  # No frame received yet
+        apply_arduino_data(self.car_physics, data)
+        tracer.end("arduino_map", t)
+        if not frames:
+            return
+        self.sessions.default.input_source = SOURCE_ARDUINO
+        now = time.monotonic()
+        for frame in frames:
+            self.arduino_age_seconds.observe(now - frame["t"])
+        self.arduino_frames_per_step.observe(len(frames))
+        newest = frames[-1]
+        if not newest.get("safe"):  # Not a serial frame; nothing to time
+            self.sessions.default.mark_input("arduino", newest["seq"],
+                                             newest["t"], now)
+
+    def step(self, dt):
+        """Advance every session by one fixed physics step."""
+        # New Arduino input (or the safe input after a disconnect) drives
+        # the default session
+        if self.arduino is not None:
+            self.apply_arduino_input(dt)
+
+        # Update car physics of all sessions; detection snapshots are
+        # staggered across sessions and handled by the event pipeline
+        start = time.perf_counter()
+        self.sessions.step(dt)
+        duration = time.perf_counter() - start
+        self.physics_seconds.observe(duration)
+        tracer.record("physics", start, duration)
+
+        # Periodically log the step count and scheduler health
+        self.step_count += 1
+        physics_hz = self.scheduler.step_hz
+        if self.step_count % (physics_hz * 10) == 0:  # Roughly every 10 seconds
+            logger.info(
+                f"Update loop running. Count: {self.step_count}, "
+                f"sessions: {len(self.sessions.sessions)}, "
+                f"scheduler: {self.scheduler.stats()}")
+        if self.step_count % physics_hz == 0:  # Once per second
+            self.sessions.prune_idle(self._now())
+            self.tts_depth.observe(tts_queue_depth())
+
+    def _on_tick(self, duration):
+        """Record one scheduler wakeup; dump a trace if it was over budget."""
+        self.tick_seconds.observe(duration)
+        if not tracer.enabled:
+            return
+        tracer.record("tick", time.perf_counter() - duration, duration)
+        if duration <= self.trace_budget:
+            return
+        now = self._now()
+        if (self._last_auto_dump is not None
+                and now - self._last_auto_dump < self.trace_cooldown):
+            return
+        if self._dump_task is not None and not self._dump_task.done():
+            return
+        self._last_auto_dump = now
+        logger.warning(
+            f"Tick took {duration * 1000:.1f} ms "
+            f"(budget {self.trace_budget * 1000:.1f} ms), dumping trace")
+        self._dump_task = asyncio.create_task(self.dump_trace("slow_tick"))
+
+    async def dump_trace(self, reason, last_seconds=None):
+        """Write the last seconds of spans as a Chrome trace; returns the path.
+
+        The spans are copied on the loop and serialized in a worker thread.
+        """
+        capture = tracer.capture(last_seconds or self.trace_seconds)
+        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(self.trace_dir, f"trace_{ts}_{reason}.json")
+        await asyncio.to_thread(write_chrome_trace, capture, path)
+        logger.info(f"Trace with {len(capture)} spans written to {path}")
+        return path
 
-                except Exception as e:
-                    # Catch and log errors in the update loop but keep it running
-                    logger.error(f"Error in update cycle: {e}")
-                    await asyncio.sleep(1/10)  # Slower retry rate on error
+    async def update_loop(self):
+        """Main update loop for the simulation.
 
+        Physics runs on a fixed timestep and state is broadcast at the
+        network rate; see FixedStepScheduler.
+        """
+        logger.info(
+            f"Starting update loop (physics {self.scheduler.step_hz} Hz, "
+            f"network {self.scheduler.publish_hz} Hz)")
+        try:
+            await self.scheduler.run(self.step, self.broadcast_state,
+                                     lambda: self.running)
         except asyncio.CancelledError:
             logger.info("Update loop cancelled")
         except Exception as e:
@@ -273,13 +635,22 @@ class DrivingSimulatorServer:
 
     async def start_server(self):
         """Start the WebSocket server."""
-        # Connect to Arduino
-        # self.arduino.connect()
-        # self.arduino.start_reading()
-
-        # Start the update loop
+        # Start the event pipeline and the update loop
         self.running = True
+        if self.watchdog_ms:
+            self.watchdog = LoopWatchdog(asyncio.get_running_loop(),
+                                         threshold=self.watchdog_ms / 1000,
+                                         on_lag=self.loop_lag_seconds.observe)
+            self.watchdog.start()
+        self.event_pipeline.start()
         update_task = asyncio.create_task(self.update_loop())
+        metrics_server = None
+        if self.metrics_port:
+            try:
+                metrics_server = await self.metrics.serve_http(
+                    "127.0.0.1", self.metrics_port)
+            except OSError as e:
+                logger.error(f"Cannot start metrics endpoint: {e}")
 
         try:
             # Start the WebSocket server
@@ -291,6 +662,11 @@ class DrivingSimulatorServer:
                 ping_timeout=10    # Wait 10 seconds for pong response
             ):
                 logger.info(f"Server started at ws://{self.host}:{self.port}")
+                # Hardware and cloud clients come up after the socket is
+                # listening, so clients can connect meanwhile
+                if self.arduino is not None:
+                    self.arduino.start(asyncio.get_running_loop())
+                preload_tts()
                 await asyncio.Future()  # Run forever
         except Exception as e:
             logger.error(f"Server error: {e}")
@@ -302,7 +678,14 @@ class DrivingSimulatorServer:
                 await update_task
             except asyncio.CancelledError:
                 pass
-            self.arduino.disconnect()
+            if metrics_server is not None:
+                metrics_server.close()
+            if self.watchdog is not None:
+                self.watchdog.stop()
+            await self.event_pipeline.stop()
+            self.sessions.close()
+            if self.arduino is not None:
+                self.arduino.disconnect()
             logger.info("Server shutdown")
 
     def run(self):
@@ -325,12 +708,46 @@ def main():
     parser = argparse.ArgumentParser(description='Driving Simulator Server')
     parser.add_argument('--use-arduino', action='store_true',
                         help='Use real Arduino hardware instead of mock')
-    parser.add_argument('--arduino-port', default='/dev/ttyUSB0',
-                        help='Serial port for Arduino connection')
+    parser.add_argument('--arduino-port', default='auto',
+                        help='Serial port for Arduino connection (default: auto, '
+                             'found by USB vendor/product id)')
     parser.add_argument('--host', default='localhost',
                         help='Host to bind the WebSocket server to')
     parser.add_argument('--port', type=int, default=8765,
                         help='Port to bind the WebSocket server to')
+    parser.add_argument('--physics-hz', type=int, default=240,
+                        help='Fixed physics step rate (default: 240)')
+    parser.add_argument('--network-hz', type=int, default=60,
+                        help='State broadcast rate (default: 60)')
+    parser.add_argument('--record', action='store_true',
+                        help='Record every session to a binary telemetry log')
+    parser.add_argument('--telemetry-dir', default='telemetry',
+                        help='Directory for telemetry logs (default: telemetry)')
+    parser.add_argument('--metrics-port', type=int, default=9108,
+                        help='Local HTTP port for Prometheus metrics (0 disables)')
+    parser.add_argument('--trace', action='store_true',
+                        help='Record per-stage spans for Chrome trace export')
+    parser.add_argument('--trace-dir', default='traces',
+                        help='Directory for trace files (default: traces)')
+    parser.add_argument('--trace-budget-ms', type=float, default=None,
+                        help='Tick duration that triggers a trace dump '
+                             '(default: one physics step)')
+    parser.add_argument('--watchdog-ms', type=float, default=100,
+                        help='Event-loop lag reported as blocking, with its '
+                             'stack (default: 100, 0 disables)')
+    parser.add_argument('--input-smoothing', choices=['none', 'ema', 'median'],
+                        default='none',
+                        help='Smooth Arduino steering and pedals (default: none)')
+    parser.add_argument('--input-ema-alpha', type=float, default=0.5,
+                        help='Weight of the newest value for --input-smoothing ema')
+    parser.add_argument('--client-rate', type=float, default=120,
+                        help='Messages per second a client may send (default: 120)')
+    parser.add_argument('--client-burst', type=int, default=60,
+                        help='Messages a client may send at once (default: 60)')
+    parser.add_argument('--max-sessions', type=int, default=64,
+                        help='Sessions that may exist at once (default: 64, 0: no limit)')
+    parser.add_argument('--max-sessions-per-client', type=int, default=4,
+                        help='Sessions one client may create (default: 4, 0: no limit)')
     parser.add_argument('--debug', action='store_true',
                         help='Enable debug logging')
 
@@ -344,7 +761,22 @@ def main():
         use_arduino=args.use_arduino,
         arduino_port=args.arduino_port,
         host=args.host,
-        port=args.port
+        port=args.port,
+        physics_hz=args.physics_hz,
+        network_hz=args.network_hz,
+        record=args.record,
+        telemetry_dir=args.telemetry_dir,
+        metrics_port=args.metrics_port,
+        trace=args.trace,
+        trace_dir=args.trace_dir,
+        trace_budget_ms=args.trace_budget_ms,
+        watchdog_ms=args.watchdog_ms,
+        input_smoothing=None if args.input_smoothing == 'none' else args.input_smoothing,
+        input_ema_alpha=args.input_ema_alpha,
+        client_rate=args.client_rate,
+        client_burst=args.client_burst,
+        max_sessions=args.max_sessions,
+        max_sessions_per_client=args.max_sessions_per_client
     )
     server.run()
 
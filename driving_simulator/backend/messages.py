@@ -0,0 +1,161 @@
+"""
+Inbound client message checks for the driving simulator server.
+Every message type has a schema (field -> type, required, allowed values)
+that is compiled once at import into a flat list of checks, so validating
+a message is a few dict lookups and exact type comparisons. A token bucket
+per client bounds how many messages it can make the server handle, and
+hot-path logging is sampled so a chatty client cannot flood the log.
+"""
+import json
+import math
+
+NUMBER = (int, float)
+# Schema type -> (exact types accepted, name for errors); exact, so that
+# True/False are not accepted as numbers
+_TYPES = {int: ((int,), "an integer"), NUMBER: (NUMBER, "a number"),
+          str: ((str,), "a string"), bool: ((bool,), "a boolean"),
+          dict: ((dict,), "an object")}
+
+# Fields of the manual_control "controls" object (see apply_manual_controls)
+CONTROLS_SCHEMA = {
+    "acceleration": {"type": NUMBER},
+    "deceleration": {"type": NUMBER},
+    "steering_angle": {"type": NUMBER},
+    "gear": {"type": str, "values": ("P", "D", "R")},
+    "turn_signal": {"type": str, "values": ("N", "L", "R")},
+    "handbrake": {"type": bool},
+}
+
+# Message type -> field schema; the "type" field itself is implied and
+# fields not listed are ignored, so older and newer clients keep working
+MESSAGE_SCHEMAS = {
+    "manual_control": {
+        "controls": {"type": dict, "required": True, "schema": CONTROLS_SCHEMA},
+        "seq": {"type": int},
+        "t": {"type": NUMBER},
+    },
+    "render_report": {
+        "seq": {"type": int, "required": True},
+        "received": {"type": NUMBER, "required": True},
+        "rendered": {"type": NUMBER, "required": True},
+    },
+    "ack": {"seq": {"type": int, "required": True}},
+    "set_scene": {"scene": {"type": str, "required": True}},
+    "join_session": {"session": {"type": str, "required": True}},
+    "set_encoding": {"encoding": {"type": str, "required": True}},
+    "request_state": {},
+    "list_recordings": {},
+    "start_replay": {
+        "file": {"type": str, "required": True},
+        "speed": {"type": NUMBER},
+    },
+    "replay_control": {
+        "seek": {"type": NUMBER},
+        "speed": {"type": NUMBER},
+        "paused": {"type": bool},
+    },
+    "get_metrics": {},
+    "dump_trace": {"seconds": {"type": NUMBER}},
+}
+
+_SPEC_KEYS = {"type", "required", "values", "schema"}
+
+
+def compile_schema(schema, path=""):
+    """Turn a field schema into a validator returning an error or None."""
+    checks = []
+    for field, spec in schema.items():
+        unknown = set(spec) - _SPEC_KEYS
+        if unknown:
+            raise ValueError(f"Unknown schema keys for {path}{field}: {unknown}")
+        nested = spec.get("schema")
+        types, type_name = _TYPES[spec["type"]]
+        checks.append((field, types, type_name, spec.get("required", False),
+                       frozenset(spec["values"]) if "values" in spec else None,
+                       compile_schema(nested, f"{path}{field}.") if nested else None))
+    checks = tuple(checks)
+
+    def validate(data):
+        for field, types, type_name, required, values, nested in checks:
+            value = data.get(field)
+            if value is None:
+                if required:
+                    return f"missing {path}{field}"
+                continue
+            if type(value) not in types:
+                return f"{path}{field} must be {type_name}"
+            # json.loads accepts NaN and Infinity
+            if type(value) is float and not math.isfinite(value):
+                return f"{path}{field} must be finite"
+            if values is not None and value not in values:
+                return f"invalid {path}{field} {value!r}"
+            if nested is not None:
+                error = nested(value)
+                if error:
+                    return error
+        return None
+
+    return validate
+
+
+VALIDATORS = {msg_type: compile_schema(schema)
+              for msg_type, schema in MESSAGE_SCHEMAS.items()}
+
+
+def parse_message(message):
+    """Decode and validate a client message.
+
+    Returns (message type, data, error); error is None for a valid message.
+    """
+    try:
+        data = json.loads(message)
+    except (TypeError, ValueError):
+        return None, None, "invalid JSON"
+    if not isinstance(data, dict):
+        return None, None, "message must be an object"
+    msg_type = data.get("type")
+    validate = VALIDATORS.get(msg_type)
+    if validate is None:
+        return msg_type, data, f"unknown message type {msg_type!r}"
+    return msg_type, data, validate(data)
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, in bursts of `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = None
+
+    def _refill(self, now):
+        if self.updated is not None:
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def allow(self, now):
+        """Take a token if one is available."""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self, now):
+        """Seconds until the next token is available."""
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class LogSampler:
+    """Lets one in every `every` events through, plus the first."""
+
+    def __init__(self, every=100):
+        self.every = every
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        return self.count % self.every == 1 or self.every == 1
@@ -0,0 +1,182 @@
+"""
+Live metrics for the driving simulator server.
+Histograms use preallocated bucket arrays, so recording a sample is a
+bisect plus a couple of in-place increments and can stay on in
+production. Metrics are exposed in Prometheus text format on a small
+local HTTP endpoint and as a dict for the admin WebSocket message.
+"""
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Default latency buckets in seconds: 10 us .. 1 s
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed set of upper bounds."""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.bounds = tuple(buckets)
+        # One slot per bound plus +Inf, allocated once
+        self.counts = array("Q", bytes(8 * (len(self.bounds) + 1)))
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Record one sample."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate quantile `q` (0..1) as the upper bound of its bucket.
+
+        Returns None if it falls beyond the largest bound.
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else None
+        return None
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        cumulative = 0
+        for bound, n in zip(self.bounds, self.counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum:.9g}")
+        lines.append(f"{self.name}_count {self.count}")
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Gauge:
+    """Value read at scrape time, either set directly or from a callback."""
+
+    def __init__(self, name, help_text, callback=None):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        if self.callback is not None:
+            try:
+                return float(self.callback())
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {e}")
+                return float("nan")
+        return self.value
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} gauge")
+        lines.append(f"{self.name} {self.get():.9g}")
+
+    def snapshot(self):
+        value = self.get()
+        return None if value != value else value  # NaN is not valid JSON
+
+
+class Counter(Gauge):
+    """Monotonic counter; like a gauge but only ever increases."""
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} counter")
+        lines.append(f"{self.name} {self.get():.9g}")
+
+
+class MetricsRegistry:
+    """Named collection of metrics."""
+
+    def __init__(self, prefix="drivesim_"):
+        self.prefix = prefix
+        self.metrics = {}
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help_text, buckets))
+
+    def gauge(self, name, help_text, callback=None):
+        return self._add(Gauge(self.prefix + name, help_text, callback))
+
+    def counter(self, name, help_text, callback=None):
+        return self._add(Counter(self.prefix + name, help_text, callback))
+
+    def render_prometheus(self):
+        """All metrics in Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict."""
+        return {name[len(self.prefix):]: metric.snapshot()
+                for name, metric in self.metrics.items()}
+
+    async def serve_http(self, host="127.0.0.1", port=9108):
+        """Start a minimal HTTP server answering GET /metrics.
+
+        Returns the asyncio Server; close it to stop serving.
+        """
+        async def handle(reader, writer):
+            try:
+                request = await asyncio.wait_for(reader.readline(), 5)
+                # Drain the request headers
+                while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                    pass
+                parts = request.decode("latin-1").split()
+                if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                    body = self.render_prometheus().encode("utf-8")
+                    status = "200 OK"
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    body = b"Not found\n"
+                    status = "404 Not Found"
+                    content_type = "text/plain"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+                    .encode("latin-1") + body)
+                await writer.drain()
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        logger.info(f"Metrics available at http://{host}:{port}/metrics")
+        return server
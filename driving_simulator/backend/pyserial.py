@@ -1,29 +1,162 @@
+import logging
+import math
+import random
 import serial
 import struct
 import threading
 import time
 
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class FrameParser:
+    """Splits a serial byte stream into checked frames.
+
+    Frame (see Arduino/main/SerialToPython.cpp), 18 bytes:
+        0xAA header, uint8 sequence, float acc, float dec, int32 steering,
+        uint8 handbreak, char gear, char turnSignal,
+        uint8 checksum = sum of the bytes between header and checksum & 0xFF
+
+    feed() takes whatever bytes are available and returns every complete
+    frame in them; a partial frame stays buffered for the next call. A
+    header byte whose frame fails the checksum (e.g. 0xAA inside a float)
+    is skipped and the scan continues one byte later. Line noise passes an
+    8-bit checksum once in 256 tries, so a frame must also hold a known
+    handbreak, gear and turn signal byte and finite pedal values.
+    """
+
+    STRUCT = struct.Struct("<BBffiBccB")
+    SIZE = STRUCT.size
+    HDR = 0xAA
+    GEARS = b"PDRN"
+    TURN_SIGNALS = b"NLR"
+
+    def __init__(self):
+        self._buf = bytearray()
+        self.frames = 0     # Valid frames
+        self.corrupt = 0    # Candidate frames that failed the checksum or field checks
+        self.dropped = 0    # Frames missing from the sender's sequence
+        self.resynced = 0   # Times bytes were skipped to find a header
+        self._last_seq = None
+
+    def feed(self, data):
+        """Add received bytes; returns the unpacked frames now complete."""
+        buf = self._buf
+        buf += data
+        frames = []
+        pos, end, size = 0, len(buf), self.SIZE
+        while True:
+            start = buf.find(self.HDR, pos)
+            if start < 0:
+                if pos < end:
+                    self.resynced += 1
+                pos = end
+                break
+            if start != pos:
+                self.resynced += 1
+            if end - start < size:
+                pos = start
+                break
+            if (sum(buf[start + 1:start + size - 1]) & 0xFF != buf[start + size - 1]
+                    or buf[start + 14] > 1
+                    or buf[start + 15] not in self.GEARS
+                    or buf[start + 16] not in self.TURN_SIGNALS):
+                self.corrupt += 1
+                pos = start + 1
+                continue
+            frame = self.STRUCT.unpack_from(buf, start)
+            if not (math.isfinite(frame[2]) and math.isfinite(frame[3])):
+                self.corrupt += 1
+                pos = start + 1
+                continue
+            seq = frame[1]
+            if self._last_seq is not None:
+                self.dropped += (seq - self._last_seq - 1) & 0xFF
+            self._last_seq = seq
+            frames.append(frame)
+            pos = start + size
+        del buf[:pos]
+        self.frames += len(frames)
+        return frames
+
+    def reset(self):
+        """Forget buffered bytes and the sequence, e.g. after reconnecting.
+
+        The counters are kept.
+        """
+        self._buf.clear()
+        self._last_seq = None
+
+    def stats(self):
+        return {"frames": self.frames, "corrupt": self.corrupt,
+                "dropped": self.dropped, "resynced": self.resynced}
+
+
+def frame_values(frame, out):
+    """Store an unpacked frame in `out` under the controls.py input keys."""
+    _, _, acc, dec, steering_angle, handbreak, gear, turn_signal, _ = frame
+    out["acc"] = acc
+    out["dec"] = dec
+    out["steeringAngle"] = steering_angle
+    out["handbreak"] = bool(handbreak)
+    # FrameParser only passes known ASCII letters; never raise on a byte
+    out["gear"] = gear.decode('ascii', errors='replace')
+    out["turnSignal"] = turn_signal.decode('ascii', errors='replace')
+    return out
+
 
 class ArduinoReader:
-    """Continuously reads binary packets from an Arduino."""
+    """Continuously reads binary packets from an Arduino.
 
-    _FMT = "<BffiBcc"         # header, float, float, float   ⇒ 1+4+4+1 = 10 bytes
-    _SIZE = struct.calcsize(_FMT)
-    _HDR = 0xAA
-    connected = True
+    The link is supervised like AsyncSerialTransport's: when the port
+    fails (unplugged board) or goes silent, the reader thread publishes
+    `safe_frame` once and reopens the port with exponential backoff.
+    """
 
-    def __init__(self, baud=115200):
-        self._ser = serial.Serial("/dev/tty.usbmodem101", baud, timeout=1)
-        time.sleep(2)         # let Arduino reset
+    def __init__(self, port="/dev/tty.usbmodem101", baud=115200, reset_delay=2.0,
+                 safe_frame=None, stale_after=2.0, min_backoff=0.2, max_backoff=5.0):
+        """
+        Args:
+            port (str): Serial device path
+            baud (int): Line speed
+            reset_delay (float): Wait after opening for the Arduino to reset
+                (0 for emulators)
+            safe_frame (dict): Input values published once whenever the link
+                goes down, e.g. controls.SAFE_ARDUINO_DATA
+            stale_after (float): Seconds without a frame after which the open
+                port is treated as lost and reopened (0 disables)
+            min_backoff (float): First delay between reconnect attempts
+            max_backoff (float): Largest delay between reconnect attempts
+        """
+        self.port = port
+        self.baud = baud
+        self.reset_delay = reset_delay
+        self.safe_frame = safe_frame
+        self.stale_after = stale_after
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
         self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
         self._vals = dict(acc=0.0,
                           dec=0.0,
                           steeringAngle=0,
                           handbreak=False,
                           gear='N',
-                          turnSignal='N'
+                          turnSignal='N',
+                          seq=0,       # Receive sequence number of this frame
+                          t=None,      # Its time.monotonic() receive time
+                          safe=False   # True for the safe input after a disconnect
                           )
-        self._run = True
+        self.last_frame_time = None  # time.monotonic() of the last frame
+        self.seq = 0                 # Number of inputs published so far
+        self.superseded = 0          # Frames replaced by a newer one of the same read
+        self.parser = FrameParser()
+        self.connects = 0            # Successful opens
+        self.disconnects = 0         # Links lost after being open
+        self._ser = None
+        self._stop = threading.Event()
+        self._open()  # The first open fails loudly, as before
         self._t = threading.Thread(target=self._reader, daemon=True)
         self._t.start()
 
@@ -35,41 +168,124 @@ class ArduinoReader:
     def get_gear(self): return self._vals["gear"]
     def get_turnSignal(self): return self._vals["turnSignal"]
 
+    @property
+    def connected(self):
+        return self._ser is not None
+
     def get_data(self):
         with self._lock:
             return self._vals.copy()
 
+    def read_into(self, out):
+        """Copy the newest input into the dict `out`; returns its receive time."""
+        with self._lock:
+            out.update(self._vals)
+            return self._vals["t"]
+
+    def wait_frame(self, seq, timeout=None):
+        """Block until an input newer than `seq` arrives (or `timeout`).
+
+        Returns the newest sequence number, equal to `seq` on timeout.
+        """
+        with self._new_frame:
+            self._new_frame.wait_for(lambda: self.seq != seq, timeout)
+            return self.seq
+
+    def stats(self):
+        """Parser counters plus superseded frames and connection counts."""
+        stats = self.parser.stats()
+        stats["superseded"] = self.superseded
+        stats["reconnects"] = max(0, self.connects - 1)
+        stats["disconnects"] = self.disconnects
+        return stats
+
     def close(self):
-        self._run = False
+        self._stop.set()
         self._t.join()
-        self._ser.close()
+        if self._ser is not None:
+            self._ser.close()
+            self._ser = None
 
     # ---------- background thread ----------
+    def _open(self):
+        self._ser = serial.Serial(self.port, self.baud, timeout=1)
+        self._stop.wait(self.reset_delay)  # let Arduino reset
+        # Bytes of the previous connection say nothing about this one
+        self.parser.reset()
+        self.connects += 1
+        self._opened = time.monotonic()
+
+    def _drop(self, reason):
+        """Close a lost port and publish the safe input."""
+        logger.error(f"Arduino link on {self.port} lost: {reason}")
+        try:
+            self._ser.close()
+        except (serial.SerialException, OSError):
+            pass
+        self._ser = None
+        self.disconnects += 1
+        if self.safe_frame is not None:
+            with self._new_frame:
+                self.seq += 1
+                self._vals.update(self.safe_frame, seq=self.seq,
+                                  t=time.monotonic(), safe=True)
+                self._new_frame.notify_all()
+
+    def _reconnect(self):
+        """Reopen the port with exponential backoff until it works or close()."""
+        backoff = self.min_backoff
+        while not self._stop.is_set():
+            try:
+                self._open()
+            except (serial.SerialException, OSError) as e:
+                if backoff == self.min_backoff:  # Log once, not every attempt
+                    logger.error(f"Arduino not available ({e}); "
+                                 f"retrying in the background")
+                # Jitter keeps several stations from retrying in lockstep
+                self._stop.wait(backoff * random.uniform(0.8, 1.2))
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            logger.info(f"Reading Arduino frames from {self.port}")
+            return
+
     def _reader(self):
-        while self._run:
-            # look for header byte
-            if self._ser.read(1) != bytes([self._HDR]):
+        while not self._stop.is_set():
+            if self._ser is None:
+                self._reconnect()
+                continue
+            try:
+                # Everything already received, or block (up to the timeout) for one byte
+                data = self._ser.read(self._ser.in_waiting or 1)
+            except (serial.SerialException, OSError) as e:
+                self._drop(f"read failed: {e}")
+                continue
+            now = time.monotonic()
+            if not data:
+                if (self.stale_after and now - max(self._opened, self.last_frame_time or 0)
+                        > self.stale_after):
+                    self._drop(f"no frames for {self.stale_after:g}s")
                 continue
-            pkt = self._ser.read(self._SIZE - 1)   # rest of frame
-            if len(pkt) != self._SIZE - 1:
+            frames = self.parser.feed(data)
+            if not frames:
                 continue
-            _, _acc, _dec, _steeringAngle, _handbreak, _gear, _turnSignal = struct.unpack(
-                self._FMT, bytes([self._HDR]) + pkt)
-            with self._lock:
-                self._vals.update(
-                    acc=_acc,
-                    dec=_dec,
-                    steeringAngle=_steeringAngle,
-                    handbreak=bool(_handbreak),
-                    gear=_gear.decode('utf-8'),
-                    turnSignal=_turnSignal.decode('utf-8')
-                )
+            # Only the newest frame is published; seq still counts every
+            # frame, so a consumer can tell how many it skipped
+            with self._new_frame:
+                self.seq += len(frames)
+                self.superseded += len(frames) - 1
+                frame_values(frames[-1], self._vals)
+                self._vals["seq"] = self.seq
+                self._vals["t"] = now
+                self._vals["safe"] = False
+                self.last_frame_time = now
+                self._new_frame.notify_all()
 
 
 # -------------- usage demo --------------
 if __name__ == "__main__":
     ard = ArduinoReader()        # mac/Linux
     # ard = ArduinoReader("COM7")              # Windows
+    # ard = ArduinoReader(path, reset_delay=0)  # arduino_emulator.py pty
     try:
         while True:
             print("accel =", ard.get_acceleration(),
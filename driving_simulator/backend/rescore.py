@@ -0,0 +1,249 @@
+"""
+Offline re-scoring of recorded telemetry against the detection rules.
+Telemetry logs (see telemetry_log.py) are memory-mapped straight into NumPy
+columns, and every rule of a ruleset is evaluated as boolean array
+expressions over all rows at once. Comparing a candidate rules config with
+a baseline shows how a threshold change would have affected past drives
+without replaying them. Files are spread across a process pool.
+
+Rows are sampled at the live detection rate (1 Hz, like the server) by
+default; --detect-hz 0 scores every recorded row.
+
+CLI
+---
+    python rescore.py telemetry/*.dstl --set overspeed=200
+    python rescore.py telemetry/*.dstl --baseline old_rules.json --jobs 16
+"""
+import argparse
+import json
+import operator
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from rules import RULES_PATH, load_config, rules_for_scene, with_threshold
+from telemetry_log import (GEARS, HEADER_STRUCT, MAGIC, RECORD_STRUCT,
+                           TURN_SIGNALS, VERSION)
+
+# Same layout as telemetry_log.RECORD_STRUCT
+RECORD_DTYPE = np.dtype([
+    ("t_ms", "<u4"), ("flags", "u1"),
+    ("acceleration_rate", "<f2"), ("deceleration_rate", "<f2"),
+    ("steering_angle", "<f2"), ("x", "<f4"), ("y", "<f4"),
+    ("speed", "<f2"), ("direction", "<f2"), ("pad", "V1"),
+])
+assert RECORD_DTYPE.itemsize == RECORD_STRUCT.size
+
+# Categorical columns hold codes; string thresholds are mapped to them
+CATEGORIES = {"gear": GEARS, "turn_signal": TURN_SIGNALS}
+
+_OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt,
+        "<=": operator.le, "==": operator.eq, "!=": operator.ne}
+
+
+def load_columns(path, detect_hz=1.0):
+    """Memory-map a telemetry log and return (session id, columns).
+
+    Args:
+        path (str): Telemetry log (.dstl)
+        detect_hz (float): Keep the first row of every 1/detect_hz seconds,
+            like the live detector; 0 keeps every row
+
+    Returns:
+        (str, dict) session id and a dict of equally long NumPy arrays
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER_STRUCT.size)
+    magic, version, record_size, _, _, session_id = HEADER_STRUCT.unpack(header)
+    if magic != MAGIC or version != VERSION or record_size != RECORD_STRUCT.size:
+        raise ValueError(f"{path} is not a supported telemetry log")
+    session_id = session_id.rstrip(b"\0").decode("utf-8")
+
+    records = (os.path.getsize(path) - HEADER_STRUCT.size) // record_size
+    if records <= 0:
+        return session_id, {}
+    rec = np.memmap(path, dtype=RECORD_DTYPE, mode="r",
+                    offset=HEADER_STRUCT.size, shape=(records,))
+
+    if detect_hz:
+        # First row of every detection period (t_ms is non-decreasing)
+        period = np.floor_divide(rec["t_ms"], int(1000 / detect_hz))
+        rec = rec[np.flatnonzero(np.diff(period, prepend=-1))]
+
+    flags = rec["flags"]
+    columns = {
+        "t": rec["t_ms"] / 1000.0,
+        "source": flags & 0b11,
+        "gear": (flags >> 2) & 0b11,
+        "turn_signal": np.minimum((flags >> 4) & 0b11, 2),
+        "handbrake": ((flags >> 6) & 1).astype(bool),
+    }
+    for name in ("acceleration_rate", "deceleration_rate", "steering_angle",
+                 "x", "y", "speed", "direction"):
+        columns[name] = rec[name].astype(np.float32)
+    return session_id, columns
+
+
+def _operand(columns, name, n, default):
+    """Column `name`, or a constant array if it is not recorded."""
+    col = columns.get(name)
+    if col is None:
+        return None if default is None else np.full(n, default)
+    return col
+
+
+def _threshold(columns, cond, n):
+    if "threshold_field" in cond:
+        return _operand(columns, cond["threshold_field"], n,
+                        cond.get("threshold_default", np.nan))
+    threshold = cond["threshold"]
+    vocabulary = CATEGORIES.get(cond["field"])
+    if vocabulary is not None and isinstance(threshold, str):
+        # Unknown labels get a code no row has
+        return vocabulary.index(threshold) if threshold in vocabulary else -1
+    return threshold
+
+
+def condition_mask(columns, cond, n):
+    """Boolean mask of the rows meeting one rule condition.
+
+    Mirrors the scalar engine: a field that is not recorded (and has no
+    default) never matches a comparison and counts as falsy.
+    """
+    op = cond["op"]
+    col = _operand(columns, cond["field"], n, cond.get("default"))
+    if op in ("truthy", "falsy"):
+        truthy = np.zeros(n, bool) if col is None else col.astype(bool)
+        return truthy if op == "truthy" else ~truthy
+    if col is None or cond.get("transform") in ("len", "sum"):
+        # Sequence-valued fields are never recorded in telemetry
+        return np.zeros(n, bool)
+    if cond.get("transform") == "abs":
+        col = np.abs(col)
+    return _OPS[op](col, _threshold(columns, cond, n))
+
+
+def _sustained(mask, t, duration):
+    """Rows where `mask` has held for `duration` seconds (for_ms rules)."""
+    starts = mask & ~np.concatenate(([False], mask[:-1]))
+    # Start time of the run each row belongs to
+    run_start = np.maximum.accumulate(np.where(starts, t, -np.inf))
+    return mask & (t - run_start >= duration)
+
+
+def evaluate_columns(rules, columns, scene=None):
+    """Evaluate a ruleset over columns; returns {event: boolean mask}."""
+    n = len(next(iter(columns.values()))) if columns else 0
+    masks = {}
+    claimed = {}  # Exclusive group -> rows already taken by a higher rule
+    for rule in rules_for_scene(rules, scene):
+        mask = np.ones(n, bool)
+        for cond in rule["when"]:
+            mask &= condition_mask(columns, cond, n)
+        if rule.get("for_ms") and n:
+            # Timed on the scored rows, so coarser at low --detect-hz
+            mask = _sustained(mask, columns["t"], rule["for_ms"] / 1000)
+        group = rule.get("exclusive")
+        if group is not None:
+            taken = claimed.setdefault(group, np.zeros(n, bool))
+            mask &= ~taken
+            taken |= mask
+        event = rule["id"]
+        masks[event] = masks[event] | mask if event in masks else mask
+    return masks
+
+
+def rescore_file(path, rules, baseline=None, scene=None, detect_hz=1.0):
+    """Score one log with `rules` and optionally a baseline ruleset.
+
+    Returns a JSON-serializable summary with per-event counts and, with a
+    baseline, per-event changes (rows gained/lost by the new rules).
+    """
+    session_id, columns = load_columns(path, detect_hz)
+    result = {"file": path, "session": session_id,
+              "rows": len(columns.get("t", ())), "counts": {}}
+    if not columns:
+        return result
+    masks = evaluate_columns(rules, columns, scene)
+    result["counts"] = {ev: int(m.sum()) for ev, m in masks.items()}
+
+    if baseline is not None:
+        old = evaluate_columns(baseline, columns, scene)
+        result["baseline"] = {ev: int(m.sum()) for ev, m in old.items()}
+        diff = {}
+        none = np.zeros(result["rows"], bool)
+        for ev in sorted(set(masks) | set(old)):
+            new_mask = masks.get(ev, none)
+            old_mask = old.get(ev, none)
+            gained = int((new_mask & ~old_mask).sum())
+            lost = int((old_mask & ~new_mask).sum())
+            if gained or lost:
+                diff[ev] = {"gained": gained, "lost": lost}
+        result["diff"] = diff
+    return result
+
+
+def _merge(total, counts):
+    for ev, n in counts.items():
+        total[ev] = total.get(ev, 0) + n
+
+
+def main():
+    p = argparse.ArgumentParser(description="Re-score recorded telemetry against detection rules")
+    p.add_argument("logs", nargs="+", help="Telemetry logs (.dstl)")
+    p.add_argument("--rules", default=RULES_PATH,
+                   help="Rules config to score with (default: rules.json)")
+    p.add_argument("--ruleset", default="simulator",
+                   help="Ruleset in the config (default: simulator)")
+    p.add_argument("--baseline",
+                   help="Rules config to compare against (default: --rules "
+                        "before --set overrides)")
+    p.add_argument("--set", action="append", default=[], metavar="RULE=THRESHOLD",
+                   help="Override a rule's threshold, e.g. overspeed=200")
+    p.add_argument("--scene", help="Scene whose rules apply (default: '*' rules)")
+    p.add_argument("--detect-hz", type=float, default=1.0,
+                   help="Rows scored per second (default 1, like the server; 0 = all)")
+    p.add_argument("--jobs", type=int, default=os.cpu_count(),
+                   help="Worker processes")
+    args = p.parse_args()
+
+    config = load_config(args.rules)
+    baseline = None
+    if args.baseline:
+        baseline = load_config(args.baseline)["rulesets"][args.ruleset]
+    elif args.set:
+        baseline = config["rulesets"][args.ruleset]
+    for override in args.set:
+        rule_id, _, value = override.partition("=")
+        try:
+            value = float(value)
+        except ValueError:
+            pass  # String thresholds, e.g. turn_signal labels
+        config = with_threshold(config, args.ruleset, rule_id, value)
+    rules = config["rulesets"][args.ruleset]
+
+    t0 = time.perf_counter()
+    n = len(args.logs)
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        results = list(pool.map(rescore_file, args.logs, [rules] * n,
+                                [baseline] * n, [args.scene] * n,
+                                [args.detect_hz] * n, chunksize=max(1, n // 64)))
+    elapsed = time.perf_counter() - t0
+
+    totals = {"files": n, "rows": 0, "counts": {}}
+    if baseline is not None:
+        totals["baseline"] = {}
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+        totals["rows"] += result["rows"]
+        _merge(totals["counts"], result["counts"])
+        if baseline is not None:
+            _merge(totals["baseline"], result.get("baseline", {}))
+    print(json.dumps({"total": totals}, ensure_ascii=False))
+    print(f"Scored {totals['rows']} rows from {n} logs in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
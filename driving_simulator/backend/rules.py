@@ -0,0 +1,476 @@
+"""
+Declarative rule engine for driving violation detection.
+Rules live in rules.json, grouped in rulesets (the simulator server and the
+software/ acquisition scripts each have one). At load time every ruleset is
+compiled into one Python function that branches on the scene, with
+thresholds inlined, so evaluating a sample is a single call that only runs
+the rules of its scene. It returns a tuple of event codes; the common
+no-event case returns the empty tuple without allocating.
+
+Rule format:
+    {"id": "overspeed",            event code reported when the rule fires
+     "scenes": ["highway"],        scenes it applies to; "*" means every scene
+     "priority": 30,               higher first; also orders reported events
+     "exclusive": "primary",       optional: of the rules sharing this group,
+                                   only the highest-priority match fires
+     "for_ms": 300,                optional: conditions must have held for
+                                   this long (sustained rule, see below)
+     "when": [conditions]}         all must hold
+
+Condition format:
+    {"field": "speed",             key of the sample dict
+     "transform": "abs",           optional: abs, len or sum of the value
+     "op": ">",                    >, >=, <, <=, ==, != (against "threshold"
+                                   or the value of "threshold_field"),
+                                   or truthy / falsy
+     "threshold": 100,
+     "threshold_field": "...",     compare against another sample field
+     "default": 0,                 optional value for a missing field
+     "threshold_default": 0}       optional value for a missing threshold_field
+A missing field without a default makes a comparison false.
+
+Sustained rules need the sample time in d["t"] (seconds) and a per-session
+state dict, passed as `evaluate(d, scene, state)`; features.FeatureState
+provides both (sample["t"] and .rule_state). Without a state they fire as
+soon as their conditions hold. Conditions may use the streaming features
+from features.py (configured under "features" in rules.json).
+
+Thresholds can be swapped at runtime (RuleEngine.swap / set_threshold, or
+by editing rules.json): the new rules are compiled first and then replace
+the old ones in a single assignment, so a sample never sees a mix.
+
+Run `python rules.py` to check parity with the old hardcoded detectors and
+measure the per-sample cost.
+"""
+import copy
+import json
+import logging
+import os
+import threading
+import time
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json")
+WILDCARD = "*"
+_NAN = float("nan")
+
+COMPARATORS = (">", ">=", "<", "<=", "==", "!=")
+UNARY_OPS = ("truthy", "falsy")
+TRANSFORMS = ("abs", "len", "sum")
+
+
+def _condition_source(cond, fast):
+    """Python expression for one condition over the sample dict `d`.
+
+    The fast variant indexes `d` directly and raises KeyError for a missing
+    field; the safe variant uses `get`, with missing numeric fields read as
+    NaN so every ordering comparison is false without a None check.
+    """
+    def read(name, default):
+        if fast:
+            return f"d[{name!r}]"
+        return f"get({name!r}, {default})" if default else f"get({name!r})"
+
+    field = cond["field"]
+    op = cond["op"]
+    default = repr(cond["default"]) if "default" in cond else None
+
+    if op in UNARY_OPS:
+        value = read(field, default)
+        return value if op == "truthy" else f"not {value}"
+    if op not in COMPARATORS:
+        raise ValueError(f"Unknown comparator {op!r}")
+
+    transform = cond.get("transform")
+    if transform is not None and transform not in TRANSFORMS:
+        raise ValueError(f"Unknown transform {transform!r}")
+    if "threshold_field" in cond:
+        threshold = read(cond["threshold_field"],
+                         repr(cond["threshold_default"])
+                         if "threshold_default" in cond else "_nan")
+    else:
+        threshold = cond["threshold"]
+        if not isinstance(threshold, (int, float, str, bool)):
+            raise ValueError(f"Invalid threshold {threshold!r}")
+        threshold = repr(threshold)
+
+    if transform in ("len", "sum") or op == "!=":
+        # Sequences and != need an explicit presence check
+        value = f"{transform}(_v)" if transform else "_v"
+        return (f"((_v := {read(field, default)}) is not None "
+                f"and {value} {op} {threshold})")
+
+    # Ordering and == against a present value; NaN/None never match
+    value = read(field, default or "_nan")
+    if transform == "abs":
+        if op in ("<", "<=") and "threshold_field" not in cond:
+            # Range check instead of a call to abs()
+            return f"-{threshold} {op} {value} {op} {threshold}"
+        if op in (">", ">=") and "threshold_field" not in cond:
+            low = "<" if op == ">" else "<="
+            return f"((_v := {value}) {op} {threshold} or _v {low} -{threshold})"
+        value = f"abs({value})"
+    return f"{value} {op} {threshold}"
+
+
+def _rule_source(rule, fast):
+    conditions = rule.get("when") or []
+    if not conditions:
+        raise ValueError(f"Rule {rule.get('id')!r} has no conditions")
+    source = " and ".join(_condition_source(c, fast) for c in conditions)
+    if not rule.get("for_ms"):
+        return source
+    t = "d['t']" if fast else "get('t')"
+    return (f"_held(state, {rule_key(rule)!r}, {source}, {t}, "
+            f"{rule['for_ms'] / 1000!r})")
+
+
+def rule_key(rule):
+    """Key of a sustained rule's start time in the session state."""
+    return f"{rule['id']}@{','.join(rule.get('scenes', [WILDCARD]))}"
+
+
+def _held(state, key, active, t, duration):
+    """Whether a condition has been active for `duration` seconds.
+
+    Tracks when the condition became active in `state`; without a state
+    or a sample time the condition is taken as is.
+    """
+    if state is None or t is None:
+        return active
+    if not active:
+        state.pop(key, None)
+        return False
+    return t - state.setdefault(key, t) >= duration
+
+
+def _emit(rule, first):
+    # The first block of a scene cannot follow a match: assign, no concat
+    return (f"events = ({rule['id']!r},)" if first
+            else f"events += ({rule['id']!r},)")
+
+
+def _held_source(rule, pad, first):
+    """Fast-path statements for a sustained rule, with _held inlined.
+
+    Only touches the state when the conditions hold or a start time is
+    recorded, so a quiet sample costs one comparison and a dict truth test.
+    """
+    conditions = " and ".join(_condition_source(c, True) for c in rule["when"])
+    return [f"{pad}if {conditions}:",
+            f"{pad}    if state is None or (_t := d['t']) - state.setdefault("
+            f"{rule_key(rule)!r}, _t) >= {rule['for_ms'] / 1000!r}:",
+            f"{pad}        {_emit(rule, first)}",
+            f"{pad}elif state:",
+            f"{pad}    state.pop({rule_key(rule)!r}, None)"]
+
+
+def _body_source(rules, fast, indent):
+    """Statements adding the ids of matching rules to `events`."""
+    pad = " " * indent
+    lines = []
+    done_groups = set()
+    for rule in rules:
+        first = not lines
+        group = rule.get("exclusive")
+        if group is None:
+            if fast and rule.get("for_ms") and rule.get("when"):
+                lines += _held_source(rule, pad, first)
+                continue
+            lines.append(f"{pad}if {_rule_source(rule, fast)}:")
+            lines.append(f"{pad}    {_emit(rule, first)}")
+            continue
+        if group in done_groups:
+            continue
+        # One if/elif chain per exclusive group, at its best rule's position
+        done_groups.add(group)
+        keyword = "if"
+        for member in rules:
+            if member.get("exclusive") == group:
+                lines.append(f"{pad}{keyword} {_rule_source(member, fast)}:")
+                lines.append(f"{pad}    {_emit(member, first)}")
+                keyword = "elif"
+    return lines or [f"{pad}pass"]
+
+
+def rules_for_scene(rules, scene=None):
+    """Rules that apply in `scene`, highest priority first.
+
+    `None` (or an unknown scene) selects only the "*" rules.
+    """
+    selected = [r for r in rules
+                if WILDCARD in r.get("scenes", [WILDCARD])
+                or scene in r.get("scenes", [WILDCARD])]
+    return sorted(selected, key=lambda r: -r.get("priority", 0))
+
+
+def _scene_source(rules, indent, fast=True):
+    """Fast path plus safe fallback for the rules of one scene.
+
+    Samples that carry every field take the subscript-only fast path; a
+    missing field raises KeyError and the sample is re-evaluated with the
+    defaults/None handling of the safe path. Without `fast` only the safe
+    path is generated (a reference for checking the fast one).
+    """
+    pad = " " * indent
+    if not fast:
+        return [f"{pad}get = d.get"] + _body_source(rules, False, indent)
+    return ([f"{pad}try:"]
+            + _body_source(rules, True, indent + 4)
+            + [f"{pad}except KeyError:", f"{pad}    get = d.get",
+               f"{pad}    events = ()"]
+            + _body_source(rules, False, indent + 4))
+
+
+def compile_ruleset(rules, name="rules", fast=True):
+    """Compile a ruleset into one `evaluate(d, scene=None, state=None) -> tuple`
+    function.
+
+    The function branches on the scene first, so only that scene's rules
+    (plus "*" rules) are evaluated; unknown scenes get the "*" rules only.
+    `fast=False` leaves out the fast path (see _scene_source).
+    """
+    scenes = []
+    for rule in rules:
+        for scene in rule.get("scenes", [WILDCARD]):
+            if scene != WILDCARD and scene not in scenes:
+                scenes.append(scene)
+
+    lines = ["def evaluate(d, scene=None, state=None):", "    events = ()"]
+    keyword = "if"
+    for scene in scenes:
+        lines.append(f"    {keyword} scene == {scene!r}:")
+        lines += _scene_source(rules_for_scene(rules, scene), 8, fast)
+        keyword = "elif"
+    wildcard = rules_for_scene(rules, None)
+    if scenes:
+        lines.append("    else:")
+        lines += _scene_source(wildcard, 8, fast)
+    else:
+        lines += _scene_source(wildcard, 4, fast)
+    lines.append("    return events")
+
+    source = "\n".join(lines)
+    namespace = {"_nan": _NAN, "_held": _held}
+    exec(compile(source, f"<rules:{name}>", "exec"), namespace)
+    evaluate = namespace["evaluate"]
+    evaluate.source = source
+    return evaluate
+
+
+def load_config(path=RULES_PATH):
+    """Read a rules config file."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def with_threshold(config, ruleset, rule_id, threshold, scene=None,
+                   condition=0):
+    """Copy of `config` with the threshold of rule `rule_id` replaced.
+
+    Args:
+        config (dict): Rules config
+        ruleset (str): Ruleset containing the rule
+        rule_id (str): Rule id; every rule with this id is changed
+        threshold: New threshold
+        scene (str): Only change the rule for this scene (default: all)
+        condition (int): Index of the condition in the rule's "when" list
+    """
+    config = copy.deepcopy(config)
+    changed = False
+    for rule in config["rulesets"][ruleset]:
+        if rule["id"] == rule_id and (
+                scene is None or scene in rule.get("scenes", [WILDCARD])):
+            rule["when"][condition]["threshold"] = threshold
+            changed = True
+    if not changed:
+        raise KeyError(f"No rule {rule_id!r} in ruleset {ruleset!r}")
+    return config
+
+
+class RuleEngine:
+    """Compiled rules of one ruleset, reloaded when the config changes.
+
+    `engine.evaluate(data, scene=None, state=None)` returns the event codes
+    `data` triggers in `scene`. It is the compiled function itself, replaced
+    as a whole on every reload.
+    """
+
+    def __init__(self, ruleset, path=RULES_PATH, watch_interval=1.0):
+        """Load and compile a ruleset.
+
+        Args:
+            ruleset (str): Name of the ruleset in the config file
+            path (str): Rules config file (JSON)
+            watch_interval (float): Seconds between checks of the file's
+                modification time by a background thread (0 disables
+                automatic reloading)
+        """
+        self.ruleset = ruleset
+        self.path = path
+        self.watch_interval = watch_interval
+        self._lock = threading.Lock()  # Serializes reloads, not evaluation
+        self._mtime = None
+        self.config = None
+        self.evaluate = None
+        self.reload()
+        if watch_interval:
+            threading.Thread(target=self._watch, name=f"rules-{ruleset}",
+                             daemon=True).start()
+
+    def reload(self):
+        """Load the config file and swap in its rules."""
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            config = load_config(self.path)
+            self._mtime = mtime
+            self._swap_locked(config)
+
+    def swap(self, config):
+        """Compile `config` and atomically replace the current rules.
+
+        Raises ValueError/KeyError if it does not compile; the current
+        rules then stay in place.
+        """
+        with self._lock:
+            self._swap_locked(config)
+
+    def set_threshold(self, rule_id, threshold, scene=None, condition=0):
+        """Change one rule's threshold (in memory) and swap it in."""
+        self.swap(with_threshold(self.config, self.ruleset, rule_id, threshold,
+                                 scene, condition))
+
+    def _swap_locked(self, config):
+        evaluate = compile_ruleset(config["rulesets"][self.ruleset],
+                                   self.ruleset)
+        # Single reference assignment: evaluation sees old or new, never both
+        self.evaluate = evaluate
+        self.config = config
+
+    def _watch(self):
+        """Reload the rules whenever the config file changes."""
+        while True:
+            time.sleep(self.watch_interval)
+            try:
+                if os.path.getmtime(self.path) == self._mtime:
+                    continue
+                self.reload()
+                logger.info(f"Reloaded {self.ruleset} rules from {self.path}")
+            except (OSError, ValueError, KeyError, SyntaxError) as e:
+                # Keep running on the previous rules until the file is fixed
+                try:
+                    self._mtime = os.path.getmtime(self.path)
+                except OSError:
+                    pass
+                logger.error(f"Could not reload rules from {self.path}: {e}")
+
+
+# -------------- parity check and benchmark --------------
+if __name__ == "__main__":
+    import random
+
+    def legacy_simulator(state):
+        """The if/elif chain formerly in StateManager.get_complete_state."""
+        errors = []
+        if state["speed"] > 180:
+            errors.append("overspeed")
+        elif state["deceleration_rate"] > 16:
+            errors.append("harsh_deceleration")
+        elif abs(state["steering_angle"]) > 29:
+            errors.append("poor_direction_control")
+        elif state["turn_signal"] == "N" and state["steering_angle"] > 14:
+            errors.append("lane_change_no_signal")
+        return errors
+
+    def legacy_acquisition(data):
+        """check_highway / check_intersection / check_parking, as they were."""
+        events = []
+        scenario = data.get("scenario")
+        if scenario == "highway":
+            if data.get("speed", 0) > 100:
+                events.append("overspeed")
+            if data.get("front_distance", float('inf')) < data.get("safe_distance_threshold", 0):
+                events.append("unsafe_distance")
+            if data.get("steering_change") and not data.get("turn_signal"):
+                events.append("lane_change_no_signal")
+        elif scenario == "intersection":
+            if data.get("steering_change") and not data.get("turn_signal"):
+                events.append("missing_signal")
+            if data.get("speed", 0) > 50:
+                events.append("overspeed")
+            if data.get("throttle", 0) > 70:
+                events.append("harsh_acceleration")
+        elif scenario == "parking":
+            if data.get("handbrake", False):
+                events.append("handbrake_not_released")
+            if data.get("mode") == "reverse" and abs(data.get("steering_angle", 0)) > 40:
+                events.append("poor_reverse_control")
+            corners = data.get("corner_distances", [])
+            if len(corners) == 4 and sum(corners) > data.get("distance_sum_threshold", 0.0):
+                events.append("distance_sum_exceeded")
+        return events
+
+    rng = random.Random(0)
+    sim_samples = [{
+        "speed": rng.uniform(0, 220), "deceleration_rate": rng.uniform(0, 25),
+        "steering_angle": rng.uniform(-45, 45),
+        "turn_signal": rng.choice("NLR"), "gear": "D", "handbrake": False,
+    } for _ in range(20000)]
+    acq_samples = [{
+        "scenario": rng.choice(["highway", "intersection", "parking"]),
+        "speed": rng.uniform(0, 130), "throttle": rng.uniform(0, 100),
+        "front_distance": rng.uniform(0, 30), "safe_distance_threshold": 10.0,
+        "steering_change": rng.random() < 0.3, "turn_signal": rng.random() < 0.5,
+        "handbrake": rng.random() < 0.2, "steering_angle": rng.uniform(-60, 60),
+        "mode": rng.choice(["forward", "reverse"]),
+        "corner_distances": [rng.uniform(0, 5) for _ in range(4)],
+        "distance_sum_threshold": 12.0,
+        # Features at quiet values, so only the legacy rules can fire
+        "t": i / 1000, "time_headway": 5.0, "steering_std": 0.0, "jerk": 0.0,
+    } for i in range(20000)]
+
+    for name, legacy, samples, scene_key in (
+            ("simulator", legacy_simulator, sim_samples, None),
+            ("acquisition", legacy_acquisition, acq_samples, "scenario")):
+        engine = RuleEngine(name, watch_interval=0)
+        scenes = [s.get(scene_key) if scene_key else None for s in samples]
+        mismatches = sum(list(engine.evaluate(s, sc)) != legacy(s)
+                         for s, sc in zip(samples, scenes))
+        assert mismatches == 0, f"{name}: {mismatches} samples differ"
+
+        # Sustained rules: the inlined fast path matches _held on the safe path
+        safe = compile_ruleset(engine.config["rulesets"][name], fast=False)
+        fast_state, safe_state = {}, {}
+        for i, (s, sc) in enumerate(zip(samples[:5000], scenes)):
+            s = dict(s, t=i / 100, time_headway=rng.choice((0.5, 5.0)),
+                     jerk=rng.choice((0.0, 50.0)))
+            assert (engine.evaluate(s, sc, fast_state)
+                    == safe(s, sc, safe_state)), f"{name}: sample {i} differs"
+
+        # Same loop shape for all, with a rule state as in production; best
+        # of 5 runs. "same rules" leaves out the sustained feature rules,
+        # which the legacy detectors do not have.
+        evaluate = engine.evaluate
+        same_rules = compile_ruleset([r for r in engine.config["rulesets"][name]
+                                      if not r.get("for_ms")])
+        state = {}
+        t_legacy = t_engine = t_same = float("inf")
+        for _ in range(5):
+            t0 = time.perf_counter()
+            for s, sc in zip(samples, scenes):
+                legacy(s)
+            t_legacy = min(t_legacy, time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            for s, sc in zip(samples, scenes):
+                evaluate(s, sc, state)
+            t_engine = min(t_engine, time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            for s, sc in zip(samples, scenes):
+                same_rules(s, sc, state)
+            t_same = min(t_same, time.perf_counter() - t0)
+        n = len(samples)
+        print(f"{name:12s} parity ok; ns/sample: legacy {t_legacy / n * 1e9:4.0f}, "
+              f"compiled {t_engine / n * 1e9:4.0f} "
+              f"(same rules {t_same / n * 1e9:4.0f})")
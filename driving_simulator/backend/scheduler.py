@@ -0,0 +1,125 @@
+"""
+Fixed-timestep scheduler for the driving simulator.
+Runs the physics on a fixed step with an accumulator and sleeps until
+absolute deadlines, so the effective rate does not drift under load.
+Publishing (network broadcast) runs on its own, independent rate.
+"""
+import asyncio
+import logging
+import time
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class FixedStepScheduler:
+    """Drives a fixed-rate step callback and a separate publish callback."""
+
+    def __init__(self, step_hz=240, publish_hz=60, max_catch_up=8, clock=None,
+                 on_tick=None):
+        """Initialize the scheduler.
+
+        Args:
+            step_hz (float): Physics steps per second
+            publish_hz (float): Publish (broadcast) calls per second
+            max_catch_up (int): Most steps run back to back after a stall;
+                time beyond that is dropped instead of replayed
+            clock (callable): Monotonic clock in seconds (default: loop.time)
+            on_tick (callable): Called with the duration in seconds of the
+                work done in each wakeup (steps plus publish)
+        """
+        self.step_hz = step_hz
+        self.publish_hz = publish_hz
+        self.step_dt = 1 / step_hz
+        self.publish_dt = 1 / publish_hz
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.on_tick = on_tick
+
+        # Statistics
+        self.steps = 0
+        self.publishes = 0
+        self.missed_deadlines = 0  # Wakeups later than one full step period
+        self.dropped_steps = 0  # Steps discarded by the catch-up limit
+        self.max_lateness = 0.0  # Worst wakeup lateness seen (seconds)
+        # Clock time the step being run simulates up to; behind the wall
+        # clock by the accumulated backlog during catch-up
+        self.step_end = None
+
+    async def run(self, step, publish, is_running):
+        """Run until `is_running()` returns False.
+
+        Args:
+            step (callable): Called as step(dt) once per fixed timestep
+            publish (callable): Called with no arguments at the publish rate
+            is_running (callable): Returns False to stop the loop
+        """
+        clock = self.clock or asyncio.get_running_loop().time
+        last = clock()
+        accumulator = 0.0
+        next_publish = last
+
+        while is_running():
+            tick_start = time.perf_counter()
+            now = clock()
+            accumulator += now - last
+            last = now
+
+            # How late this wakeup is relative to the deadline we slept for
+            lateness = accumulator - self.step_dt
+            if lateness > self.max_lateness:
+                self.max_lateness = lateness
+            if lateness >= self.step_dt:
+                self.missed_deadlines += 1
+
+            # Consume the accumulated time in fixed steps
+            steps = 0
+            while accumulator >= self.step_dt and steps < self.max_catch_up:
+                self.step_end = now - accumulator + self.step_dt
+                self._call(step, self.step_dt)
+                accumulator -= self.step_dt
+                steps += 1
+            self.steps += steps
+
+            # Still behind after catching up: drop the backlog rather than
+            # spiral further behind
+            if accumulator >= self.step_dt:
+                dropped = int(accumulator / self.step_dt)
+                self.dropped_steps += dropped
+                accumulator -= dropped * self.step_dt
+                logger.warning(
+                    f"Scheduler fell behind, dropped {dropped} physics steps")
+
+            if now >= next_publish:
+                self._call(publish)
+                self.publishes += 1
+                next_publish += self.publish_dt
+                # Skip missed publish slots instead of bursting to catch up
+                if next_publish <= now:
+                    next_publish = now + self.publish_dt
+
+            if self.on_tick is not None:
+                self.on_tick(time.perf_counter() - tick_start)
+
+            # Sleep until the next absolute deadline, not for a fixed delay
+            next_step = last + (self.step_dt - accumulator)
+            deadline = min(next_step, next_publish)
+            await asyncio.sleep(max(0.0, deadline - clock()))
+
+    def stats(self):
+        """Return a snapshot of the scheduler statistics."""
+        return {
+            "steps": self.steps,
+            "publishes": self.publishes,
+            "missed_deadlines": self.missed_deadlines,
+            "dropped_steps": self.dropped_steps,
+            "max_lateness_ms": self.max_lateness * 1000
+        }
+
+    @staticmethod
+    def _call(callback, *args):
+        """Call a callback, logging errors so one bad tick cannot stop the loop."""
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.error(f"Error in scheduled callback {callback.__name__}: {e}")
@@ -0,0 +1,237 @@
+"""
+asyncio-native serial transport for the Arduino rig.
+The serial device is opened as a non-blocking file descriptor and watched
+with loop.add_reader, so bytes are parsed on the event loop the moment they
+arrive - no reader thread, no polling sleep and no lock. Every decoded
+frame, stamped with its sequence number and receive time, goes into an
+InputBuffer (input_buffer.py) that the physics steps drain in order.
+
+The connection is supervised: when the device disappears (read error, EOF)
+or goes silent, a background task reopens it with exponential backoff,
+looking the board up by USB VID/PID when the configured path is gone (it
+may come back as another /dev/ttyACM*). While the link is down the buffer
+gets a safe input frame once, so the car coasts instead of holding the
+last pedal position. Nothing here blocks the event loop.
+
+Works with any tty, including a pseudo-terminal (pty) for tests without
+hardware. POSIX only (termios).
+"""
+import asyncio
+import logging
+import os
+import random
+import termios
+import time
+import tty
+
+from pyserial import FrameParser, frame_values
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+# USB ids of Arduino boards and common clones; None matches any product id
+ARDUINO_USB_IDS = ((0x2341, None),    # Arduino SA
+                   (0x2A03, None),    # Arduino.org
+                   (0x1A86, 0x7523))  # CH340 clones
+
+
+def discover_ports(usb_ids=ARDUINO_USB_IDS):
+    """Device paths of connected serial ports matching `usb_ids`.
+
+    Scans sysfs/IOKit, so call it off the event loop.
+    """
+    from serial.tools import list_ports
+    return [p.device for p in list_ports.comports()
+            if p.vid is not None and any(
+                p.vid == vid and pid in (None, p.pid) for vid, pid in usb_ids)]
+
+
+class AsyncSerialTransport:
+    """Reads Arduino frames from a serial device on the event loop."""
+
+    def __init__(self, port, buffer, baud=115200, safe_frame=None,
+                 usb_ids=ARDUINO_USB_IDS, stale_after=2.0, min_backoff=0.2,
+                 max_backoff=5.0):
+        """Initialize the transport; nothing is opened until start().
+
+        Args:
+            port (str): Serial device path (e.g. /dev/ttyACM0 or a pty), or
+                "auto" / None to find the board by USB id
+            buffer (InputBuffer): Receives every decoded frame
+            baud (int): Line speed
+            safe_frame (dict): Input posted once whenever the link goes down
+            usb_ids (tuple): (vendor id, product id or None) pairs used to
+                find the board when `port` is "auto" or has disappeared
+            stale_after (float): Seconds without a frame after which an open
+                port is treated as lost and reopened (0 disables)
+            min_backoff (float): First delay between reconnect attempts
+            max_backoff (float): Largest delay between reconnect attempts
+        """
+        self.port = None if port in (None, "auto") else port
+        self.baud = baud
+        self.buffer = buffer
+        self.safe_frame = safe_frame
+        self.usb_ids = usb_ids
+        self.stale_after = stale_after
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.parser = FrameParser()
+        self.connected = False
+        self.device = None           # Path currently open
+        self.last_frame_time = None  # time.monotonic() of the last frame
+        self.seq = 0                 # Number of inputs posted, safe ones included
+        self.connects = 0            # Successful opens
+        self.disconnects = 0         # Links lost after being open
+        self._fd = None
+        self._loop = None
+        self._lost = None            # asyncio.Event, set when the link drops
+        self._supervisor = None
+
+    def start(self, loop):
+        """Start the supervisor task that (re)opens the device."""
+        self._loop = loop
+        self._lost = asyncio.Event()
+        self._supervisor = loop.create_task(self._supervise())
+
+    async def _supervise(self):
+        """Keep the device open; reconnect with exponential backoff."""
+        backoff = self.min_backoff
+        failing = False  # Log repeated failures once, not every attempt
+        while True:
+            error = await self._connect()
+            if error is None:
+                backoff = self.min_backoff
+                failing = False
+                await self._watch()
+                continue
+            if not failing:
+                logger.error(f"Arduino not available ({error}); "
+                             f"retrying in the background")
+                failing = True
+            # Jitter keeps several stations from retrying in lockstep
+            await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _connect(self):
+        """Open the configured or discovered device; returns an error or None."""
+        candidates = []
+        if self.port is not None and os.path.exists(self.port):
+            candidates.append(self.port)
+        else:
+            candidates += await asyncio.to_thread(discover_ports, self.usb_ids)
+        if not candidates:
+            return f"no device at {self.port}" if self.port else "no device found"
+        device = candidates[0]
+        try:
+            fd = os.open(device, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        except OSError as e:
+            return f"cannot open {device}: {e}"
+        try:
+            self._configure(fd)
+        except termios.error as e:
+            os.close(fd)
+            return f"cannot configure {device}: {e}"
+        self._fd = fd
+        self.device = device
+        self._lost.clear()
+        self._loop.add_reader(fd, self._on_readable)
+        self.connected = True
+        self.connects += 1
+        # Bytes of the previous connection say nothing about this one
+        self.parser.reset()
+        self.last_frame_time = time.monotonic()
+        logger.info(f"Reading Arduino frames from {device}")
+        return None
+
+    async def _watch(self):
+        """Return once the open link is lost or has gone silent."""
+        while True:
+            if not self.stale_after:
+                await self._lost.wait()
+                return
+            try:
+                await asyncio.wait_for(self._lost.wait(), self.stale_after / 2)
+                return
+            except asyncio.TimeoutError:
+                pass
+            if time.monotonic() - self.last_frame_time > self.stale_after:
+                self._drop(f"no frames for {self.stale_after:g}s")
+                return
+
+    def _drop(self, reason):
+        """Close a lost link and switch the car to the safe input."""
+        if self._fd is None:
+            return
+        logger.error(f"Arduino link on {self.device} lost: {reason}")
+        self._close_fd()
+        self.disconnects += 1
+        if self.safe_frame is not None:
+            self.seq += 1
+            self.buffer.post(dict(self.safe_frame, seq=self.seq,
+                                  t=time.monotonic(), safe=True))
+        self._lost.set()
+
+    def frame_age(self):
+        """Seconds since the last frame (or since connecting); NaN if down."""
+        if not self.connected or self.last_frame_time is None:
+            return float("nan")
+        return time.monotonic() - self.last_frame_time
+
+    def _configure(self, fd):
+        """Raw mode at the configured line speed."""
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        speed = getattr(termios, f"B{self.baud}", None)
+        if speed is not None:
+            attrs[4] = attrs[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+
+    def _on_readable(self):
+        """Parse everything readable and post each frame."""
+        try:
+            data = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._drop(f"read failed: {e}")
+            return
+        if not data:
+            self._drop("device closed")
+            return
+        frames = self.parser.feed(data)
+        if not frames:
+            return
+        # Frames of one read arrived together and share its receive time
+        now = time.monotonic()
+        for frame in frames:
+            self.seq += 1
+            values = frame_values(frame, {})
+            values["seq"] = self.seq
+            values["t"] = now
+            self.buffer.post(values)
+        self.last_frame_time = now
+
+    def stats(self):
+        """Parser counters plus buffer overflows and connection counts."""
+        stats = self.parser.stats()
+        stats["overflowed"] = self.buffer.overflowed
+        stats["reconnects"] = max(0, self.connects - 1)
+        stats["disconnects"] = self.disconnects
+        return stats
+
+    def _close_fd(self):
+        self._loop.remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = None
+        self.connected = False
+
+    def close(self):
+        """Stop supervising and close the device."""
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            self._supervisor = None
+        if self._fd is not None:
+            self._close_fd()
+
+    disconnect = close
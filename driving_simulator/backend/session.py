@@ -0,0 +1,343 @@
+"""
+Simulation sessions for the driving simulator server.
+Each session owns its own car, scene, detector state, log stream and
+clients. A SessionRegistry keeps all sessions and is stepped by the
+server's single scheduler, so adding a session does not add a task.
+Sessions can be recorded to telemetry logs, and replay sessions play a
+recorded log back instead of running physics.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import re
+import time
+
+from car_physics import CarPhysics
+from controls import ControlMailbox, apply_manual_controls
+from frame_codec import ENCODING_DELTA, DeltaEncoder, StateFrame
+from latency import InputMark
+from state_manager import StateManager
+from telemetry_log import (LOG_EXTENSION, SOURCE_MANUAL, SOURCE_NONE,
+                           TelemetryLog, TelemetryReplay, TelemetryWriter)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION = "default"
+SCENES = ("highway", "parking_lot", "intersection")
+
+# Session ids end up in log file names, so keep them simple
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def is_valid_session_id(session_id):
+    """Return True if `session_id` may be used as a session id."""
+    return isinstance(session_id, str) and bool(_SESSION_ID.match(session_id))
+
+
+class SimSession:
+    """One independent car and scene, plus the clients watching it."""
+
+    def __init__(self, session_id, detection_slot=0):
+        """Initialize the session.
+
+        Args:
+            session_id (str): Unique session id
+            detection_slot (int): Step offset used to stagger the once per
+                second detection snapshot across sessions
+        """
+        self.session_id = session_id
+        self.car_physics = CarPhysics()
+        csv_name = ("state_errors.csv" if session_id == DEFAULT_SESSION
+                    else f"state_errors_{session_id}.csv")
+        self.state_manager = StateManager(self.car_physics, csv_name=csv_name)
+        self.scene = "highway"  # Default scene
+        self.clients = {}  # WebSocket -> ClientChannel
+        self.frame_seq = 0  # Sequence number of the last state frame
+        self.delta_encoder = DeltaEncoder()
+        self.detection_slot = detection_slot
+        self.idle_since = None  # Loop time the last client left
+        self.input_source = SOURCE_NONE  # Where the last applied input came from
+        self.input_marks = {}  # Input source -> InputMark of the newest input
+        self.controls = ControlMailbox()  # Manual controls for the next step
+        self.telemetry = None  # TelemetryWriter while recording
+        self.replay = None  # TelemetryReplay for replay sessions
+        self.owner = None  # ClientChannel that created the session
+
+    def set_scene(self, scene):
+        """Change the scene and reset the car. Returns False if invalid."""
+        if scene not in SCENES:
+            return False
+        self.scene = scene
+
+        # Reset car position when changing scenes
+        self.car_physics.position = {"x": 0, "y": 0}
+        self.car_physics.speed = 0
+        self.car_physics.direction = 0
+        self.car_physics.gear = "P"
+        return True
+
+    def mark_input(self, source, seq, received, applied):
+        """Record the newest applied input of `source` ("manual"/"arduino")."""
+        self.input_marks[source] = InputMark(seq, received, applied)
+
+    def _frame(self):
+        return StateFrame(self.frame_seq, self.car_physics.get_state(),
+                          self.scene, dict(self.input_marks) or None)
+
+    def apply_controls(self):
+        """Apply the manual controls received since the last step."""
+        controls = self.controls.take()
+        if controls is None:
+            return
+        apply_manual_controls(self.car_physics, controls)
+        self.input_source = SOURCE_MANUAL
+        self.mark_input("manual", self.controls.seq, self.controls.received,
+                        time.monotonic())
+
+    def step(self, dt):
+        """Advance this session's car by one physics step."""
+        self.apply_controls()
+        if self.replay is not None:
+            # Replay sessions follow the recording instead of the physics
+            self.replay.advance(dt)
+            self.replay.apply(self.car_physics)
+            return
+
+        # Apply friction more aggressively to avoid system instability
+        if abs(self.car_physics.speed) < 0.1:
+            self.car_physics.speed = 0
+        self.car_physics.update(dt)
+
+    def send_state(self, channel):
+        """Queue the current state for one client of this session."""
+        if channel.encoding == ENCODING_DELTA:
+            # Drop the baseline; the next tick sends this client a keyframe
+            self.delta_encoder.reset(channel)
+            return
+        frame = self._frame()
+        channel.send_state(frame.payload(channel.encoding), frame)
+
+    def broadcast_state(self):
+        """Encode the current state once and queue it for every client.
+
+        Each encoding is produced at most once per tick and the same payload
+        object is shared by all clients that negotiated it. Delta clients
+        share payloads per acknowledged baseline.
+        """
+        if not self.clients:
+            return
+
+        self.frame_seq += 1
+        frame = self._frame()
+        delta_ready = False
+
+        for channel in self.clients.values():
+            if channel.closed:
+                continue
+            if channel.encoding == ENCODING_DELTA:
+                if not delta_ready:
+                    self.delta_encoder.begin_frame(frame)
+                    delta_ready = True
+                channel.send_state(self.delta_encoder.payload_for(channel),
+                                   frame)
+            else:
+                channel.send_state(frame.payload(channel.encoding), frame)
+
+    def close(self):
+        """Release the session's telemetry writer or replay log."""
+        if self.telemetry is not None:
+            self.telemetry.close()
+            self.telemetry = None
+        if self.replay is not None:
+            self.replay.log.close()
+            self.replay = None
+
+    def broadcast(self, message):
+        """Queue an event message for every client of this session."""
+        if not self.clients:
+            return
+        payload = json.dumps(message)
+        for channel in self.clients.values():
+            if not channel.closed:
+                channel.send_event(payload)
+
+
+class SessionRegistry:
+    """All sessions of one server, keyed by session id."""
+
+    def __init__(self, event_pipeline, step_hz, idle_timeout=300.0,
+                 telemetry_dir="telemetry", record=False, publish_hz=60,
+                 max_sessions=64, max_sessions_per_client=4):
+        """Initialize the registry.
+
+        Args:
+            event_pipeline (EventPipeline): Shared detection/logging pipeline
+            step_hz (int): Physics step rate, used to spread detection
+                snapshots of different sessions over the second
+            idle_timeout (float): Seconds a session without clients is kept
+                before it is closed (the default session is never closed)
+            telemetry_dir (str): Directory for telemetry logs
+            record (bool): Record every driven session to a telemetry log
+            publish_hz (float): Publish rate, i.e. telemetry record rate
+            max_sessions (int): Sessions that may exist at once, the
+                default session included (0: no limit)
+            max_sessions_per_client (int): Sessions one client connection
+                may have created and not yet closed (0: no limit)
+        """
+        self.event_pipeline = event_pipeline
+        self.step_hz = step_hz
+        self.idle_timeout = idle_timeout
+        self.telemetry_dir = telemetry_dir
+        self.record = record
+        self.publish_hz = publish_hz
+        self.max_sessions = max_sessions
+        self.max_sessions_per_client = max_sessions_per_client
+        self.sessions = {}
+        self.step_count = 0
+        self._next_slot = 0
+        self._replays = 0
+        self.get_or_create(DEFAULT_SESSION)
+
+    @property
+    def default(self):
+        """The default session (also driven by the Arduino rig)."""
+        return self.sessions[DEFAULT_SESSION]
+
+    def check_capacity(self, owner=None):
+        """Raise ValueError if `owner` (a ClientChannel) may not create a session."""
+        if self.max_sessions and len(self.sessions) >= self.max_sessions:
+            raise ValueError(f"Session limit reached ({self.max_sessions})")
+        if owner is not None and self.max_sessions_per_client:
+            owned = sum(1 for s in self.sessions.values() if s.owner is owner)
+            if owned >= self.max_sessions_per_client:
+                raise ValueError(f"Client session limit reached "
+                                 f"({self.max_sessions_per_client})")
+
+    def get_or_create(self, session_id, owner=None):
+        """Return the session with this id, creating it if needed.
+
+        Raises ValueError if a new session would exceed the limits.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            self.check_capacity(owner)
+            # Give each session its own step within the detection period
+            session = SimSession(session_id, detection_slot=self._next_slot)
+            self._next_slot = (self._next_slot + 1) % self.step_hz
+            session.owner = owner
+            if self.record:
+                ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                session.telemetry = TelemetryWriter(
+                    os.path.join(self.telemetry_dir,
+                                 f"{session_id}_{ts}{LOG_EXTENSION}"),
+                    session_id=session_id, rate_hz=self.publish_hz)
+            self.sessions[session_id] = session
+            logger.info(
+                f"Session {session_id} created. Total sessions: {len(self.sessions)}")
+        return session
+
+    def recordings(self):
+        """List the telemetry logs available for replay."""
+        try:
+            names = sorted(os.listdir(self.telemetry_dir))
+        except FileNotFoundError:
+            return []
+        return [name for name in names if name.endswith(LOG_EXTENSION)]
+
+    async def start_replay(self, name, speed=1.0, owner=None):
+        """Create a replay session for the recording `name`.
+
+        Only plain file names inside the telemetry directory are accepted.
+        The log is opened (and its index possibly rebuilt) off the event
+        loop. Raises ValueError/OSError if the log cannot be opened or the
+        session limits are reached.
+        """
+        if os.path.basename(name) != name or not name.endswith(LOG_EXTENSION):
+            raise ValueError("Invalid recording name")
+        self.check_capacity(owner)
+        log = await asyncio.to_thread(
+            TelemetryLog, os.path.join(self.telemetry_dir, name))
+        try:
+            # Sessions may have been created while the log was opened
+            self.check_capacity(owner)
+        except ValueError:
+            log.close()
+            raise
+
+        self._replays += 1
+        session_id = f"replay-{self._replays}"
+        session = SimSession(session_id)
+        session.owner = owner
+        session.replay = TelemetryReplay(log, speed=speed)
+        session.replay.apply(session.car_physics)
+        self.sessions[session_id] = session
+        logger.info(f"Replay session {session_id} started for {name} "
+                    f"({log.records} records, {log.duration:.1f}s)")
+        return session
+
+    def join(self, channel, session_id, now):
+        """Move a client channel into a session, leaving its current one.
+
+        Raises ValueError, with the client left where it was, if the
+        session does not exist and the limits do not allow creating it.
+        """
+        session = self.get_or_create(session_id, owner=channel)
+        self.leave(channel, now)
+        # Frame seqs are per session; baselines of the old one mean nothing
+        DeltaEncoder.reset(channel)
+        session.clients[channel.websocket] = channel
+        session.idle_since = None
+        channel.session = session
+        return session
+
+    def leave(self, channel, now):
+        """Remove a client channel from its session."""
+        session = getattr(channel, "session", None)
+        if session is None:
+            return
+        session.clients.pop(channel.websocket, None)
+        channel.session = None
+        if not session.clients:
+            session.idle_since = now
+
+    def step(self, dt):
+        """Advance every session by one physics step."""
+        self.step_count += 1
+        slot = self.step_count % self.step_hz
+        for session in self.sessions.values():
+            session.step(dt)
+            # Once per second per session; replays are not re-detected
+            if session.detection_slot == slot and session.replay is None:
+                self.event_pipeline.submit(session.state_manager,
+                                           session.state_manager.snapshot())
+
+    def publish(self):
+        """Record and broadcast the state of every session."""
+        for session in self.sessions.values():
+            if session.telemetry is not None:
+                session.telemetry.write(session.car_physics,
+                                        session.input_source)
+            session.broadcast_state()
+
+    def close(self):
+        """Close every session (flushes telemetry logs)."""
+        for session in self.sessions.values():
+            session.close()
+
+    def prune_idle(self, now):
+        """Close sessions that have had no clients for `idle_timeout`."""
+        expired = [
+            session_id for session_id, session in self.sessions.items()
+            if session_id != DEFAULT_SESSION and session.idle_since is not None
+            and now - session.idle_since > self.idle_timeout
+        ]
+        for session_id in expired:
+            session = self.sessions.pop(session_id)
+            session.close()
+            self.event_pipeline.forget(session.state_manager)
+            logger.info(
+                f"Session {session_id} closed after being idle. "
+                f"Total sessions: {len(self.sessions)}")
@@ -0,0 +1,128 @@
+"""
+Startup benchmark for the simulator server.
+Measures, in fresh processes:
+  • the import time of main.py (python -X importtime), with the slowest
+    modules, and
+  • the time from launching `python main.py` to the first state_update a
+    WebSocket client receives,
+and exits 1 if the median of either exceeds its budget, so CI catches an
+import or initialization step that makes restarting a station slow again.
+
+    python startup_bench.py
+    python startup_bench.py --arduino      # rig emulated on a pty
+    python startup_bench.py --import-budget-ms 300 --first-frame-budget-ms 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import websockets
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_imports():
+    """Return (total seconds, [(self seconds, module), ...]) for `import main`."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=HERE, capture_output=True, text=True, check=True)
+    total, modules = None, []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((int(self_us) / 1e6, name.strip()))
+        if name.strip() == "main":
+            total = int(cumulative_us) / 1e6
+    modules.sort(reverse=True)
+    return total, modules
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+async def _first_frame(port, deadline):
+    """Seconds until listening and until the first state_update, from now."""
+    t0 = time.perf_counter()
+    listening = None
+    while time.perf_counter() < deadline:
+        try:
+            async with websockets.connect(f"ws://localhost:{port}") as ws:
+                listening = time.perf_counter() - t0
+                while True:
+                    msg = json.loads(await ws.recv())
+                    if msg.get("type") == "state_update":
+                        return listening, time.perf_counter() - t0
+        except OSError:
+            await asyncio.sleep(0.005)
+    raise TimeoutError("server sent no state_update")
+
+
+def measure_first_frame(arduino_path=None, timeout=10.0):
+    """Launch the server; returns (seconds to listening, seconds to first frame)."""
+    port = _free_port()
+    cmd = [sys.executable, "main.py", "--port", str(port), "--metrics-port", "0"]
+    if arduino_path:
+        cmd += ["--use-arduino", "--arduino-port", arduino_path]
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=HERE, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    try:
+        listening, first = asyncio.run(_first_frame(port, start + timeout))
+        launched = time.perf_counter() - start - first
+        return launched + listening, launched + first
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Server startup benchmark")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--arduino", action="store_true",
+                   help="Start the server with --use-arduino on an emulated rig")
+    p.add_argument("--import-budget-ms", type=float, default=300)
+    p.add_argument("--first-frame-budget-ms", type=float, default=1000)
+    args = p.parse_args()
+
+    emulator = None
+    if args.arduino:
+        from arduino_emulator import ArduinoEmulator
+        emulator = ArduinoEmulator(rate=500).start()
+
+    try:
+        imports = [measure_imports() for _ in range(args.runs)]
+        frames = [measure_first_frame(emulator.path if emulator else None)
+                  for _ in range(args.runs)]
+    finally:
+        if emulator is not None:
+            emulator.close()
+
+    import_ms = statistics.median(total for total, _ in imports) * 1000
+    listen_ms = statistics.median(f[0] for f in frames) * 1000
+    first_ms = statistics.median(f[1] for f in frames) * 1000
+    print(f"import main:        {import_ms:7.1f} ms (budget {args.import_budget_ms:g})")
+    for seconds, name in imports[-1][1][:8]:
+        print(f"    {seconds * 1000:6.1f} ms  {name}")
+    print(f"listening:          {listen_ms:7.1f} ms")
+    print(f"first state_update: {first_ms:7.1f} ms (budget {args.first_frame_budget_ms:g})")
+
+    over = []
+    if import_ms > args.import_budget_ms:
+        over.append("import time")
+    if first_ms > args.first_frame_budget_ms:
+        over.append("time to first frame")
+    if over:
+        raise SystemExit(f"Over budget: {', '.join(over)}")
+
+
+if __name__ == "__main__":
+    main()
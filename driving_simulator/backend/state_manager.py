@@ -2,10 +2,10 @@ import os
 import csv
 import datetime
 import platform
+import logging
 import threading  # so TTS/playback doesn’t block
-import subprocess
-import sys
-from API_Test.gemini_to_speech import gemini_to_speech
+from rules import RuleEngine
+from tracing import tracer
 
 
 # ── prompt dictionary (move it outside the method) ──────────────────────
@@ -21,15 +21,64 @@ EVENT_PROMPTS = {
     "distance_sum_exceeded":  "請提醒使用者，並給予改正建議：車輛未停於車位中央，應在白線內停好。",
 }
 
+logger = logging.getLogger(__name__)
+
 _SPEAK_LOCK = threading.Lock()   # one playback at a time
+_TTS_COUNT_LOCK = threading.Lock()
+_tts_pending = 0                 # speech threads started but not finished
+
+
+def tts_queue_depth():
+    """Number of speech prompts currently waiting or playing."""
+    return _tts_pending
+
+
+def _tts_started():
+    global _tts_pending
+    with _TTS_COUNT_LOCK:
+        _tts_pending += 1
+
+
+def _tts_done():
+    global _tts_pending
+    with _TTS_COUNT_LOCK:
+        _tts_pending -= 1
+
+
+_gemini_to_speech = None
+
+
+def _load_tts():
+    """Import the Gemini/TTS client on first use.
+
+    It pulls in the Google client libraries, which take longer to import
+    than the rest of the server; see preload_tts().
+    """
+    global _gemini_to_speech
+    if _gemini_to_speech is None:
+        from API_Test.gemini_to_speech import gemini_to_speech
+        _gemini_to_speech = gemini_to_speech
+    return _gemini_to_speech
+
+
+def preload_tts():
+    """Import the TTS client in a background thread (call once serving)."""
+    def load():
+        try:
+            _load_tts()
+        except Exception as e:  # Missing libraries only disable speech
+            logger.error(f"Speech prompts unavailable: {e}")
+    threading.Thread(target=load, name="tts-preload", daemon=True).start()
 
 
 def _speak_background(prompt_txt: str, mp3_path: str):
     """Generate + play TTS (non‑blocking, one at a time)."""
     if not _SPEAK_LOCK.acquire(blocking=False):
+        _tts_done()
         return                       # skip if another playback active
+    t = tracer.begin()
     try:
-        _, out_file = gemini_to_speech(
+        _, out_file = _load_tts()(
             prompt_txt,
             instruction="你是駕駛的小幫手，請用繁體中文簡潔提醒使用者如何更正駕駛行為。可以用詼諧的語氣，不要都用老兄大姐開頭，勿超過三十字",
             speaking_rate=1.35,
@@ -40,11 +89,34 @@ def _speak_background(prompt_txt: str, mp3_path: str):
             os.system(f"{player} '{out_file}'")
     finally:
         _SPEAK_LOCK.release()
+        _tts_done()
+        tracer.end("tts", t)
+
+
+_rules = None
+
+
+def get_rules():
+    """The simulator ruleset from rules.json, loaded on first use."""
+    global _rules
+    if _rules is None:
+        _rules = RuleEngine("simulator")
+    return _rules
+
+
+def detect_violations(state, scene=None):
+    """Return the violation codes (a tuple) for one state snapshot."""
+    return get_rules().evaluate(state, scene)
 
 
 class StateManager:
-    def __init__(self, car_physics):
+    def __init__(self, car_physics, csv_name="state_errors.csv"):
         self.car_physics = car_physics
+        self.csv_name = csv_name  # one log stream per session
+
+    @property
+    def csv_path(self):
+        return os.path.join(os.getcwd(), "error_data", self.csv_name)
 
     # simple getters -----------------------------------------
     def get_speed(self): return self.car_physics.speed
@@ -54,9 +126,9 @@ class StateManager:
     def get_acceleration_rate(self): return self.car_physics.acceleration_rate
     def get_steering_angle(self): return self.car_physics.steering_angle
 
-    # main routine -------------------------------------------
-    def get_complete_state(self):
-        state = {
+    # snapshot (cheap, safe to call from the update loop) ----
+    def snapshot(self):
+        return {
             "speed":             self.get_speed(),
             "direction":         self.get_direction(),
             "gear":              self.get_gear(),
@@ -68,59 +140,56 @@ class StateManager:
             "turn_signal":       self.car_physics.turn_signal,
         }
 
-        # detect violations
-        errors = []
-        if state["speed"] > 180:
-            errors.append("overspeed")
-        elif state["deceleration_rate"] > 16:
-            errors.append("harsh_deceleration")
-        elif abs(state["steering_angle"]) > 29:
-            errors.append("poor_direction_control")
-        elif state["turn_signal"] == "N" and state["steering_angle"] > 14:
-            errors.append("lane_change_no_signal")
-
-        if state["handbrake"]:
-            print("entering parking space")
-            subprocess.run(
-                [sys.executable, "-m", "drive_report", "--last", "50"],
-                check=True,
-            )
+    # persistence + speech (blocking, run off the event loop) -
+    def record_errors(self, state, errors):
+        t = tracer.begin()
+        # ---- CSV log -----------------------------------
+        csv_path = self.csv_path
+        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+
+        header = ["timestamp", "errors"] + list(state.keys())
+        row = [
+            datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            ";".join(errors)
+        ] + [state[k] for k in state]
+
+        first = not os.path.exists(csv_path)
+        with open(csv_path, "a", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            if first:
+                w.writerow(header)
+            w.writerow(row)
+
+        # ---- speech prompt -----------------------------
+        first_err = errors[0]
+        prompt_txt = EVENT_PROMPTS.get(
+            first_err,
+            "請提醒使用者：發生未知錯誤，請注意駕駛安全。"
+        )
 
-        if errors:
-            # ---- CSV log -----------------------------------
-            csv_dir = os.path.join(os.getcwd(), "error_data")
-            os.makedirs(csv_dir, exist_ok=True)
-            csv_path = os.path.join(csv_dir, "state_errors.csv")
-
-            header = ["timestamp", "errors"] + list(state.keys())
-            row = [
-                datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                ";".join(errors)
-            ] + [state[k] for k in state]
-
-            first = not os.path.exists(csv_path)
-            with open(csv_path, "a", newline="", encoding="utf-8") as f:
-                w = csv.writer(f)
-                if first:
-                    w.writerow(header)
-                w.writerow(row)
-
-            # ---- speech prompt -----------------------------
-            first_err = errors[0]
-            prompt_txt = EVENT_PROMPTS.get(
-                first_err,
-                "請提醒使用者：發生未知錯誤，請注意駕駛安全。"
-            )
-
-            audio_dir = os.path.join(os.getcwd(), "audio_feedback")
-            os.makedirs(audio_dir, exist_ok=True)
-            ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            mp3_path = os.path.join(audio_dir, f"{first_err}_{ts}.mp3")
-
-            threading.Thread(
-                target=_speak_background,
-                args=(prompt_txt, mp3_path),
-                daemon=True
-            ).start()
+        audio_dir = os.path.join(os.getcwd(), "audio_feedback")
+        os.makedirs(audio_dir, exist_ok=True)
+        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        mp3_path = os.path.join(audio_dir, f"{first_err}_{ts}.mp3")
 
+        _tts_started()
+        threading.Thread(
+            target=_speak_background,
+            args=(prompt_txt, mp3_path),
+            daemon=True
+        ).start()
+        tracer.end("record_errors", t)
+
+    # synchronous routine (scripts / tools) ------------------
+    def get_complete_state(self):
+        """Snapshot, detect and record in one blocking call.
+
+        The server does not use this: it submits snapshots to an
+        EventPipeline (event_pipeline.py), which also owns post-drive
+        report triggering.
+        """
+        state = self.snapshot()
+        errors = detect_violations(state)
+        if errors:
+            self.record_errors(state, errors)
         return state
@@ -0,0 +1,317 @@
+"""
+Binary telemetry log for the driving simulator.
+Every published tick of a session (applied inputs plus resulting car
+state) is appended as one fixed-size record, so hours of 60 Hz data stay
+at a few MB. A sidecar index maps each second to its first record, which
+makes seeking to any timestamp O(1). Recording only packs records in
+memory; a writer thread puts them on disk. Replay memory-maps the log and
+unpacks records on demand instead of loading the file into Python objects.
+
+File layout (little endian):
+    header   64 bytes, see HEADER_STRUCT
+    records  RECORD_STRUCT.size bytes each
+Index file (<log>.idx): uint32 record number per whole second.
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DSTLOG01"
+VERSION = 1
+
+# magic, version, record size, nominal record rate (Hz), start time (unix
+# seconds), session id; padded to 64 bytes
+HEADER_STRUCT = struct.Struct("<8sHHfd32s8x")
+
+# t_ms (since start), flags, acceleration_rate, deceleration_rate,
+# steering_angle, x, y, speed, direction, 1 pad byte -> 24 bytes
+RECORD_STRUCT = struct.Struct("<IBeeeffeex")
+
+# flags byte: bits 0-1 input source, 2-3 gear, 4-5 turn signal, 6 handbrake
+SOURCE_NONE = 0
+SOURCE_ARDUINO = 1
+SOURCE_MANUAL = 2
+GEARS = ("P", "D", "R", "N")
+TURN_SIGNALS = ("N", "L", "R")
+_GEAR_INDEX = {g: i for i, g in enumerate(GEARS)}
+_SIGNAL_INDEX = {s: i for i, s in enumerate(TURN_SIGNALS)}
+
+LOG_EXTENSION = ".dstl"
+
+
+def _clamp_half(value):
+    """Clamp a value to the float16 range so packing cannot overflow."""
+    return max(-65504.0, min(65504.0, value))
+
+
+class TelemetryWriter:
+    """Appends fixed-size records for one session to a log file.
+
+    write() only packs the record into a buffer, so it never blocks the
+    event loop on disk. A background thread creates the file and writes
+    the buffer once `flush_every` records are pending, or every
+    `flush_interval` seconds.
+    """
+
+    def __init__(self, path, session_id="", rate_hz=60.0, flush_every=256,
+                 flush_interval=1.0):
+        """Start the writer thread; the file is created on it.
+
+        Args:
+            path (str): Log file path; the index goes to path + ".idx"
+            session_id (str): Stored in the header for reference
+            rate_hz (float): Nominal record rate, stored in the header
+            flush_every (int): Records buffered before the thread is woken
+            flush_interval (float): Longest time records stay buffered
+        """
+        self.path = path
+        self.start_time = time.time()
+        self._start = time.monotonic()
+        self.records = 0
+        self._flush_every = flush_every
+        self._flush_interval = flush_interval
+        # The header goes out with the first batch
+        self._buffer = bytearray(HEADER_STRUCT.pack(
+            MAGIC, VERSION, RECORD_STRUCT.size, rate_hz, self.start_time,
+            session_id.encode("utf-8")[:32]))
+        self._index = array("I")
+        self._index_written = 0
+        self._file = None
+        self._index_file = None
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = True
+        # Not a daemon, so records buffered at close() reach the disk
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer")
+        self._thread.start()
+
+    def write(self, car_physics, source=SOURCE_NONE):
+        """Append one record from the current state of a CarPhysics."""
+        if not self._running:
+            return  # Closed, or the log could not be written
+        t_ms = int((time.monotonic() - self._start) * 1000)
+
+        flags = (source
+                 | _GEAR_INDEX.get(car_physics.gear, 0) << 2
+                 | _SIGNAL_INDEX.get(car_physics.turn_signal, 0) << 4
+                 | bool(car_physics.handbrake) << 6)
+        record = RECORD_STRUCT.pack(
+            t_ms, flags,
+            _clamp_half(car_physics.acceleration_rate),
+            _clamp_half(car_physics.deceleration_rate),
+            _clamp_half(car_physics.steering_angle),
+            car_physics.position["x"],
+            car_physics.position["y"],
+            _clamp_half(car_physics.speed),
+            _clamp_half(car_physics.direction))
+
+        with self._lock:
+            # Index: first record of every second reached so far
+            second = t_ms // 1000
+            while len(self._index) <= second:
+                self._index.append(self.records)
+            self._buffer += record
+            self.records += 1
+        if self.records % self._flush_every == 0:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write buffered records and index entries (on the caller's thread)."""
+        with self._lock:
+            batch, self._buffer = self._buffer, bytearray()
+            index = self._index[self._index_written:]
+            self._index_written = len(self._index)
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "wb")
+            self._index_file = open(self.path + ".idx", "wb")
+        if batch:
+            self._file.write(batch)
+            self._file.flush()
+        if index:
+            self._index_file.write(index.tobytes())
+            self._index_file.flush()
+
+    def close(self):
+        """Stop recording; the writer thread flushes and closes the log."""
+        if not self._running:
+            return
+        self._running = False
+        self._wakeup.set()
+
+    def _run(self):
+        try:
+            while self._running:
+                self._wakeup.wait(self._flush_interval)
+                self._wakeup.clear()
+                self.flush()
+            self.flush()
+        except OSError as e:
+            self._running = False
+            logger.error(f"Telemetry log {self.path} write failed: {e}")
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._index_file.close()
+        logger.info(f"Telemetry log {self.path} closed ({self.records} records)")
+
+
+class TelemetryLog:
+    """Memory-mapped, read-only view of a telemetry log."""
+
+    def __init__(self, path):
+        """Open and map a log; may scan it to rebuild the index.
+
+        Raises ValueError if the file is not a complete telemetry log and
+        OSError if it cannot be read; the file is closed either way.
+        """
+        self.path = path
+        self._map = None
+        self._file = open(path, "rb")
+        try:
+            self._open()
+        except struct.error:
+            self.close()
+            raise ValueError(f"{path} is truncated") from None
+        except BaseException:
+            self.close()
+            raise
+
+    def _open(self):
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, record_size, self.rate_hz, self.start_time,
+         session_id) = HEADER_STRUCT.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_STRUCT.size:
+            raise ValueError(f"{self.path} is not a supported telemetry log")
+        self.session_id = session_id.rstrip(b"\0").decode("utf-8")
+        self.records = (len(self._map) - HEADER_STRUCT.size) // record_size
+        self._index = self._load_index()
+
+    def _load_index(self):
+        """Load the per-second index, rebuilding it if missing or stale."""
+        index = array("I")
+        try:
+            with open(self.path + ".idx", "rb") as f:
+                index.frombytes(f.read())
+        except FileNotFoundError:
+            pass
+        if index and self.records and self.time_of(self.records - 1) // 1000 < len(index):
+            return index
+
+        # One sequential scan over the timestamps only
+        index = array("I")
+        for i in range(self.records):
+            second = self.time_of(i) // 1000
+            while len(index) <= second:
+                index.append(i)
+        return index
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    @property
+    def duration(self):
+        """Time of the last record, in seconds."""
+        return self.time_of(self.records - 1) / 1000 if self.records else 0.0
+
+    def time_of(self, i):
+        """Timestamp of record `i` in milliseconds since the start."""
+        return struct.unpack_from(
+            "<I", self._map, HEADER_STRUCT.size + i * RECORD_STRUCT.size)[0]
+
+    def record(self, i):
+        """Decode record `i` into a dict."""
+        (t_ms, flags, acceleration_rate, deceleration_rate, steering_angle,
+         x, y, speed, direction) = RECORD_STRUCT.unpack_from(
+            self._map, HEADER_STRUCT.size + i * RECORD_STRUCT.size)
+        return {
+            "t": t_ms / 1000,
+            "source": flags & 0b11,
+            "gear": GEARS[(flags >> 2) & 0b11],
+            "turn_signal": TURN_SIGNALS[min((flags >> 4) & 0b11, 2)],
+            "handbrake": bool(flags >> 6 & 1),
+            "acceleration_rate": acceleration_rate,
+            "deceleration_rate": deceleration_rate,
+            "steering_angle": steering_angle,
+            "x": x,
+            "y": y,
+            "speed": speed,
+            "direction": direction,
+        }
+
+    def seek(self, t):
+        """Index of the last record at or before time `t` (seconds)."""
+        if not self.records:
+            return 0
+        t_ms = int(t * 1000)
+        second = t_ms // 1000
+        if second < 0:
+            return 0
+        if second >= len(self._index):
+            return self.records - 1
+        # At most one second of records to walk from the index entry
+        i = self._index[second]
+        while i + 1 < self.records and self.time_of(i + 1) <= t_ms:
+            i += 1
+        if i and self.time_of(i) > t_ms:
+            i -= 1
+        return i
+
+
+class TelemetryReplay:
+    """Plays a TelemetryLog back into a CarPhysics at any speed."""
+
+    def __init__(self, log, speed=1.0):
+        self.log = log
+        self.speed = speed
+        self.paused = False
+        self.position = 0.0  # Playback time in seconds
+        self.index = 0
+
+    @property
+    def finished(self):
+        return self.position >= self.log.duration
+
+    def seek(self, t):
+        """Jump to time `t` (seconds); O(1) via the per-second index."""
+        self.position = max(0.0, min(t, self.log.duration))
+        self.index = self.log.seek(self.position)
+
+    def advance(self, dt):
+        """Move the playhead by `dt` seconds of wall time times the speed."""
+        if self.paused or not self.log.records:
+            return
+        self.position = max(0.0, min(self.position + dt * self.speed,
+                                     self.log.duration))
+        t_ms = self.position * 1000
+        records = self.log.records
+        # Playback moves forward a few records per tick; walk locally
+        while self.index + 1 < records and self.log.time_of(self.index + 1) <= t_ms:
+            self.index += 1
+        if self.index and self.log.time_of(self.index) > t_ms:
+            self.index = self.log.seek(self.position)
+
+    def apply(self, car_physics):
+        """Copy the current record into a CarPhysics."""
+        if not self.log.records:
+            return
+        rec = self.log.record(self.index)
+        car_physics.position = {"x": rec["x"], "y": rec["y"]}
+        car_physics.speed = rec["speed"]
+        car_physics.direction = rec["direction"]
+        car_physics.gear = rec["gear"]
+        car_physics.turn_signal = rec["turn_signal"]
+        car_physics.handbrake = rec["handbrake"]
+        car_physics.acceleration_rate = rec["acceleration_rate"]
+        car_physics.deceleration_rate = rec["deceleration_rate"]
+        car_physics.steering_angle = rec["steering_angle"]
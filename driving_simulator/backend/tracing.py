@@ -0,0 +1,151 @@
+"""
+Opt-in per-stage tracer for the driving simulator server.
+Spans (name, start, duration, track) are written into a preallocated ring
+buffer and can be exported as Chrome/Perfetto trace JSON, e.g. to see
+where one slow tick went. While disabled, `begin()` returns 0.0 and
+`end()` returns immediately, so instrumentation can stay in hot paths.
+
+Usage:
+    t = tracer.begin()
+    ...                      # work
+    tracer.end("physics", t)
+
+Open exported files in chrome://tracing or https://ui.perfetto.dev.
+"""
+import json
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+
+class TraceCapture:
+    """Copy of the spans of a time window, detached from the ring buffer."""
+
+    __slots__ = ("names", "name_ids", "starts", "durations", "tracks")
+
+    def __init__(self, names, name_ids, starts, durations, tracks):
+        self.names = names
+        self.name_ids = name_ids
+        self.starts = starts
+        self.durations = durations
+        self.tracks = tracks
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class Tracer:
+    """Ring buffer of timed spans.
+
+    Spans may be recorded from several threads; under heavy contention two
+    spans can land in the same slot, which only loses one of them.
+    """
+
+    def __init__(self, capacity=65536):
+        """Initialize a disabled tracer.
+
+        Args:
+            capacity (int): Number of spans kept; older spans are overwritten
+        """
+        self.capacity = capacity
+        self.enabled = False
+        self._names = []  # Span names by id
+        self._ids = {}  # Span name -> id
+        self._name_ids = array("H", bytes(2 * capacity))
+        self._starts = array("d", bytes(8 * capacity))
+        self._durations = array("d", bytes(8 * capacity))
+        self._tracks = array("Q", bytes(8 * capacity))
+        self._next = 0
+        self._count = 0
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def begin(self):
+        """Start time for a span, or 0.0 while disabled."""
+        return time.perf_counter() if self.enabled else 0.0
+
+    def end(self, name, start, track=None):
+        """Record the span `name` that started at `start` (from begin()).
+
+        Args:
+            name (str): Stage name
+            start (float): Value returned by begin()
+            track (int): Track to draw the span on (default: current thread)
+        """
+        if not start:
+            return
+        self.record(name, start, time.perf_counter() - start, track)
+
+    def record(self, name, start, duration, track=None):
+        """Record a span with explicit start and duration (seconds)."""
+        if not self.enabled:
+            return
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name_id = self._ids[name] = len(self._names)
+            self._names.append(name)
+        i = self._next
+        self._name_ids[i] = name_id
+        self._starts[i] = start
+        self._durations[i] = duration
+        self._tracks[i] = threading.get_ident() if track is None else track
+        self._next = (i + 1) % self.capacity
+        self._count += 1
+
+    def capture(self, last_seconds=None):
+        """Copy the spans of the last `last_seconds` (default: all).
+
+        Cheap enough to call on the event loop; writing the capture out is
+        done separately by write_chrome_trace.
+        """
+        # Oldest first: after wrapping, the oldest span is at _next
+        if self._count < self.capacity:
+            parts = [(0, self._next)]
+        else:
+            parts = [(self._next, self.capacity), (0, self._next)]
+        name_ids, starts, durations, tracks = (array("H"), array("d"),
+                                               array("d"), array("Q"))
+        for lo, hi in parts:
+            name_ids += self._name_ids[lo:hi]
+            starts += self._starts[lo:hi]
+            durations += self._durations[lo:hi]
+            tracks += self._tracks[lo:hi]
+
+        if last_seconds is not None and starts:
+            # Spans are stored in end order, so starts are nearly sorted
+            first = bisect_left(starts, time.perf_counter() - last_seconds)
+            name_ids, starts = name_ids[first:], starts[first:]
+            durations, tracks = durations[first:], tracks[first:]
+        return TraceCapture(list(self._names), name_ids, starts, durations,
+                            tracks)
+
+
+def write_chrome_trace(capture, path):
+    """Write a TraceCapture as Chrome trace event JSON; returns the path."""
+    pid = os.getpid()
+    thread_names = {t.ident: t.name for t in threading.enumerate()}
+    events = []
+    for track in sorted(set(capture.tracks)):
+        events.append({
+            "name": "thread_name", "ph": "M", "pid": pid, "tid": track,
+            "args": {"name": thread_names.get(track, f"client {track}")},
+        })
+    for name_id, start, duration, track in zip(
+            capture.name_ids, capture.starts, capture.durations,
+            capture.tracks):
+        events.append({
+            "name": capture.names[name_id], "ph": "X", "pid": pid,
+            "tid": track, "ts": start * 1e6, "dur": duration * 1e6,
+        })
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return path
+
+
+# Process-wide tracer; the server enables it with --trace
+tracer = Tracer()
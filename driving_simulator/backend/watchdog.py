@@ -0,0 +1,120 @@
+"""
+Event-loop watchdog for the driving simulator server.
+A background thread regularly schedules a heartbeat callback on the loop
+and compares when it was scheduled with when it ran. While a heartbeat is
+overdue by more than the threshold, the loop thread is blocked: the
+watchdog samples its stack via sys._current_frames(), logs it once per
+blocking episode and counts the offending call site.
+"""
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+from collections import Counter
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Frames from these directories are library code, not the call site we want
+_LIBRARY_PATHS = tuple({os.path.realpath(p) for p in (
+    sysconfig.get_paths()["stdlib"], sysconfig.get_paths()["purelib"],
+    sysconfig.get_paths()["platlib"])})
+
+
+def _call_site(frame):
+    """Innermost frame outside the standard library and site-packages."""
+    innermost = frame
+    while frame is not None:
+        if not os.path.realpath(frame.f_code.co_filename).startswith(_LIBRARY_PATHS):
+            break
+        frame = frame.f_back
+    frame = frame or innermost
+    return (f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} "
+            f"in {frame.f_code.co_name}")
+
+
+class LoopWatchdog:
+    """Detects and attributes event-loop stalls from a separate thread."""
+
+    def __init__(self, loop, threshold=0.1, interval=0.05, on_lag=None):
+        """Initialize the watchdog (call start() to run it).
+
+        Args:
+            loop: The asyncio event loop to watch
+            threshold (float): Lag in seconds that counts as blocked
+            interval (float): Seconds between heartbeats
+            on_lag (callable): Called on the loop with each measured lag
+        """
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval
+        self.on_lag = on_lag
+
+        self.blocks = 0  # Blocking episodes seen
+        self.max_lag = 0.0
+        self.sites = Counter()  # Call site -> blocking episodes
+
+        self._loop_thread = None
+        self._pending = None  # Scheduled time of the unanswered heartbeat
+        self._reported = False  # Current episode already logged
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start watching; must be called from the loop's thread."""
+        self._loop_thread = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def top_sites(self, n=10):
+        """Most frequent blocking call sites as (site, count) pairs."""
+        return self.sites.most_common(n)
+
+    def _beat(self, scheduled):
+        """Heartbeat callback, runs on the loop."""
+        lag = time.monotonic() - scheduled
+        if lag > self.max_lag:
+            self.max_lag = lag
+        self._pending = None
+        if self._reported:
+            logger.warning(f"Event loop unblocked after {lag * 1000:.0f} ms")
+            self._reported = False
+        if self.on_lag is not None:
+            self.on_lag(lag)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            scheduled = self._pending
+            if scheduled is None:
+                self._pending = time.monotonic()
+                try:
+                    self.loop.call_soon_threadsafe(self._beat, self._pending)
+                except RuntimeError:
+                    return  # Loop closed
+                continue
+
+            lag = time.monotonic() - scheduled
+            if lag < self.threshold or self._reported:
+                continue
+
+            # Blocked: attribute the stall to what the loop thread is running
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            site = _call_site(frame)
+            self.sites[site] += 1
+            self.blocks += 1
+            self._reported = True
+            logger.warning(
+                f"Event loop blocked for {lag * 1000:.0f} ms at {site}\n"
+                + "".join(traceback.format_stack(frame)))
@@ -2,9 +2,87 @@
  * WebSocket handler for the driving simulator
  * Updated to handle analog acceleration values
  */
+
+// Binary state frame layout, must match frame_codec.py on the backend
+const MSG_STATE_UPDATE = 1;
+const PROTOCOL_VERSION = 2;
+const STATE_FRAME_SIZE = 53;
+const GEARS = ['P', 'D', 'R', 'N'];
+const TURN_SIGNALS = ['N', 'L', 'R'];
+const SCENES = ['highway', 'parking_lot', 'intersection'];
+const INPUTS = ['manual', 'arduino'];
+
+/**
+ * Decode a binary state frame into the same shape as a JSON state_update
+ * @param {ArrayBuffer} buffer - The received frame
+ * @returns {Object|null} The decoded message, or null if not a state frame
+ */
+function decodeStateFrame(buffer) {
+  if (buffer.byteLength !== STATE_FRAME_SIZE) {
+    return null;
+  }
+  const view = new DataView(buffer);
+  if (view.getUint8(0) !== MSG_STATE_UPDATE || view.getUint8(1) !== PROTOCOL_VERSION) {
+    return null;
+  }
+  const f = (i) => view.getFloat32(6 + 4 * i, true);
+  const input = {};
+  INPUTS.forEach((source, i) => {
+    const seq = view.getUint32(45 + 4 * i, true);
+    if (seq) {
+      input[source] = seq;
+    }
+  });
+  return {
+    type: 'state_update',
+    seq: view.getUint32(2, true),
+    car: {
+      position: { x: f(0), y: f(1) },
+      speed: f(2),
+      direction: f(3),
+      steering_angle: f(4),
+      acceleration_rate: f(5),
+      deceleration_rate: f(6),
+      car_length: f(7),
+      car_width: f(8),
+      gear: GEARS[view.getUint8(42)],
+      turn_signal: TURN_SIGNALS[view.getUint8(43)]
+    },
+    scene: SCENES[view.getUint8(44)],
+    input
+  };
+}
+
+/**
+ * Rebuild the car object from the flattened fields of a delta/keyframe
+ * @param {Object} fields - Flattened state fields
+ * @returns {Object} Car state in the same shape as state_update.car
+ */
+function carFromFields(fields) {
+  const { x, y, scene, ...rest } = fields;
+  return { ...rest, position: { x, y } };
+}
+
 class SocketHandler {
-  constructor(url = 'ws://localhost:8765') {
+  /**
+   * @param {string} url - WebSocket server URL
+   * @param {string} encoding - State frame encoding: 'json', 'binary' or 'delta'
+   */
+  constructor(url = 'ws://localhost:8765', encoding = 'json') {
     this.url = url;
+    this.encoding = encoding;
+
+    // Delta protocol: reconstructed frames that may serve as baselines
+    this.deltaFrames = new Map();
+    this.lastAckedSeq = null;
+    this.ackEvery = 10; // Acknowledge every Nth delta frame
+
+    // Latency instrumentation: controls are numbered, state frames echo the
+    // newest applied input seqs, and render times are reported back for
+    // frames that first reflect an input and every Nth frame otherwise
+    this.controlSeq = 0;
+    this.lastInputKey = '';
+    this.reportEvery = 30;
     this.socket = null;
     this.isConnected = false;
     this.reconnectTimeout = null;
@@ -24,11 +102,21 @@ class SocketHandler {
   connect() {
     console.log(`Connecting to ${this.url}...`);
     this.socket = new WebSocket(this.url);
+    this.socket.binaryType = 'arraybuffer';
 
     this.socket.onopen = () => {
       console.log('WebSocket connection established');
       this.isConnected = true;
       this.reconnectAttempts = 0;
+      this.resetDeltaState();
+
+      // Ask for compact binary state frames if configured
+      if (this.encoding !== 'json') {
+        this.socket.send(JSON.stringify({
+          type: 'set_encoding',
+          encoding: this.encoding
+        }));
+      }
       
       // Request initial state from the server
       this.socket.send(JSON.stringify({
@@ -38,6 +126,13 @@ class SocketHandler {
 
     this.socket.onmessage = (event) => {
       try {
+        if (event.data instanceof ArrayBuffer) {
+          const frame = decodeStateFrame(event.data);
+          if (frame) {
+            this.handleMessage(frame);
+          }
+          return;
+        }
         const data = JSON.parse(event.data);
         this.handleMessage(data);
       } catch (e) {
@@ -99,33 +194,137 @@ class SocketHandler {
    */
   handleMessage(data) {
     if (data.type === 'state_update') {
+      const received = performance.now();
       this.onStateUpdate(data.car, data.scene);
+      this.reportRender(data, received);
+    } else if (data.type === 'state_keyframe' || data.type === 'state_delta') {
+      this.handleDeltaFrame(data);
     } else if (data.type === 'scene_changed') {
       this.onSceneChanged(data.scene);
+    } else if (data.type === 'session_joined') {
+      // Frame seqs restart per session; the next frame is a keyframe
+      this.resetDeltaState();
     }
   }
 
-  // /**
-  //  * Send control commands to the server
-  //  * @param {Object} controls - The control values to send
-  //  */
-  // sendControls(controls) {
-  //   if (!this.isConnected) {
-  //     console.warn('Cannot send controls: not connected');
-  //     return false;
-  //   }
-    
-  //   try {
-  //     this.socket.send(JSON.stringify({
-  //       type: 'manual_control',
-  //       controls: controls
-  //     }));
-  //     return true;
-  //   } catch (e) {
-  //     console.error('Error sending controls:', e);
-  //     return false;
-  //   }
-  // }
+  /**
+   * Forget delta baselines, e.g. on (re)connect or when changing sessions
+   */
+  resetDeltaState() {
+    this.deltaFrames.clear();
+    this.lastAckedSeq = null;
+  }
+
+  /**
+   * Apply a delta protocol frame and acknowledge it when due
+   * @param {Object} data - A state_keyframe or state_delta message
+   */
+  handleDeltaFrame(data) {
+    let fields;
+    if (data.type === 'state_keyframe') {
+      fields = data.fields;
+    } else {
+      const base = this.deltaFrames.get(data.base);
+      if (!base) {
+        // Lost our baseline: ask the server for a fresh keyframe
+        this.socket.send(JSON.stringify({ type: 'request_state' }));
+        return;
+      }
+      fields = { ...base, ...data.fields };
+    }
+
+    this.deltaFrames.set(data.seq, fields);
+    const received = performance.now();
+    this.onStateUpdate(carFromFields(fields), fields.scene);
+    this.reportRender(data, received);
+
+    if (data.type === 'state_keyframe' || data.seq % this.ackEvery === 0) {
+      this.socket.send(JSON.stringify({ type: 'ack', seq: data.seq }));
+      this.lastAckedSeq = data.seq;
+      // The server never goes back to an older baseline, so forget them
+      for (const seq of this.deltaFrames.keys()) {
+        if (seq < this.lastAckedSeq) {
+          this.deltaFrames.delete(seq);
+        }
+      }
+    }
+  }
+
+  /**
+   * Report when a state frame was rendered, for the server's latency stats
+   * @param {Object} data - The state message that was just handed to the UI
+   * @param {number} received - performance.now() when it arrived
+   */
+  reportRender(data, received) {
+    const inputKey = JSON.stringify(data.input || {});
+    const newInput = inputKey !== this.lastInputKey;
+    this.lastInputKey = inputKey;
+    if (!newInput && data.seq % this.reportEvery !== 0) {
+      return;
+    }
+    // Runs just before the browser paints the frame with this state
+    requestAnimationFrame(() => {
+      if (!this.isConnected) {
+        return;
+      }
+      this.socket.send(JSON.stringify({
+        type: 'render_report',
+        seq: data.seq,
+        received: received,
+        rendered: performance.now()
+      }));
+    });
+  }
+
+  /**
+   * Send control commands to the server
+   * @param {Object} controls - The control values to send
+   */
+  sendControls(controls) {
+    if (!this.isConnected) {
+      console.warn('Cannot send controls: not connected');
+      return false;
+    }
+
+    try {
+      // Numbered so state frames can echo the newest one applied
+      this.controlSeq++;
+      this.socket.send(JSON.stringify({
+        type: 'manual_control',
+        seq: this.controlSeq,
+        t: performance.now(),
+        controls: controls
+      }));
+      return true;
+    } catch (e) {
+      console.error('Error sending controls:', e);
+      return false;
+    }
+  }
+
+  /**
+   * Join a simulation session; each session has its own car and scene
+   * @param {string} sessionId - Session id (letters, digits, '_' or '-')
+   */
+  joinSession(sessionId) {
+    if (!this.isConnected) {
+      console.warn('Cannot join session: not connected');
+      return false;
+    }
+
+    try {
+      this.socket.send(JSON.stringify({
+        type: 'join_session',
+        session: sessionId
+      }));
+      // Baselines of the old session must not be acked or decoded against
+      this.resetDeltaState();
+      return true;
+    } catch (e) {
+      console.error('Error joining session:', e);
+      return false;
+    }
+  }
 
   /**
    * Set the current scene
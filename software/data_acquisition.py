@@ -3,7 +3,9 @@
 import os
 import time
 import argparse
-from main import main_loop
+from main import main_loop, get_sink, new_features
+from pipeline import ScenarioPipeline
+from driving_simulator.backend.controls import SAFE_ARDUINO_DATA
 from driving_simulator.backend.pyserial import ArduinoReader
 
 # —— command-line flags —— #
@@ -13,8 +15,14 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
     "--scenario",
     choices=["highway", "intersection", "parking"],
-    default="highway",
-    help="Choose scenario for real or test mode"
+    nargs="+",
+    default=["highway"],
+    help="Scenario(s) for real or test mode; several run in parallel on the same input"
+)
+parser.add_argument(
+    "--port",
+    default="/dev/ttyACM0",
+    help="Arduino serial port (or the pty printed by arduino_emulator.py)"
 )
 parser.add_argument(
     "--test",
@@ -22,7 +30,7 @@ parser.add_argument(
     help="Run in test mode with canned sample data"
 )
 args = parser.parse_args()
-SCENARIO = args.scenario
+SCENARIOS = args.scenario
 
 # —— sample data generator —— #
 
@@ -95,78 +103,80 @@ def get_test_samples(scenario):
 # —— real-time stubs —— #
 
 
-def get_speed(rpm: float) -> float:
-    # dummy conversion
-    return speed
-
+def get_speed(rpm: float = 0.0) -> float:
+    # dummy conversion; no speed sensor yet
+    return 0.0
 
-_prev_angle = None
 
-
-def detect_steering_change(curr_angle: float, threshold: float = 5.0) -> bool:
-    global _prev_angle
-    if _prev_angle is None:
-        _prev_angle = curr_angle
-        return False
-    changed = abs(curr_angle - _prev_angle) > threshold
-    _prev_angle = curr_angle
-    return changed
+def detect_steering_change(data: dict, threshold: float = 5.0) -> bool:
+    # steering_delta is added by the session's FeatureState
+    return abs(data.get("steering_delta", 0.0)) > threshold
 
 
 def get_front_distance() -> float:
     return float('inf')
 
 
+def frame_reader(ard: ArduinoReader):
+    """
+    Return acquire(out) for the pipeline: fills the reused record `out`
+    from the newest Arduino frame and returns the frame's receive time.
+    """
+    frame = {}
+
+    def acquire(out: dict):
+        received = ard.read_into(frame)
+        gear = frame["gear"].upper()
+        out["throttle"] = frame["acc"]
+        out["brake"] = frame["dec"]
+        out["steering_angle"] = frame["steeringAngle"]
+        out["turn_signal"] = frame["turnSignal"] != "N"
+        out["handbrake"] = frame["handbreak"]
+        out["speed"] = get_speed()
+        out["front_distance"] = get_front_distance()
+        out["safe_distance_threshold"] = 10.0
+        out["mode"] = "reverse" if gear == "R" else "forward"
+        out["corner_distances"] = ()          # fill for parking
+        out["distance_sum_threshold"] = 12.0  # set for parking
+        return received
+
+    return acquire
+
+
+def extract_features(data: dict, features) -> None:
+    features.update(data, data["received"])
+    data["steering_change"] = detect_steering_change(data)
+
+
 if __name__ == "__main__":
     # ensure output folder exists
     os.makedirs("./error_data", exist_ok=True)
 
     if args.test:
-        print(f"*** RUNNING IN TEST MODE ({SCENARIO}) ***")
-        for idx, sample in enumerate(get_test_samples(SCENARIO), start=1):
-            # mark this run as test
-            sample["test_mode"] = True
-            print(f"\nTest sample #{idx}: {sample}")
-            main_loop(sample)
+        for scenario in SCENARIOS:
+            print(f"*** RUNNING IN TEST MODE ({scenario}) ***")
+            for idx, sample in enumerate(get_test_samples(scenario), start=1):
+                # mark this run as test
+                sample["test_mode"] = True
+                print(f"\nTest sample #{idx}: {sample}")
+                main_loop(sample)
         print("\nTest mode complete. CSV files written to ./error_data/")
     else:
-        print(f"Starting real-time acquisition in '{SCENARIO}' mode.")
-        ard = ArduinoReader(port="/dev/ttyACM0", baud=115200)
+        print(f"Starting real-time acquisition in {', '.join(SCENARIOS)} mode.")
+        ard = ArduinoReader(port=args.port, baud=115200,
+                            safe_frame=SAFE_ARDUINO_DATA)
+        # Every new frame flows acquire → features → detection → sink,
+        # with one feature/detection lane per scenario
+        pipeline = ScenarioPipeline(ard.wait_frame, frame_reader(ard), SCENARIOS,
+                                    new_features, extract_features, main_loop)
+        pipeline.start()
         try:
             while True:
-                # read from Arduino
-                throttle = ard.get_acceleration()
-                brake = ard.get_deceleration()
-
-                speed = get_speed()
-                handbrake = ard.get_handbreak()
-                gear = ard.get_gear().upper()
-                mode = "reverse" if gear == "R" else "forward"
-
-                angle = ard.get_angle()
-                steering_change = detect_steering_change(angle)
-                turn_signal = ard.get_turn_signal()
-                front_dist = get_front_distance()
-
-                data = {
-                    "scenario": SCENARIO,
-                    "throttle": throttle,
-                    "brake": brake,
-                    "steering_angle": angle,
-                    "turn_signal": turn_signal,
-                    "handbrake": handbrake,
-                    "speed": speed,
-                    "front_distance": front_dist,
-                    "safe_distance_threshold": 10.0,
-                    "steering_change": steering_change,
-                    "mode": mode,
-                    "corner_distances": [],             # fill for parking
-                    "distance_sum_threshold": 12.0     # set for parking
-
-                }
-
-                main_loop(data)
-                time.sleep(0.5)
+                time.sleep(10)
+                print("pipeline:", pipeline.stats())
+                print("arduino:", ard.stats())
 
         finally:
+            pipeline.stop()
             ard.close()
+            get_sink().close()   # flush queued error rows
@@ -0,0 +1,178 @@
+# event_sink.py
+
+"""
+Non-blocking sink for detected driving events.
+
+This module provides:
+  • EventGate          → per-event-type cooldown, suppresses repeated alerts
+  • BufferedCsvWriter  → keeps CSV files open, batches rows and flushes them
+                         from a background thread, rotates large files
+  • EventSink          → gate + writer; what main_loop() reports events to
+
+Nothing here sleeps or touches the disk on the caller's thread, so data
+acquisition keeps sampling at full rate while an alert is being handled.
+"""
+
+import atexit
+import csv
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class EventGate:
+    """
+    Cooldown state machine per (scenario, event) key.
+
+    An event is let through when it was not let through during the last
+    `cooldown` seconds; everything in between is counted as suppressed.
+    A condition that stays active is therefore re-announced at most once
+    per cooldown, instead of pausing the caller.
+    """
+
+    def __init__(self, cooldown: float = 10.0, cooldowns: Optional[Dict[str, float]] = None,
+                 clock=time.monotonic):
+        self.cooldown = cooldown
+        self.cooldowns = cooldowns or {}     # per-event overrides
+        self.clock = clock
+        self._last: Dict[tuple, float] = {}  # key -> time it was last let through
+        self.suppressed: Dict[tuple, int] = {}
+
+    def allow(self, scenario: str, event: str, now: Optional[float] = None) -> bool:
+        now = self.clock() if now is None else now
+        key = (scenario, event)
+        last = self._last.get(key)
+        if last is not None and now - last < self.cooldowns.get(event, self.cooldown):
+            self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            return False
+        self._last[key] = now
+        return True
+
+    def filter(self, scenario: str, events: Iterable[str],
+               now: Optional[float] = None) -> List[str]:
+        """Return the events of one sample that should be reported."""
+        now = self.clock() if now is None else now
+        return [ev for ev in events if self.allow(scenario, ev, now)]
+
+
+class BufferedCsvWriter:
+    """
+    Appends CSV rows through an in-memory buffer.
+
+    write() only queues the row. A background thread writes the batch when
+    `flush_rows` rows are pending or every `flush_interval` seconds. File
+    handles stay open between batches, and a file larger than `max_bytes`
+    is rotated to <name>.1.csv, <name>.2.csv, ... (keeping `backups`).
+    """
+
+    def __init__(self, header: List[str], flush_interval: float = 1.0,
+                 flush_rows: int = 64, max_bytes: int = 5 * 1024 * 1024,
+                 backups: int = 5):
+        self.header = header
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+        self._pending: List[tuple] = []      # (filename, row)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._files = {}                     # filename -> open file
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="csv-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, filename: str, row: List):
+        """Queue one row for `filename`; never blocks on disk."""
+        with self._lock:
+            self._pending.append((filename, row))
+            full = len(self._pending) >= self.flush_rows
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all pending rows now (on the caller's thread)."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        touched = set()
+        for filename, row in batch:
+            f = self._open(filename)
+            csv.writer(f).writerow(row)
+            touched.add(filename)
+        for filename in touched:
+            f = self._files[filename]
+            f.flush()
+            if self.max_bytes and f.tell() >= self.max_bytes:
+                self._rotate(filename)
+
+    def close(self):
+        """Stop the background thread, flush and close every file."""
+        if not self._running:
+            return
+        self._running = False
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+    # ---------- internals ----------
+    def _run(self):
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                print("event log write failed:", e)
+
+    def _open(self, filename: str):
+        f = self._files.get(filename)
+        if f is None:
+            os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+            f = open(filename, mode="a", newline="", encoding="utf-8")
+            if f.tell() == 0:
+                csv.writer(f).writerow(self.header)
+            self._files[filename] = f
+        return f
+
+    def _rotate(self, filename: str):
+        self._files.pop(filename).close()
+        stem, ext = os.path.splitext(filename)
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{stem}.{i}{ext}"
+            if os.path.exists(src):
+                os.replace(src, f"{stem}.{i + 1}{ext}")
+        if self.backups:
+            os.replace(filename, f"{stem}.1{ext}")
+        else:
+            os.remove(filename)
+
+
+class EventSink:
+    """Cooldown-gated, buffered destination for detected events."""
+
+    def __init__(self, writer: BufferedCsvWriter, gate: Optional[EventGate] = None):
+        self.writer = writer
+        self.gate = gate or EventGate()
+
+    def report(self, scenario: str, events: Iterable[str], data: Dict, make_row) -> List[str]:
+        """
+        Log the events of one sample that pass the cooldown.
+
+        make_row(scenario, event, data) → (filename, row)
+        Returns the events that were logged.
+        """
+        passed = self.gate.filter(scenario, events)
+        for ev in passed:
+            filename, row = make_row(scenario, ev, data)
+            self.writer.write(filename, row)
+        return passed
+
+    def close(self):
+        self.writer.close()
@@ -7,36 +7,67 @@ This module provides:
   • check_highway(data)      → list of highway events
   • check_intersection(data) → list of intersection events
   • check_parking(data)      → list of parking events
-  • write_error(...)         → appends one event to <scenario>_errors.csv
-  • main_loop(data)          → dispatches data to the right checker and logs any events
+  • write_error(...)         → queues one event for <scenario>_errors.csv
+  • new_features()           → per-session streaming features (steering rate,
+                               jerk, time headway, ...) for main_loop
+  • main_loop(data, features) → dispatches data to the right checker and logs any events
 
 Import and call main_loop(data) from your data_acquisition script.
+The checks are declared in driving_simulator/backend/rules.json (ruleset
+"acquisition") and compiled by the shared rule engine; edit the file to
+change thresholds without restarting.
+Events go through an EventSink (event_sink.py): repeats of the same event
+within ALERT_COOLDOWN seconds are suppressed and rows are written by a
+background thread, so main_loop never blocks acquisition.
 """
 
-import csv
 import datetime
-from typing import Dict, List
-from time import sleep
+from typing import Dict, List, Tuple
+
+from driving_simulator.backend.features import FeatureState
+from driving_simulator.backend.rules import RuleEngine
+from event_sink import BufferedCsvWriter, EventGate, EventSink
+
+ALERT_COOLDOWN = 10.0   # seconds before the same event is reported again
+
+ERROR_HEADER = [
+    "timestamp", "scenario", "event","prompt",
+    "throttle", "brake", "steering_angle",
+    "turn_signal", "handbrake",
+    "speed", "front_distance", "safe_distance_threshold",
+    "steering_change", "mode",
+    # parking-only fields:
+    "corner_distances", "distance_sum_threshold"
+]
+
+_sink = None
+_rules = None
+
+
+def get_sink() -> EventSink:
+    """Return the process-wide event sink, creating it on first use."""
+    global _sink
+    if _sink is None:
+        _sink = EventSink(BufferedCsvWriter(ERROR_HEADER), EventGate(ALERT_COOLDOWN))
+    return _sink
+
+def get_rules() -> RuleEngine:
+    """The acquisition ruleset from rules.json, loaded on first use."""
+    global _rules
+    if _rules is None:
+        _rules = RuleEngine("acquisition")
+    return _rules
+
+def new_features() -> FeatureState:
+    """Fresh feature state for one acquisition session ("features" in rules.json)."""
+    specs = get_rules().config.get("features", {}).get("acquisition", [])
+    return FeatureState(specs)
 
 def check_highway(data: Dict) -> List[str]:
-    events = []
-    if data.get("speed", 0) > 100:
-        events.append("overspeed")
-    if data.get("front_distance", float('inf')) < data.get("safe_distance_threshold", 0):
-        events.append("unsafe_distance")
-    if data.get("steering_change") and not data.get("turn_signal"):
-        events.append("lane_change_no_signal")
-    return events
+    return list(get_rules().evaluate(data, "highway"))
 
 def check_intersection(data: Dict) -> List[str]:
-    events = []
-    if data.get("steering_change") and not data.get("turn_signal"):
-        events.append("missing_signal")
-    if data.get("speed", 0) > 50:
-        events.append("overspeed")
-    if data.get("throttle", 0) > 70:
-        events.append("harsh_acceleration")
-    return events
+    return list(get_rules().evaluate(data, "intersection"))
 
 def prompt_for_event(event: str) -> str:
     """
@@ -58,95 +89,70 @@ def prompt_for_event(event: str) -> str:
         "poor_reverse_control":
             "Your steering angle is too sharp while reversing. Make gentle adjustments to keep the vehicle under control.",
         "distance_sum_exceeded":
-            "The vehicle is not centered in the parking bay—the combined corner distances are too large. Realign and park within the lines."
+            "The vehicle is not centered in the parking bay—the combined corner distances are too large. Realign and park within the lines.",
+        "tailgating":
+            "You have been less than one second behind the vehicle ahead for a while. Drop back to a gap of at least two seconds.",
+        "steering_oscillation":
+            "Your steering keeps swinging from side to side. Hold the wheel steady and make small, smooth corrections.",
+        "harsh_jerk":
+            "Your speed is changing abruptly. Press and release the pedals progressively for a smoother ride."
     }
     return prompts.get(event, "Unknown event.")
 
 
 def check_parking(data: Dict) -> List[str]:
-    events = []
+    return list(get_rules().evaluate(data, "parking"))
 
-    # 1) Handbrake still engaged
-    if data.get("handbrake", False):
-        events.append("handbrake_not_released")
-
-    # 2) In reverse gear, too-sharp steering (> 40°)
-    if data.get("mode") == "reverse" and abs(data.get("steering_angle", 0)) > 40:
-        events.append("poor_reverse_control")
-
-    # 3) Sum of four corner-distance measurements is too large
-    corners   = data.get("corner_distances", [])
-    threshold = data.get("distance_sum_threshold", 0.0)
-    if len(corners) == 4 and sum(corners) > threshold:
-        events.append("distance_sum_exceeded")
-
-    return events
-
-def write_error(scenario: str, event: str, data: Dict):
+def error_row(scenario: str, event: str, data: Dict) -> Tuple[str, List]:
     """
-    Append one error record to ./error_data/<scenario>_errors.csv
-    or to ./error_data/<scenario>_errors_test.csv if data['test_mode'] is True.
+    Build the CSV row for one event and the file it belongs to:
+    ./error_data/<scenario>_errors.csv, or <scenario>_errors_test.csv
+    if data['test_mode'] is True.
     """
     is_test = data.get("test_mode", False)
     suffix = "_test" if is_test else ""
     filename = f"./error_data/{scenario}_errors{suffix}.csv"
 
-    header = [
-        "timestamp", "scenario", "event","prompt",
-        "throttle", "brake", "steering_angle",
-        "turn_signal", "handbrake",
-        "speed", "front_distance", "safe_distance_threshold",
-        "steering_change", "mode",
-        # parking-only fields:
-        "corner_distances", "distance_sum_threshold"
+    return filename, [
+        datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        scenario,
+        event,
+        prompt_for_event(event),
+        data.get("throttle"),
+        data.get("brake"),
+        data.get("steering_angle"),
+        data.get("turn_signal"),
+        data.get("handbrake"),
+        data.get("speed"),
+        data.get("front_distance"),
+        data.get("safe_distance_threshold"),
+        data.get("steering_change"),
+        data.get("mode"),
+        data.get("corner_distances"),
+        data.get("distance_sum_threshold"),
     ]
 
-    # create with header if new
-    try:
-        with open(filename, mode="x", newline="", encoding="utf-8") as f:
-            csv.writer(f).writerow(header)
-    except FileExistsError:
-        pass
-
-    # append the row
-    with open(filename, mode="a", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow([
-            datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            scenario,
-            event,
-            prompt_for_event(event),
-            data.get("throttle"),
-            data.get("brake"),
-            data.get("steering_angle"),
-            data.get("turn_signal"),
-            data.get("handbrake"),
-            data.get("speed"),
-            data.get("front_distance"),
-            data.get("safe_distance_threshold"),
-            data.get("steering_change"),
-            data.get("mode"),
-            data.get("corner_distances"),
-            data.get("distance_sum_threshold"),
-        ])
-    print("error detected!", event, "\nsleep for 10 seconds")
-    sleep(10)
-    print("resuming")
-
-def main_loop(data: Dict):
+def write_error(scenario: str, event: str, data: Dict):
+    """
+    Queue one error record (no cooldown); it is written to disk by the
+    sink's background writer. Returns immediately.
+    """
+    get_sink().writer.write(*error_row(scenario, event, data))
+    print("error detected!", event)
+
+def main_loop(data: Dict, features: FeatureState = None):
     """
     Choose the appropriate checker based on data["scenario"],
     collect any events, and log each one.
+
+    features: the session's FeatureState, already updated with `data`;
+    needed by sustained ("for_ms") rules. Without it they fire at once.
     """
     scenario = data.get("scenario", "")
+    # Only the rules of this scenario run; unknown scenarios have none
+    state = features.rule_state if features is not None else None
+    events = get_rules().evaluate(data, scenario, state)
 
-    if scenario == "highway":
-        events = check_highway(data)
-    elif scenario == "intersection":
-        events = check_intersection(data)
-    elif scenario == "parking":
-        events = check_parking(data)
-    else:
-        events = []
-
-    for ev in events:
-        write_error(scenario, ev, data)
+    # Repeats within the cooldown are dropped here instead of sleeping
+    for ev in get_sink().report(scenario, events, data, error_row):
+        print("error detected!", ev)
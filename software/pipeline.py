@@ -0,0 +1,229 @@
+# pipeline.py
+
+"""
+Staged, frame-driven acquisition pipeline.
+
+This module provides:
+  • Inbox            → bounded drop-oldest queue between two stages
+  • Stage            → worker thread: inbox → work(record, out) → next stages
+  • AcquireStage     → head stage, woken by every new frame of the source
+  • ScenarioPipeline → acquire → features → detection → sink, with one
+                       feature/detection lane per scenario on the same input
+
+Records are dicts reused in place: every stage owns a small ring of output
+records, sized so a record is never overwritten while it is still queued
+or being processed downstream. The steady state allocates no per-sample
+dicts. Queues drop their oldest record when full, so a slow stage makes
+detection skip samples instead of falling further and further behind.
+The head stage likewise acquires the newest frame when several arrived
+since its last run; every skipped sample is counted in stats().
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from driving_simulator.backend.metrics import LATENCY_BUCKETS, Histogram
+
+
+class Inbox:
+    """Bounded FIFO; put() never blocks and drops the oldest record when full."""
+
+    def __init__(self, maxsize: int = 8):
+        self.maxsize = maxsize
+        self._items = deque()
+        self._ready = threading.Condition()
+        self.dropped = 0
+
+    def put(self, record):
+        with self._ready:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(record)
+            self._ready.notify()
+
+    def get(self, timeout: Optional[float] = None):
+        """Next record, or None after `timeout` seconds without one."""
+        with self._ready:
+            if not self._items and not self._ready.wait(timeout):
+                return None
+            return self._items.popleft() if self._items else None
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Stage:
+    """
+    One pipeline stage running on its own thread.
+
+    work(record, out) fills the reused dict `out` from `record` and returns
+    True to pass `out` on to the next stages (a terminal stage just returns
+    False). The input record must not be kept after work() returns.
+    """
+
+    def __init__(self, name: str, work: Callable[[Dict, Dict], bool], maxsize: int = 8):
+        self.name = name
+        self.work = work
+        self.inbox = Inbox(maxsize)
+        self.outputs: List["Stage"] = []
+        self.processed = 0
+        self._ring: List[Dict] = []
+        self._next = 0
+        self._running = False
+        self._thread = None
+
+    def connect(self, stage: "Stage") -> "Stage":
+        """Send this stage's output to `stage` too; returns `stage`."""
+        self.outputs.append(stage)
+        return stage
+
+    def start(self):
+        # A record can sit in every slot of the largest downstream inbox, be
+        # processed by that stage and be written here at the same time
+        depth = max((s.inbox.maxsize for s in self.outputs), default=0)
+        self._ring = [{} for _ in range(depth + 2)]
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"stage-{self.name}",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+
+    def _out(self) -> Dict:
+        out = self._ring[self._next]
+        self._next = (self._next + 1) % len(self._ring)
+        return out
+
+    @property
+    def dropped(self) -> int:
+        """Records this stage never processed."""
+        return self.inbox.dropped
+
+    def _emit(self, out: Dict):
+        for stage in self.outputs:
+            stage.inbox.put(out)
+
+    def _run(self):
+        while self._running:
+            record = self.inbox.get(timeout=0.1)
+            if record is None:
+                continue
+            out = self._out()
+            if self.work(record, out):
+                self._emit(out)
+            self.processed += 1
+
+
+class AcquireStage(Stage):
+    """
+    Head stage: runs once per new frame instead of reading an inbox.
+
+    wait_frame(seq, timeout) blocks until a frame newer than `seq` exists
+    and returns the newest sequence number (see ArduinoReader.wait_frame);
+    work(None, out) then reads that frame into `out`. Frames that arrived
+    in between are skipped and counted in `dropped`.
+    """
+
+    def __init__(self, wait_frame: Callable, work: Callable[[Dict, Dict], bool],
+                 name: str = "acquire"):
+        super().__init__(name, work, maxsize=1)
+        self.wait_frame = wait_frame
+        self.seq = 0
+        self.skipped = 0  # Frames superseded before they were acquired
+
+    def _run(self):
+        while self._running:
+            seq = self.wait_frame(self.seq, 0.1)
+            if seq == self.seq:
+                continue  # Timed out
+            self.skipped += seq - self.seq - 1
+            self.seq = seq
+            out = self._out()
+            if self.work(None, out):
+                self._emit(out)
+            self.processed += 1
+
+    @property
+    def dropped(self) -> int:
+        return self.skipped
+
+
+class ScenarioPipeline:
+    """
+    acquire → features → detection → sink for one or more scenarios.
+
+    Every scenario gets its own feature and detection stages (and its own
+    FeatureState), all fed by the same acquired frames.
+    """
+
+    def __init__(self, wait_frame: Callable, acquire: Callable[[Dict], Optional[float]],
+                 scenarios: List[str], new_features: Callable,
+                 extract: Callable[[Dict, object], None], detect: Callable[[Dict, object], None],
+                 maxsize: int = 8):
+        """
+        wait_frame(seq, timeout) → newest frame sequence number
+        acquire(out)             → fills `out` from the newest frame; returns
+                                   its receive time (time.monotonic()) or None
+        new_features()           → a fresh FeatureState for one scenario
+        extract(record, features)→ adds features to `record` in place
+        detect(record, features) → runs the rules and reports events
+        """
+        self.latency = Histogram("acquisition_latency_seconds",
+                                 "Frame receive to detection done", LATENCY_BUCKETS)
+
+        def acquire_work(_, out):
+            out["received"] = acquire(out) or time.monotonic()
+            return True
+
+        self.head = AcquireStage(wait_frame, acquire_work)
+        self.stages: List[Stage] = [self.head]
+        for scenario in scenarios:
+            features = new_features()
+            feature_stage = self.head.connect(Stage(
+                f"features-{scenario}", self._feature_work(scenario, features, extract), maxsize))
+            detect_stage = feature_stage.connect(Stage(
+                f"detect-{scenario}", self._detect_work(features, detect), maxsize))
+            self.stages += [feature_stage, detect_stage]
+
+    @staticmethod
+    def _feature_work(scenario, features, extract):
+        def work(record, out):
+            out.update(record)
+            out["scenario"] = scenario
+            extract(out, features)
+            return True
+        return work
+
+    def _detect_work(self, features, detect):
+        observe = self.latency.observe
+
+        def work(record, out):
+            detect(record, features)
+            observe(time.monotonic() - record["received"])
+            return False
+        return work
+
+    def start(self):
+        # Downstream first, so no stage emits into one that is not running
+        for stage in reversed(self.stages):
+            stage.start()
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def stats(self) -> Dict:
+        """Per-stage processed/dropped/backlog counts and latency percentiles."""
+        result = {s.name: {"processed": s.processed, "dropped": s.dropped,
+                           "backlog": len(s.inbox)} for s in self.stages}
+        result["latency_ms"] = {
+            q: (None if v is None else round(v * 1000, 3))
+            for q, v in (("p50", self.latency.quantile(0.5)),
+                         ("p99", self.latency.quantile(0.99)))}
+        return result